@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# Concurrency limit and queue-time SLO (ms) per shared inference stage.
+STAGE_LIMITS = {
+    "asr": (int(os.getenv("ADMIT_ASR_CONCURRENCY", "2")), float(os.getenv("ADMIT_ASR_SLO_MS", "300"))),
+    "llm": (int(os.getenv("ADMIT_LLM_CONCURRENCY", "1")), float(os.getenv("ADMIT_LLM_SLO_MS", "1500"))),
+    "tts": (int(os.getenv("ADMIT_TTS_CONCURRENCY", "1")), float(os.getenv("ADMIT_TTS_SLO_MS", "1500"))),
+}
+MAX_WS_SESSIONS = int(os.getenv("MAX_WS_SESSIONS", "0"))  # 0 = bounded by SLOs only
+ANALYSIS_QUEUE_SLO_S = float(os.getenv("ANALYSIS_QUEUE_SLO_S", "900"))
+ANALYSIS_DEFAULT_JOB_S = 120.0  # assumed job time until real timings exist
+SERVICE_EWMA_ALPHA = 0.1
+
+
+class StageLimiter:
+    """
+    Concurrency limit for one shared model, with an EWMA of its service time
+    so the wait a new request would see can be predicted from the queue.
+    """
+
+    def __init__(self, name: str, limit: int, slo_ms: float):
+        self.name = name
+        self.limit = limit
+        self.slo_ms = slo_ms
+        self._slots = asyncio.Semaphore(limit)
+        self.in_use = 0
+        self.waiting = 0
+        self.service_ms = 0.0
+        self.completed = 0
+        self.slo_misses = 0
+
+    def predicted_wait_ms(self, extra: int = 0) -> float:
+        """Expected queueing delay for a request arriving now, behind `extra` more requests."""
+        excess = self.in_use + self.waiting + extra - self.limit + 1
+        if excess <= 0:
+            return 0.0
+        return excess * self.service_ms / self.limit
+
+    @asynccontextmanager
+    async def slot(self):
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        if (started - queued_at) * 1000 > self.slo_ms:
+            self.slo_misses += 1
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.service_ms = (
+                elapsed_ms if not self.completed
+                else self.service_ms + SERVICE_EWMA_ALPHA * (elapsed_ms - self.service_ms)
+            )
+            self.completed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "service_ms": round(self.service_ms, 1),
+            "predicted_wait_ms": round(self.predicted_wait_ms(), 1),
+            "slo_ms": self.slo_ms,
+            "slo_misses": self.slo_misses,
+        }
+
+
+class AdmissionController:
+    """
+    Guards the shared Whisper/LLM/TTS stages and the analysis queue.
+
+    Realtime stages are entered with `async with admission.stage("asr")`.
+    New work is admitted only while the predicted queueing delay stays within
+    each stage's SLO; otherwise callers get a reason and a retry-after hint.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float]] = STAGE_LIMITS, max_sessions: int = MAX_WS_SESSIONS):
+        self.stages = {name: StageLimiter(name, limit, slo) for name, (limit, slo) in limits.items()}
+        self.max_sessions = max_sessions
+        self.sessions = 0
+        self.rejected_sessions = 0
+        self.rejected_analyses = 0
+
+    def stage(self, name: str):
+        return self.stages[name].slot()
+
+    def _session_verdict(self) -> Tuple[bool, float, Optional[str]]:
+        if self.max_sessions and self.sessions >= self.max_sessions:
+            return False, 5.0, f"Session limit of {self.max_sessions} reached"
+        for limiter in self.stages.values():
+            # A new session adds roughly one more request to every stage.
+            wait_ms = limiter.predicted_wait_ms(extra=1)
+            if wait_ms > limiter.slo_ms:
+                retry_after = max(1.0, (wait_ms - limiter.slo_ms) / 1000)
+                return False, retry_after, (
+                    f"{limiter.name} stage overloaded: predicted wait {wait_ms:.0f} ms "
+                    f"exceeds {limiter.slo_ms:.0f} ms"
+                )
+        return True, 0.0, None
+
+    def admit_session(self) -> Tuple[bool, float, Optional[str]]:
+        """(admitted, retry_after_s, reason). Call `release_session` when an admitted one ends."""
+        admitted, retry_after, reason = self._session_verdict()
+        if admitted:
+            self.sessions += 1
+        else:
+            self.rejected_sessions += 1
+            logger.warning("Rejecting new session: %s", reason)
+        return admitted, retry_after, reason
+
+    def release_session(self):
+        self.sessions = max(0, self.sessions - 1)
+
+    @staticmethod
+    def predicted_analysis_wait_s(queue_metrics: Dict[str, Any]) -> float:
+        job_s = sum(queue_metrics.get("mean_stage_timings", {}).values()) or ANALYSIS_DEFAULT_JOB_S
+        ahead = queue_metrics["queue_depth"] + queue_metrics["running"]
+        return ahead * job_s / max(1, queue_metrics["workers"])
+
+    def admit_analysis(self, queue_metrics: Dict[str, Any]) -> Tuple[bool, float, Optional[str]]:
+        wait_s = self.predicted_analysis_wait_s(queue_metrics)
+        if wait_s <= ANALYSIS_QUEUE_SLO_S:
+            return True, 0.0, None
+        self.rejected_analyses += 1
+        reason = f"Analysis queue full: predicted wait {wait_s:.0f}s exceeds {ANALYSIS_QUEUE_SLO_S:.0f}s"
+        logger.warning("Rejecting call analysis: %s", reason)
+        return False, max(1.0, wait_s - ANALYSIS_QUEUE_SLO_S), reason
+
+    def capacity(self, queue_metrics: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        accepting_sessions, retry_after, reason = self._session_verdict()
+        capacity = {
+            "accepting_sessions": accepting_sessions,
+            "retry_after_s": round(retry_after, 1),
+            "reason": reason,
+            "sessions": self.sessions,
+            "max_sessions": self.max_sessions or None,
+            "rejected_sessions": self.rejected_sessions,
+            "stages": {name: limiter.snapshot() for name, limiter in self.stages.items()},
+        }
+        if queue_metrics is not None:
+            wait_s = self.predicted_analysis_wait_s(queue_metrics)
+            capacity["analysis"] = {
+                "accepting_jobs": wait_s <= ANALYSIS_QUEUE_SLO_S,
+                "predicted_wait_s": round(wait_s, 1),
+                "slo_s": ANALYSIS_QUEUE_SLO_S,
+                "queue_depth": queue_metrics["queue_depth"],
+                "running": queue_metrics["running"],
+                "rejected_jobs": self.rejected_analyses,
+            }
+        return capacity
+
+
+admission = AdmissionController()
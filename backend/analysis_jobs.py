@@ -0,0 +1,380 @@
+import os
+import json
+import hashlib
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+
+from config import AsyncSessionLocal
+from database.queries import save_call_analysis
+from metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "1"))
+ANALYSIS_JOBS_DB = os.getenv("ANALYSIS_JOBS_DB", "analysis_jobs.db")
+ANALYSIS_SPOOL_DIR = os.getenv("ANALYSIS_SPOOL_DIR", "calls_spool")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+STAGE_TIMINGS_WINDOW = 50  # completed jobs averaged into mean_stage_timings
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class AnalysisJobStore:
+    """SQLite-backed job table, so queued and running jobs survive a restart."""
+
+    def __init__(self, path: str = ANALYSIS_JOBS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_jobs (
+                job_id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                agent_id TEXT NOT NULL,
+                call_id TEXT NOT NULL,
+                recording_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                result TEXT,
+                stage_timings TEXT,
+                saved_id INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_analysis_jobs_status ON analysis_jobs (status)"
+        )
+        columns = {r["name"] for r in self._conn.execute("PRAGMA table_info(analysis_jobs)")}
+        if "stage_memory" not in columns:
+            self._conn.execute("ALTER TABLE analysis_jobs ADD COLUMN stage_memory TEXT")
+        try:
+            # One live job per call; `create` relies on it to turn a race into a lookup.
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_analysis_jobs_active_call "
+                f"ON analysis_jobs (agent_id, call_id) WHERE status != '{JOB_FAILED}'"
+            )
+        except sqlite3.IntegrityError:
+            logger.warning("Duplicate active analysis jobs in %s; unique call index not created", path)
+        self._conn.commit()
+
+        # Kept in memory and moved on each state change, so metrics never touch SQLite.
+        self._counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for r in self._conn.execute("SELECT status, COUNT(*) AS n FROM analysis_jobs GROUP BY status"):
+            self._counts[r["status"]] = r["n"]
+        rows = self._conn.execute(
+            "SELECT stage_timings FROM analysis_jobs WHERE status = ? ORDER BY finished_at DESC LIMIT ?",
+            (JOB_DONE, STAGE_TIMINGS_WINDOW),
+        ).fetchall()
+        self._recent_timings: deque = deque(
+            (json.loads(r["stage_timings"] or "{}") for r in reversed(rows)), maxlen=STAGE_TIMINGS_WINDOW
+        )
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cur
+
+    def _transition(self, job_id: str, status: str, sql: str, params: tuple):
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM analysis_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            self._conn.execute(sql, params)
+            self._conn.commit()
+            if row:
+                self._counts[row["status"]] -= 1
+                self._counts[status] += 1
+
+    def create(self, user_id: int, agent_id: str, call_id: str, recording_path: str) -> Tuple[str, bool]:
+        """
+        Insert a queued job unless the call already has one that hasn't failed.
+        Returns (job_id, created); job_id is the existing job's when not created.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO analysis_jobs "
+                "(job_id, user_id, agent_id, call_id, recording_path, status, created_at) "
+                "SELECT ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ("
+                "SELECT 1 FROM analysis_jobs WHERE agent_id = ? AND call_id = ? AND status != ?)",
+                (
+                    job_id, user_id, agent_id, call_id, recording_path, JOB_QUEUED, time.time(),
+                    agent_id, call_id, JOB_FAILED,
+                ),
+            )
+            self._conn.commit()
+            if cur.rowcount == 1:
+                self._counts[JOB_QUEUED] += 1
+                return job_id, True
+            row = self._conn.execute(
+                "SELECT job_id FROM analysis_jobs WHERE agent_id = ? AND call_id = ? AND status != ?",
+                (agent_id, call_id, JOB_FAILED),
+            ).fetchone()
+        return row["job_id"], False
+
+    def mark_running(self, job_id: str):
+        self._transition(
+            job_id, JOB_RUNNING,
+            "UPDATE analysis_jobs SET status = ?, started_at = ? WHERE job_id = ?",
+            (JOB_RUNNING, time.time(), job_id),
+        )
+
+    def mark_done(
+        self, job_id: str, result: dict, stage_timings: dict, stage_memory: dict, saved_id: int
+    ):
+        self._transition(
+            job_id, JOB_DONE,
+            "UPDATE analysis_jobs SET status = ?, result = ?, stage_timings = ?, stage_memory = ?, "
+            "saved_id = ?, finished_at = ? WHERE job_id = ?",
+            (
+                JOB_DONE, json.dumps(result), json.dumps(stage_timings),
+                json.dumps(stage_memory), saved_id, time.time(), job_id,
+            ),
+        )
+        self._recent_timings.append(dict(stage_timings))
+
+    def mark_failed(self, job_id: str, error: str, stage_timings: Optional[dict] = None):
+        self._transition(
+            job_id, JOB_FAILED,
+            "UPDATE analysis_jobs SET status = ?, error = ?, stage_timings = ?, finished_at = ? "
+            "WHERE job_id = ?",
+            (JOB_FAILED, error, json.dumps(stage_timings or {}), time.time(), job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM analysis_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["stage_timings"] = json.loads(job["stage_timings"]) if job["stage_timings"] else {}
+        job["stage_memory"] = json.loads(job["stage_memory"]) if job["stage_memory"] else {}
+        return job
+
+    def find_active(self, agent_id: str, call_id: str) -> Optional[str]:
+        row = self._execute(
+            "SELECT job_id FROM analysis_jobs WHERE agent_id = ? AND call_id = ? AND status != ?",
+            (agent_id, call_id, JOB_FAILED),
+        ).fetchone()
+        return row["job_id"] if row else None
+
+    def unfinished(self):
+        rows = self._execute(
+            "SELECT * FROM analysis_jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (JOB_QUEUED, JOB_RUNNING),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    def mean_stage_timings(self) -> Dict[str, float]:
+        """Mean seconds per stage over the last STAGE_TIMINGS_WINDOW completed jobs."""
+        recent = list(self._recent_timings)
+        totals: Dict[str, float] = {}
+        for timings in recent:
+            for stage, seconds in timings.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return {stage: round(total / len(recent), 4) for stage, total in totals.items()}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def spool_stream(chunks, path: str, max_bytes: int = MAX_UPLOAD_BYTES):
+    """
+    Write an async byte stream straight to `path`, so memory use stays at one
+    chunk whatever the recording length. Returns (size, sha256 hex digest).
+    The partial file is removed if the stream fails or exceeds `max_bytes`.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+    return size, digest.hexdigest()
+
+
+def _init_worker():
+    # Importing the analyzer loads its models, once per worker process.
+    import sentiment_analyzer  # noqa: F401
+
+
+def run_analysis_job(
+    agent_id: str, call_id: str, recording_path: str, resumed: bool = False
+) -> Dict[str, Any]:
+    """Runs inside a worker process."""
+    from fastapi import HTTPException
+    from sentiment_analyzer import SentimentAnalyzer
+
+    analyzer = None
+    try:
+        analyzer = SentimentAnalyzer(
+            agent_id=agent_id,
+            call_id=call_id,
+            call_recording_path=recording_path,
+        )
+        # A job resumed after a restart may have left a partial call record behind.
+        analysis = analyzer.analyze(replace_existing=resumed)
+    except HTTPException as e:
+        # HTTPException doesn't survive pickling back to the parent.
+        raise RuntimeError(str(e.detail))
+    return {
+        "analysis": analysis,
+        "stage_timings": analyzer.stage_timings,
+        "stage_memory": analyzer.stage_memory,
+    }
+
+
+def precompute_agent_voice(wav_path: str) -> bool:
+    """Runs inside a worker process, where the embedding model is already loaded."""
+    from sentiment_analyzer import SentimentAnalyzer
+
+    SentimentAnalyzer.reference_embedding(wav_path)
+    return True
+
+
+class AnalysisJobQueue:
+    """Runs call analysis jobs on a bounded pool of worker processes."""
+
+    def __init__(self, store: AnalysisJobStore, max_workers: int = ANALYSIS_WORKERS):
+        self.store = store
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    async def start(self):
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._slots = asyncio.Semaphore(self.max_workers)
+        os.makedirs(ANALYSIS_SPOOL_DIR, exist_ok=True)
+
+        for job in self.store.unfinished():
+            logger.info("Re-queueing analysis job %s after restart", job["job_id"])
+            self._dispatch(job, resumed=True)
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def precompute_agent_voice(self, wav_path: str):
+        """Store the agent's reference embedding so analyses only have to load it."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, precompute_agent_voice, wav_path)
+
+    def spool_path(self, job_key: str) -> str:
+        return os.path.join(ANALYSIS_SPOOL_DIR, f"{job_key}.audio")
+
+    async def submit(self, user_id: int, agent_id: str, call_id: str, recording_path: str) -> Tuple[str, bool]:
+        """(job_id, created). Not created: the call already has a live job, whose id is returned."""
+        job_id, created = await asyncio.to_thread(self.store.create, user_id, agent_id, call_id, recording_path)
+        if created:
+            self._dispatch(await asyncio.to_thread(self.store.get, job_id))
+        return job_id, created
+
+    def _dispatch(self, job: Dict[str, Any], resumed: bool = False):
+        task = asyncio.create_task(self._run(job, resumed))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: Dict[str, Any], resumed: bool = False):
+        job_id = job["job_id"]
+        async with self._slots:
+            await asyncio.to_thread(self.store.mark_running, job_id)
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            try:
+                output = await loop.run_in_executor(
+                    self._executor,
+                    run_analysis_job,
+                    job["agent_id"],
+                    job["call_id"],
+                    job["recording_path"],
+                    resumed,
+                )
+            except asyncio.CancelledError:
+                # Shutdown: the job stays unfinished and is re-queued from its spool file.
+                raise
+            except Exception as e:
+                logger.exception("Analysis job %s failed", job_id)
+                metrics.stage_errors.inc("analysis", "job")
+                await asyncio.to_thread(self.store.mark_failed, job_id, str(e))
+                self._remove_spool(job)
+                return
+            # Stages are timed inside the worker process; record them here.
+            metrics.observe_stage("analysis", "job", time.perf_counter() - started)
+            for stage, seconds in output["stage_timings"].items():
+                metrics.observe_stage("analysis", stage, seconds)
+
+        try:
+            with metrics.timed("analysis", "persist"):
+                async with AsyncSessionLocal() as db:
+                    saved = await save_call_analysis(db, job["user_id"], job["call_id"], output["analysis"])
+            await asyncio.to_thread(
+                self.store.mark_done,
+                job_id, output["analysis"], output["stage_timings"], output["stage_memory"], saved.id,
+            )
+        except Exception as e:
+            logger.exception("Failed to persist result of analysis job %s", job_id)
+            await asyncio.to_thread(
+                self.store.mark_failed,
+                job_id, f"Failed to persist analysis result: {e}", output["stage_timings"],
+            )
+
+        self._remove_spool(job)
+
+    @staticmethod
+    def _remove_spool(job: Dict[str, Any]):
+        """Failed jobs are not retried, so their upload goes as soon as the job is settled."""
+        try:
+            os.remove(job["recording_path"])
+        except OSError:
+            pass
+
+    def metrics(self) -> Dict[str, Any]:
+        counts = self.store.counts()
+        return {
+            "workers": self.max_workers,
+            "queue_depth": counts[JOB_QUEUED],
+            "running": counts[JOB_RUNNING],
+            "done": counts[JOB_DONE],
+            "failed": counts[JOB_FAILED],
+            "mean_stage_timings": self.store.mean_stage_timings(),
+        }
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Offline batch call analysis.
+
+Runs the SentimentAnalyzer pipeline over a manifest or a directory of
+recordings on a pool of worker processes and bulk-writes the results to the
+call_analysis table. Progress is checkpointed so an interrupted run resumes
+where it stopped.
+
+    python batch_analyze.py --manifest calls.csv
+    python batch_analyze.py --input-dir recordings/2024-06-01 --workers 4
+"""
+
+import os
+import csv
+import json
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger("batch_analyze")
+
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".flac", ".ogg", ".m4a"}
+DEFAULT_CHECKPOINT = "batch_checkpoint.jsonl"
+
+
+def load_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    Read a CSV (with a header) or JSONL manifest with `path` and `agent_id`
+    per recording. `call_id` defaults to the file name without extension.
+    """
+    items = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        base = os.path.dirname(os.path.abspath(path))
+        for row in rows:
+            audio_path = row["path"]
+            if not os.path.isabs(audio_path):
+                audio_path = os.path.join(base, audio_path)
+            items.append({
+                "path": audio_path,
+                "agent_id": row["agent_id"],
+                "call_id": row.get("call_id") or os.path.splitext(os.path.basename(audio_path))[0],
+            })
+    return items
+
+
+def scan_directory(root: str) -> List[Dict[str, str]]:
+    """Recordings laid out as `<root>/<agent_id>/<call_id>.<ext>`."""
+    items = []
+    for agent_id in sorted(os.listdir(root)):
+        agent_dir = os.path.join(root, agent_id)
+        if not os.path.isdir(agent_dir):
+            continue
+        for name in sorted(os.listdir(agent_dir)):
+            call_id, ext = os.path.splitext(name)
+            if ext.lower() in AUDIO_EXTENSIONS:
+                items.append({
+                    "path": os.path.join(agent_dir, name),
+                    "agent_id": agent_id,
+                    "call_id": call_id,
+                })
+    return items
+
+
+def _key(agent_id: str, call_id: str) -> str:
+    return f"{agent_id}/{call_id}"
+
+
+def read_checkpoint(path: str, retry_failed: bool) -> set:
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed mid-write.
+                continue
+            if entry["status"] == "done" or not retry_failed:
+                finished.add(_key(entry["agent_id"], entry["call_id"]))
+    return finished
+
+
+def worker_slots(workers: Optional[int], per_device: int, threads_per_worker: int) -> List[str]:
+    """
+    One entry per worker process: the CUDA device it should see, or "" for CPU.
+    Without --workers the pool is `per_device` workers per GPU, or one worker
+    per `threads_per_worker` cores on CPU-only hosts.
+    """
+    import torch
+
+    gpus = torch.cuda.device_count()
+    if gpus:
+        count = workers or gpus * per_device
+        return [str(i % gpus) for i in range(count)]
+    count = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    return [""] * count
+
+
+def _init_worker(slots, threads_per_worker: int):
+    # Must be set before torch initialises CUDA in this process.
+    os.environ["CUDA_VISIBLE_DEVICES"] = slots.get()
+
+    import torch
+    torch.set_num_threads(threads_per_worker)
+
+    # Importing the analyzer loads its models, once per worker process.
+    import sentiment_analyzer  # noqa: F401
+
+
+def analyze_recording(item: Dict[str, str], archive: bool) -> Dict:
+    """Runs inside a worker process."""
+    from fastapi import HTTPException
+    from sentiment_analyzer import SentimentAnalyzer
+
+    analyzer = SentimentAnalyzer(
+        agent_id=item["agent_id"],
+        call_id=item["call_id"],
+        call_recording_path=item["path"],
+    )
+    try:
+        analysis = analyzer.analyze(archive=archive, replace_existing=True)
+    except HTTPException as e:
+        # HTTPException doesn't survive pickling back to the parent.
+        raise RuntimeError(str(e.detail))
+    return {
+        "analysis": analysis,
+        "audio_s": analyzer.audio_duration,
+        "stage_timings": analyzer.stage_timings,
+    }
+
+
+class BatchRun:
+    def __init__(self, checkpoint_path: str, flush_every: int, replace: bool):
+        from config import SessionLocal
+
+        self.SessionLocal = SessionLocal
+        self.checkpoint_path = checkpoint_path
+        self.flush_every = flush_every
+        self.replace = replace
+        self.pending: List[Dict] = []
+        self.started = time.perf_counter()
+        self.audio_s = 0.0
+        self.done = 0
+        self.failed = 0
+
+    def _append_checkpoint(self, entries: List[Dict]):
+        with open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def user_ids(self, agent_ids) -> Dict[str, int]:
+        from database.queries import get_user_ids
+
+        db = self.SessionLocal()
+        try:
+            return get_user_ids(db, set(agent_ids))
+        finally:
+            db.close()
+
+    def record_failure(self, item: Dict[str, str], error: str):
+        self.failed += 1
+        logger.error("Failed %s: %s", _key(item["agent_id"], item["call_id"]), error)
+        self._append_checkpoint([{
+            "agent_id": item["agent_id"],
+            "call_id": item["call_id"],
+            "status": "failed",
+            "error": error,
+        }])
+
+    def record_result(self, item: Dict[str, str], user_id: int, output: Dict):
+        self.pending.append({"item": item, "user_id": user_id, "output": output})
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write pending results in one transaction, then checkpoint them."""
+        if not self.pending:
+            return
+        from database.queries import save_call_analyses_bulk
+
+        db = self.SessionLocal()
+        try:
+            save_call_analyses_bulk(
+                db,
+                [(p["user_id"], p["item"]["call_id"], p["output"]["analysis"]) for p in self.pending],
+                replace=self.replace,
+            )
+        finally:
+            db.close()
+
+        self._append_checkpoint([
+            {
+                "agent_id": p["item"]["agent_id"],
+                "call_id": p["item"]["call_id"],
+                "status": "done",
+                "audio_s": round(p["output"]["audio_s"], 2),
+                "stage_timings": p["output"]["stage_timings"],
+            }
+            for p in self.pending
+        ])
+        for p in self.pending:
+            self.audio_s += p["output"]["audio_s"]
+        self.done += len(self.pending)
+        self.pending = []
+        logger.info(
+            "%d done, %d failed, %.2f audio-hours per hour",
+            self.done, self.failed, self.throughput(),
+        )
+
+    def throughput(self) -> float:
+        wall_s = time.perf_counter() - self.started
+        return self.audio_s / wall_s if wall_s > 0 else 0.0
+
+    def summary(self) -> Dict:
+        wall_s = time.perf_counter() - self.started
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "audio_hours": round(self.audio_s / 3600, 3),
+            "wall_hours": round(wall_s / 3600, 3),
+            "audio_hours_per_hour": round(self.throughput(), 2),
+        }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Batch call analysis")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="CSV or JSONL with path, agent_id[, call_id]")
+    source.add_argument("--input-dir", help="Directory laid out as <agent_id>/<call_id>.<ext>")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: sized to devices/cores)")
+    parser.add_argument("--workers-per-device", type=int, default=1, help="Workers per GPU")
+    parser.add_argument("--threads-per-worker", type=int, default=4, help="Torch threads per worker")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file used to resume")
+    parser.add_argument("--flush-every", type=int, default=50, help="Results per bulk insert")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry calls that failed in a previous run")
+    parser.add_argument("--keep-existing", action="store_true", help="Don't replace existing call_analysis rows")
+    parser.add_argument("--archive", action="store_true", help="Archive recordings under calls_recording/")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    items = load_manifest(args.manifest) if args.manifest else scan_directory(args.input_dir)
+    finished = read_checkpoint(args.checkpoint, args.retry_failed)
+    todo = [i for i in items if _key(i["agent_id"], i["call_id"]) not in finished]
+    logger.info("%d recordings, %d already checkpointed, %d to analyze", len(items), len(items) - len(todo), len(todo))
+    if not todo:
+        return
+
+    run = BatchRun(args.checkpoint, args.flush_every, replace=not args.keep_existing)
+    user_ids = run.user_ids(i["agent_id"] for i in todo)
+    runnable = []
+    for item in todo:
+        if item["agent_id"] in user_ids:
+            runnable.append(item)
+        else:
+            run.record_failure(item, "Unknown agent")
+
+    slots_list = worker_slots(args.workers, args.workers_per_device, args.threads_per_worker)
+    ctx = multiprocessing.get_context("spawn")
+    slots = ctx.Queue()
+    for slot in slots_list:
+        slots.put(slot)
+    logger.info("Starting %d workers (%s)", len(slots_list), ", ".join(s and f"cuda:{s}" or "cpu" for s in slots_list))
+
+    with ProcessPoolExecutor(
+        max_workers=len(slots_list),
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(slots, args.threads_per_worker),
+    ) as executor:
+        futures = {executor.submit(analyze_recording, item, args.archive): item for item in runnable}
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    output = future.result()
+                except Exception as e:
+                    run.record_failure(item, str(e))
+                    continue
+                run.record_result(item, user_ids[item["agent_id"]], output)
+        finally:
+            run.flush()
+
+    print(json.dumps(run.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
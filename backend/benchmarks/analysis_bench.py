@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Stage-by-stage benchmark for SentimentAnalyzer.analyze.
+
+The input is either deterministic synthetic two-speaker calls or a small
+fixture folder of WAVs. Synthetic calls alternate agent and customer
+turns, each a harmonic voice at its own pitch, separated by pauses over a
+noise floor. Every call goes through analyze() the way analysis jobs run
+it, and the analyzer's own stage timings are collected.
+
+    cd backend
+    python benchmarks/analysis_bench.py --minutes 1,5 --calls 3
+    python benchmarks/analysis_bench.py --minutes 5 --save-baseline bench/analysis_stub.json
+    python benchmarks/analysis_bench.py --minutes 5 --baseline bench/analysis_stub.json
+    python benchmarks/analysis_bench.py --models real --fixtures samples/calls --agent-voice samples/agent.wav
+
+With `--models stub` (the default) no model is loaded. Diarization,
+embedding, Whisper decoding, punctuation and both sentiment models are
+replaced by cheap deterministic stand-ins. Decode, denoise, mel features,
+segment assembly, alignment and aggregation stay real, so the stub run
+measures the pipeline around the models and fits in CI. `--models real`
+loads everything, like an analysis worker.
+
+The report covers:
+- seconds per audio hour and share of wall time for each stage;
+- throughput in audio hours analysed per wall-clock hour;
+- peak RSS and RSS growth sampled during each stage;
+- peak RSS after model load and at the end, and peak CUDA memory.
+
+With --baseline, any stage that got more than --tolerance slower per
+audio hour, or a throughput drop of that size, is listed under
+"regressions", and the exit status is 1.
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import glob
+import base64
+import shutil
+import argparse
+import resource
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+STAGES = (
+    "decode", "denoise", "diarization", "embedding", "segment_assembly",
+    "asr", "punctuation", "audio_sentiment", "text_sentiment", "aggregation",
+)
+
+VOICE_F0 = {"agent": 118.0, "customer": 205.0}  # Hz
+TURN_S = (2.0, 12.0)
+GAP_S = (0.2, 1.2)
+NOISE_LEVEL = 0.003
+AGENT_SAMPLE_S = 12.0
+
+
+def _rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# ---------------------------------------------------------------- corpus
+
+
+def _voice(rng, f0: float, n: int, sr: int) -> np.ndarray:
+    """Five harmonics with slow pitch drift and a ~4 Hz syllable envelope."""
+    t = np.arange(n) / sr
+    pitch = f0 * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(0.2, 0.6) * t + rng.uniform(0, 2 * np.pi)))
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    signal = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(3.0, 5.0) * t + rng.uniform(0, 2 * np.pi))
+    return (0.2 * signal * envelope).astype(np.float32)
+
+
+def synth_call(rng, duration_s: float, sr: int):
+    """(samples, [(role, start, end), ...]); the agent speaks first."""
+    audio = rng.normal(0.0, NOISE_LEVEL, int(duration_s * sr)).astype(np.float32)
+    script = []
+    role, pos = "agent", rng.uniform(0.3, 1.0)
+    while True:
+        end = pos + rng.uniform(*TURN_S)
+        if end > duration_s - 0.2:
+            break
+        a, b = int(pos * sr), int(end * sr)
+        audio[a:b] += _voice(rng, VOICE_F0[role], b - a, sr)
+        script.append((role, round(pos, 2), round(end, 2)))
+        role = "customer" if role == "agent" else "agent"
+        pos = end + rng.uniform(*GAP_S)
+    return audio, script
+
+
+def write_wav(path: str, samples: np.ndarray, sr: int):
+    pcm16 = (np.clip(samples, -1.0, 1.0) * 32767.0).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(pcm16.tobytes())
+
+
+def build_corpus(directory: str, minutes, calls: int, sr: int, seed: int):
+    """Synthetic calls plus the agent's voice sample. Returns (agent_voice, [(call_id, path)])."""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    agent_voice = os.path.join(directory, "agent_voice.wav")
+    write_wav(agent_voice, _voice(rng, VOICE_F0["agent"], int(AGENT_SAMPLE_S * sr), sr), sr)
+
+    items = []
+    for length in minutes:
+        for i in range(calls):
+            call_id = f"synthetic_{length:g}min_{i}"
+            samples, _ = synth_call(rng, length * 60, sr)
+            path = os.path.join(directory, f"{call_id}.wav")
+            write_wav(path, samples, sr)
+            items.append((call_id, path))
+    return agent_voice, items
+
+
+# ---------------------------------------------------------------- stub models
+
+
+_PHRASES = [
+    "thank you for calling how can I help you today",
+    "my order still has not arrived and I am really frustrated",
+    "I am sorry to hear that let me check the status for you",
+    "it was supposed to be here last week",
+    "I can see it was delayed at the warehouse",
+    "that is terrible I needed it for the weekend",
+    "I will send a replacement with express delivery at no cost",
+    "great thank you that is very helpful",
+]
+_NEGATIVE = {"frustrated", "terrible", "not", "delayed", "sorry"}
+_POSITIVE = {"thank", "great", "helpful", "help"}
+_WORD_S = 0.35
+_EMBED_MAX_S = 30.0
+_BANDS_HZ = np.geomspace(60.0, 1000.0, 33)
+
+
+def _band_embedding(samples, sr: int) -> np.ndarray:
+    """Unit-norm log-spaced band energies; enough to tell the two synthetic voices apart."""
+    samples = np.asarray(samples[: int(_EMBED_MAX_S * sr)], dtype=np.float32)
+    spectrum = np.abs(np.fft.rfft(samples))
+    bands = np.digitize(np.fft.rfftfreq(len(samples), 1 / sr), _BANDS_HZ)
+    energy = np.bincount(bands, weights=spectrum, minlength=len(_BANDS_HZ) + 1)[1:len(_BANDS_HZ)]
+    return (energy / (np.linalg.norm(energy) + 1e-9)).astype(np.float32)
+
+
+def _voiced_regions(samples: np.ndarray, sr: int, frame_s: float = 0.02):
+    """(start, end) seconds of stretches above a tenth of the loud-frame level."""
+    frame = int(frame_s * sr)
+    n = len(samples) // frame
+    if n == 0:
+        return []
+    rms = np.sqrt(np.mean(np.square(samples[: n * frame].reshape(n, frame)), axis=1))
+    voiced = (rms > 0.1 * np.percentile(rms, 95)).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced, [0]))))
+
+    regions = []
+    for start, end in zip(edges[::2] * frame_s, edges[1::2] * frame_s):
+        if regions and start - regions[-1][1] < 0.15:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return [(float(s), float(e)) for s, e in regions if e - s >= 0.3]
+
+
+class _StubSpeakerEmbedding:
+    sample_rate = 16000
+
+    def __call__(self, batch, masks=None):
+        lengths = masks.sum(dim=1).long().tolist() if masks is not None else [batch.shape[-1]] * len(batch)
+        return np.stack([
+            _band_embedding(batch[i, 0, :n].numpy(), self.sample_rate) for i, n in enumerate(lengths)
+        ])
+
+
+class _StubDiarization:
+    """Energy segmentation with alternating speaker labels."""
+
+    embedding = "stub-bands"
+
+    def __init__(self):
+        self._embedding = _StubSpeakerEmbedding()
+
+    def __call__(self, audio_input, min_speakers=None, max_speakers=None, return_embeddings=False):
+        from pyannote.core import Annotation, Segment
+
+        samples = audio_input["waveform"][0].numpy()
+        sr = audio_input["sample_rate"]
+        annotation = Annotation()
+        pieces = {}
+        for i, (start, end) in enumerate(_voiced_regions(samples, sr)):
+            label = f"SPEAKER_{i % 2:02d}"
+            annotation[Segment(start, end)] = label
+            pieces.setdefault(label, []).append(samples[int(start * sr) : int(end * sr)])
+        if not return_embeddings:
+            return annotation
+        embeddings = None
+        if pieces:
+            embeddings = np.stack([
+                _band_embedding(np.concatenate(pieces[label]), sr) for label in annotation.labels()
+            ])
+        return annotation, embeddings
+
+
+class _StubWhisper:
+    is_multilingual = False
+    num_languages = 99
+    dims = SimpleNamespace(n_mels=80)
+    device = torch.device("cpu")
+
+
+class _StubDecoder:
+    """Cycles through _PHRASES, as two timestamped segments per turn."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, model, mel, options=None):
+        import whisper
+
+        tokenizer = whisper.tokenizer.get_tokenizer(False)
+        results = []
+        for _ in range(mel.shape[0]):
+            text = _PHRASES[self.count % len(_PHRASES)]
+            self.count += 1
+            words = text.split()
+            tokens, t = [], 0.0
+            for segment in (words[: len(words) // 2], words[len(words) // 2 :]):
+                tokens.append(tokenizer.timestamp_begin + round(t / 0.02))
+                tokens.extend(tokenizer.encode(" " + " ".join(segment)))
+                t += _WORD_S * len(segment)
+                tokens.append(tokenizer.timestamp_begin + round(t / 0.02))
+            tokens.append(tokenizer.eot)
+            results.append(SimpleNamespace(text=text, tokens=tokens, no_speech_prob=0.0, avg_logprob=-0.2))
+        return results
+
+
+class _StubPunctuation:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def restore_punctuation(self, text: str) -> str:
+        words = text.split()
+        return " ".join(w + "." if (i + 1) % 8 == 0 or i == len(words) - 1 else w for i, w in enumerate(words))
+
+
+class _StubTextSentiment:
+    def __call__(self, texts, batch_size=None, truncation=True):
+        results = []
+        for text in texts:
+            words = set(text.lower().replace(".", " ").split())
+            negative, positive = len(words & _NEGATIVE), len(words & _POSITIVE)
+            label = "negative" if negative > positive else "positive" if positive > negative else "neutral"
+            results.append({"label": label, "score": 0.9})
+        return results
+
+
+class _StubFeatureExtractor:
+    def __call__(self, arrays, sampling_rate=16000, padding=True, return_tensors="pt"):
+        values = torch.zeros(len(arrays), max(len(a) for a in arrays))
+        for i, a in enumerate(arrays):
+            values[i, : len(a)] = torch.from_numpy(np.asarray(a, dtype=np.float32))
+        return {"input_values": values}
+
+
+class _StubAudioSentiment:
+    """Loud windows come out angry, everything else neutral."""
+
+    config = SimpleNamespace(id2label={0: "neu", 1: "hap", 2: "ang", 3: "sad"})
+
+    def __call__(self, input_values):
+        logits = torch.zeros(input_values.shape[0], 4)
+        logits[:, 0] = 1.0
+        logits[:, 2] = input_values.pow(2).mean(dim=1).sqrt() * 10
+        return SimpleNamespace(logits=logits)
+
+
+def install_stub_models():
+    """Point every loader sentiment_analyzer calls at import time to the stand-ins above."""
+    import whisper
+    import transformers
+    import pyannote.audio
+    import deepmultilingualpunctuation
+    from whisper_manager import WhisperManager
+
+    transformers.pipeline = lambda *args, **kwargs: _StubTextSentiment()
+    transformers.AutoModelForAudioClassification.from_pretrained = lambda *args, **kwargs: _StubAudioSentiment()
+    transformers.AutoFeatureExtractor.from_pretrained = lambda *args, **kwargs: _StubFeatureExtractor()
+    pyannote.audio.Pipeline.from_pretrained = lambda *args, **kwargs: _StubDiarization()
+    deepmultilingualpunctuation.PunctuationModel = _StubPunctuation
+    WhisperManager.get_model = classmethod(lambda cls, *args, **kwargs: _StubWhisper())
+    whisper.decode = _StubDecoder()
+
+
+# ---------------------------------------------------------------- run
+
+
+def analyze_call(SentimentAnalyzer, work_dir: str, agent_voice: str, call_id: str, path: str, args) -> dict:
+    kwargs = {"call_recording_path": path}
+    if args.input == "b64":
+        with open(path, "rb") as f:
+            kwargs = {"call_recording_b64": base64.b64encode(f.read()).decode("utf-8")}
+
+    analyzer = SentimentAnalyzer(
+        calls_base_dir=os.path.join(work_dir, "calls"),
+        agents_audios=os.path.join(work_dir, "agents"),
+        agent_id="bench",
+        call_id=call_id,
+        user_voice_sample_path=agent_voice,
+        **kwargs,
+    )
+    started = time.perf_counter()
+    analysis = analyzer.analyze(archive=args.archive, replace_existing=True)
+    wall_s = time.perf_counter() - started
+    analyzer.wait_for_archive()
+
+    return {
+        "call_id": call_id,
+        "audio_s": round(analyzer.audio_duration, 2),
+        "wall_s": round(wall_s, 3),
+        "rtf": round(wall_s / max(analyzer.audio_duration, 1e-9), 4),
+        "segments": len(analysis["segments"]),
+        "stage_timings": dict(analyzer.stage_timings),
+        "stage_memory": dict(analyzer.stage_memory),
+    }
+
+
+def summarize(calls) -> dict:
+    audio_s = sum(c["audio_s"] for c in calls)
+    wall_s = sum(c["wall_s"] for c in calls)
+    audio_h = max(audio_s / 3600, 1e-9)
+
+    names = list(STAGES) + sorted({s for c in calls for s in c["stage_timings"]} - set(STAGES))
+    stages = {}
+    for name in names:
+        total = sum(c["stage_timings"].get(name, 0.0) for c in calls)
+        memory = [c["stage_memory"][name] for c in calls if name in c["stage_memory"]]
+        stages[name] = {
+            "total_s": round(total, 3),
+            "s_per_audio_hour": round(total / audio_h, 2),
+            "share_pct": round(100 * total / max(wall_s, 1e-9), 1),
+            "peak_rss_mb": max((m["peak_rss_mb"] for m in memory), default=None),
+            "rss_delta_mb": max((m["rss_delta_mb"] for m in memory), default=None),
+        }
+    return {
+        "audio_s": round(audio_s, 2),
+        "wall_s": round(wall_s, 3),
+        "audio_hours_per_hour": round(audio_s / max(wall_s, 1e-9), 2),
+        "stages": stages,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Stages slower per audio hour, or throughput lower, than the baseline by more than `tolerance`."""
+    regressions = []
+
+    def check(metric, value, before, higher_is_worse=True):
+        if not before:
+            return
+        change = (value - before) / before
+        if (change if higher_is_worse else -change) > tolerance:
+            regressions.append({
+                "metric": metric, "baseline": before, "current": value,
+                "change_pct": round(100 * change, 1),
+            })
+
+    for name, stage in report["stages"].items():
+        before = baseline["stages"].get(name, {}).get("s_per_audio_hour")
+        check(f"stage.{name}.s_per_audio_hour", stage["s_per_audio_hour"], before)
+    check(
+        "audio_hours_per_hour", report["audio_hours_per_hour"], baseline.get("audio_hours_per_hour"),
+        higher_is_worse=False,
+    )
+    return regressions
+
+
+def run(args, work_dir: str) -> dict:
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # config needs one; analyze() never touches it
+    if args.models == "stub":
+        install_stub_models()
+
+    # Loads every analysis model (or stand-in), like an analysis worker does.
+    from sentiment_analyzer import SentimentAnalyzer
+
+    rss_after_load_mb = _rss_mb()
+
+    if args.fixtures:
+        if not args.agent_voice:
+            raise SystemExit("--fixtures needs --agent-voice")
+        agent_voice = args.agent_voice
+        items = [
+            (os.path.splitext(os.path.basename(p))[0], p)
+            for p in sorted(glob.glob(os.path.join(args.fixtures, "*.wav")))
+        ]
+        if not items:
+            raise SystemExit(f"No .wav files in {args.fixtures}")
+    else:
+        minutes = [float(m) for m in args.minutes.split(",")]
+        agent_voice, items = build_corpus(
+            os.path.join(work_dir, "corpus"), minutes, args.calls, args.sample_rate, args.seed
+        )
+
+    # First-call costs (tokenizer, mel filters, punkt, CUDA kernels) aren't part of any stage budget.
+    for call_id, path in items[: args.warmup]:
+        analyze_call(SentimentAnalyzer, work_dir, agent_voice, f"warmup_{call_id}", path, args)
+
+    calls = [
+        analyze_call(SentimentAnalyzer, work_dir, agent_voice, call_id, path, args)
+        for _ in range(args.repeat)
+        for call_id, path in items
+    ]
+
+    report = {
+        "config": {
+            "models": args.models, "input": args.input, "archive": args.archive,
+            "corpus": args.fixtures or {
+                "minutes": args.minutes, "calls_per_length": args.calls,
+                "sample_rate": args.sample_rate, "seed": args.seed,
+            },
+            "calls": len(calls), "warmup": args.warmup, "torch_threads": torch.get_num_threads(),
+            "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+        },
+        **summarize(calls),
+        "rss_after_load_mb": rss_after_load_mb,
+        "peak_rss_mb": _rss_mb(),
+        "calls": [{k: v for k, v in c.items() if k != "stage_memory"} for c in calls],
+    }
+    if torch.cuda.is_available():
+        report["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated() / 1024 ** 2, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of SentimentAnalyzer.analyze")
+    parser.add_argument("--models", choices=("stub", "real"), default="stub")
+    parser.add_argument("--minutes", default="1,5", help="Comma-separated synthetic call lengths")
+    parser.add_argument("--calls", type=int, default=2, help="Synthetic calls per length")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="Sample rate of the synthetic WAVs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", help="Folder of .wav calls to use instead of synthetic ones")
+    parser.add_argument("--agent-voice", help="Agent voice sample for --fixtures")
+    parser.add_argument("--input", choices=("path", "b64"), default="path",
+                        help="Hand the recording over as a spooled file (jobs) or base64 (API)")
+    parser.add_argument("--archive", action="store_true", help="Also archive the recording, as in production")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before the measured ones")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the corpus")
+    parser.add_argument("--work-dir", help="Keep the corpus and call records here instead of a temp dir")
+    parser.add_argument("--output", help="Also write the report here")
+    parser.add_argument("--save-baseline", help="Write the report as the new baseline")
+    parser.add_argument("--baseline", help="Compare against this baseline report")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="analysis_bench_")
+    try:
+        report = run(args, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.write(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
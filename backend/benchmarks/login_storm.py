@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Login-storm benchmark: event-loop lag while many password checks run.
+
+Fires N concurrent sha256_crypt verifications, the work behind every
+signin, and samples event-loop lag with a 10 ms ticker. This stands in
+for the audio sessions sharing the worker. It runs twice:
+
+    inline    verification on the event loop (the previous behaviour)
+    executor  verification on utils.hashing.HashingExecutor
+
+    python benchmarks/login_storm.py --logins 200 --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+from passlib.hash import sha256_crypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.hashing import HashingExecutor  # noqa: E402
+
+
+TICK_S = 0.010
+
+
+async def _lag_probe(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK_S
+        await asyncio.sleep(TICK_S)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def _storm(verify, logins: int, password: str, password_hash: str) -> dict:
+    lag = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_lag_probe(lag, stop))
+    await asyncio.sleep(TICK_S * 5)
+
+    latencies = []
+
+    async def _login():
+        started = time.perf_counter()
+        assert await verify(password, password_hash)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_login() for _ in range(logins)))
+    wall_s = time.perf_counter() - started
+
+    stop.set()
+    await probe
+
+    lag_ms = np.array(lag or [0.0]) * 1000
+    lat_ms = np.array(latencies) * 1000
+    return {
+        "logins": logins,
+        "wall_s": round(wall_s, 3),
+        "logins_per_s": round(logins / wall_s, 1),
+        "login_p50_ms": round(float(np.percentile(lat_ms, 50)), 1),
+        "login_p99_ms": round(float(np.percentile(lat_ms, 99)), 1),
+        "loop_lag_p50_ms": round(float(np.percentile(lag_ms, 50)), 2),
+        "loop_lag_p99_ms": round(float(np.percentile(lag_ms, 99)), 2),
+        "loop_lag_max_ms": round(float(lag_ms.max()), 2),
+    }
+
+
+async def _inline_verify(password: str, password_hash: str) -> bool:
+    return sha256_crypt.verify(password, password_hash)
+
+
+async def main_async(args) -> dict:
+    password = "correct horse battery staple"
+    password_hash = sha256_crypt.hash(password)
+
+    results = {"inline": await _storm(_inline_verify, args.logins, password, password_hash)}
+
+    executor = HashingExecutor(max_workers=args.workers, max_concurrency=args.max_concurrency)
+    try:
+        # Start the pool before measuring so process spawn isn't counted.
+        await executor.verify(password, password_hash)
+        results["executor"] = await _storm(executor.verify, args.logins, password, password_hash)
+        results["executor"]["pool"] = executor.metrics()
+    finally:
+        executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing login-storm benchmark")
+    parser.add_argument("--logins", type=int, default=100, help="Concurrent logins per run")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Hashing processes")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="In-flight hashes (default 2x workers)")
+    args = parser.parse_args()
+    if args.max_concurrency is None:
+        args.max_concurrency = args.workers * 2
+
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Offline replay benchmark for VoiceProcessor.processing.
+
+Each WAV is sliced into PCM16 chunks like the /ws/client frontend sends
+them. The chunks go straight to VoiceProcessor.processing, followed by
+empty chunks until the agent's voice reply arrives. Every simulated
+session replays the whole folder, and --sessions of them run
+concurrently on the real models.
+
+    cd backend
+    python benchmarks/replay_voice.py --wav-dir samples/ --sessions 4 --pace realtime
+    python benchmarks/replay_voice.py --wav-dir samples/ --pace fast --save-baseline bench/voice.json
+    python benchmarks/replay_voice.py --wav-dir samples/ --baseline bench/voice.json
+
+The report covers:
+- per-stage latency percentiles (the stages metrics.py records);
+- real-time factor of the input path;
+- time to first transcript (first chunk to first transcription);
+- time to first audio (last speech chunk to voice reply);
+- peak memory.
+
+With --baseline, any p50/p95 that got more than --tolerance slower is
+listed under "regressions", and the exit status is 1.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import base64
+import asyncio
+import argparse
+import resource
+
+import numpy as np
+import librosa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import metrics, Histogram  # noqa: E402
+
+
+class _RecordingHistogram(Histogram):
+    """Keeps raw observations too, so the report has exact percentiles."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.raw = {}
+
+    def observe(self, value: float, *labels: str):
+        super().observe(value, *labels)
+        self.raw.setdefault(labels, []).append(value)
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    ms = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+def load_chunks(wav_dir: str, sample_rate: int, chunk_ms: int):
+    """[(name, [base64 PCM16 chunk, ...], duration_s)] for every WAV in the folder."""
+    files = []
+    samples_per_chunk = int(sample_rate * chunk_ms / 1000)
+    for path in sorted(glob.glob(os.path.join(wav_dir, "*.wav"))):
+        audio, _ = librosa.load(path, sr=sample_rate, mono=True)
+        pcm16 = (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+        chunks = [
+            base64.b64encode(pcm16[i:i + samples_per_chunk].tobytes()).decode("utf-8")
+            for i in range(0, len(pcm16), samples_per_chunk)
+        ]
+        files.append((os.path.basename(path), chunks, len(pcm16) / sample_rate))
+    return files
+
+
+class _SessionLog:
+    def __init__(self):
+        self.first_transcript = None
+        self.voice_at = None
+        self.voice = asyncio.Event()
+
+
+class Recorder:
+    """Stands in for the connection manager's send_data and timestamps what comes back."""
+
+    def __init__(self):
+        self.sessions = {}
+
+    async def send(self, message: dict, session_id: str):
+        log = self.sessions[session_id]
+        now = time.perf_counter()
+        if message.get("type") == "transcription" and log.first_transcript is None:
+            log.first_transcript = now
+        elif message.get("type") == "voice":
+            log.voice_at = now
+            log.voice.set()
+
+
+async def replay_session(processor, recorder, index: int, files, args, results: dict):
+    session_id = f"bench-{index}"
+    chunk_s = args.chunk_ms / 1000
+    base = {
+        "session_id": session_id,
+        "user_id": 1,
+        "username": f"bench{index}",
+        "sample_rate": args.sample_rate,
+        "language_preference": args.language,
+    }
+
+    # Rotate the folder so concurrent sessions aren't all on the same file.
+    for name, chunks, _ in files[index % len(files):] + files[:index % len(files)]:
+        log = recorder.sessions[session_id] = _SessionLog()
+        first_sent = None
+        next_at = time.perf_counter()
+
+        for chunk in chunks:
+            if args.pace == "realtime":
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    results["pacing_lag"].append(-delay)
+                next_at += chunk_s
+
+            started = time.perf_counter()
+            first_sent = first_sent or started
+            await processor.processing({**base, "current_audio_chunk": chunk})
+            results["chunk_seconds"].append(time.perf_counter() - started)
+        results["audio_s"] += len(chunks) * chunk_s
+        speech_end = time.perf_counter()
+
+        # Trailing silence, as the frontend keeps streaming after the user stops.
+        deadline = speech_end + args.reply_timeout
+        while not log.voice.is_set() and time.perf_counter() < deadline:
+            await processor.processing({**base, "current_audio_chunk": ""})
+            try:
+                await asyncio.wait_for(log.voice.wait(), chunk_s if args.pace == "realtime" else 0.05)
+            except asyncio.TimeoutError:
+                pass
+
+        if log.first_transcript is not None:
+            results["ttft"].append(log.first_transcript - first_sent)
+        if log.voice_at is None:
+            results["no_reply"].append(name)
+        elif log.voice_at < speech_end:
+            # A pause inside the file was long enough to end the turn early.
+            results["mid_utterance_replies"] += 1
+        else:
+            results["ttfa"].append(log.voice_at - speech_end)
+
+    processor.clear_session_memory(session_id)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Latencies that got slower than the baseline by more than `tolerance`."""
+    def flatten(r):
+        flat = {f"stage.{stage}.{k}": v for stage, s in r["stages"].items() for k, v in s.items()}
+        for key in ("chunk_processing", "ttft", "ttfa"):
+            flat.update({f"{key}.{k}": v for k, v in r[key].items()})
+        flat["input_rtf"] = r["input_rtf"]
+        return flat
+
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    for key, value in sorted(current.items()):
+        if not (key.endswith(("p50_ms", "p95_ms")) or key == "input_rtf"):
+            continue
+        before = previous.get(key)
+        if before and value > before * (1 + tolerance):
+            regressions.append({
+                "metric": key, "baseline": before, "current": value,
+                "change_pct": round(100 * (value - before) / before, 1),
+            })
+    return regressions
+
+
+async def main_async(args) -> dict:
+    metrics.stage_seconds = _RecordingHistogram(
+        metrics.stage_seconds.name, metrics.stage_seconds.help, metrics.stage_seconds.labelnames
+    )
+
+    # Loads every realtime model, like the API process does.
+    import torch
+    from voice_processor import VoiceProcessor
+    from quality_ladder import quality_ladder
+    from turn_tracing import turn_tracer
+
+    # Fixed settings, so runs are comparable.
+    quality_ladder.enabled = args.quality_ladder
+    turn_tracer.enabled = False
+
+    files = load_chunks(args.wav_dir, args.sample_rate, args.chunk_ms)
+    if not files:
+        raise SystemExit(f"No .wav files in {args.wav_dir}")
+
+    recorder = Recorder()
+    processor = VoiceProcessor(send_message=recorder.send)
+    results = {
+        "chunk_seconds": [], "ttft": [], "ttfa": [], "pacing_lag": [], "no_reply": [],
+        "mid_utterance_replies": 0, "audio_s": 0.0,
+    }
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        replay_session(processor, recorder, i, files, args, results) for i in range(args.sessions)
+    ))
+    wall_s = time.perf_counter() - started
+
+    report = {
+        "config": {
+            "wav_dir": args.wav_dir, "files": len(files), "sessions": args.sessions, "pace": args.pace,
+            "chunk_ms": args.chunk_ms, "sample_rate": args.sample_rate, "quality_ladder": args.quality_ladder,
+        },
+        "wall_s": round(wall_s, 2),
+        "audio_s": round(results["audio_s"], 2),
+        # Processing time per second of audio fed in; above 1 the input path can't keep up.
+        "input_rtf": round(sum(results["chunk_seconds"]) / max(results["audio_s"], 1e-9), 3),
+        "chunk_processing": _percentiles(results["chunk_seconds"]),
+        "ttft": _percentiles(results["ttft"]),
+        "ttfa": _percentiles(results["ttfa"]),
+        "turns_without_reply": len(results["no_reply"]),
+        "mid_utterance_replies": results["mid_utterance_replies"],
+        "stages": {
+            f"{pipeline}.{stage}": _percentiles(values)
+            for (pipeline, stage), values in sorted(metrics.stage_seconds.raw.items())
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if args.pace == "realtime":
+        report["pacing_lag"] = _percentiles(results["pacing_lag"])
+    if torch.cuda.is_available():
+        report["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated() / 1024 ** 2, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay WAV files through VoiceProcessor.processing")
+    parser.add_argument("--wav-dir", required=True, help="Folder of .wav utterances")
+    parser.add_argument("--sessions", type=int, default=1, help="Concurrent simulated sessions")
+    parser.add_argument("--pace", choices=("realtime", "fast"), default="realtime")
+    parser.add_argument("--chunk-ms", type=int, default=1000, help="Audio per audio_chunk message")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="sample_rate the client declares")
+    parser.add_argument("--language", default="auto")
+    parser.add_argument("--reply-timeout", type=float, default=60.0, help="Seconds to wait for each voice reply")
+    parser.add_argument("--quality-ladder", action="store_true", help="Let the quality ladder degrade settings")
+    parser.add_argument("--output", help="Also write the report here")
+    parser.add_argument("--save-baseline", help="Write the report as the new baseline")
+    parser.add_argument("--baseline", help="Compare against this baseline report")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.write(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
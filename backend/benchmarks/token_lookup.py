@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+active_users lookup latency at scale, on a local SQLite stand-in.
+
+Fills an active_users-shaped table with --rows sessions and times the
+two lookup shapes:
+
+    legacy  full JWT in bearer_token, no index, ORDER BY created_at
+    digest  sha256(token) in an indexed bearer_token (what the API does now)
+
+    python benchmarks/token_lookup.py --rows 1000000
+"""
+
+import os
+import json
+import time
+import random
+import string
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta, timezone
+
+
+SCHEMA = """
+CREATE TABLE active_users (
+    user_id INTEGER NOT NULL,
+    username TEXT NOT NULL,
+    role TEXT NOT NULL,
+    bearer_token TEXT NOT NULL,
+    bearer_expiry_time TEXT NOT NULL,
+    created_at TEXT NOT NULL
+)
+"""
+
+
+def _fake_jwt(rng: random.Random) -> str:
+    # Same length class as the HS256 tokens create_jwt issues.
+    alphabet = string.ascii_letters + string.digits + "-_"
+    return ".".join("".join(rng.choices(alphabet, k=n)) for n in (36, 120, 43))
+
+
+def _fill(conn: sqlite3.Connection, rows: int, digest: bool, rng: random.Random, sample: int):
+    now = datetime.now(timezone.utc)
+    picked = []
+    batch = []
+    for i in range(rows):
+        token = _fake_jwt(rng)
+        if len(picked) < sample and rng.random() < sample * 4 / rows:
+            picked.append(token)
+        expiry = now + timedelta(days=rng.randint(-30, 30))
+        batch.append((
+            i % 5000, f"user{i % 5000}", "agent",
+            hashlib.sha256(token.encode()).hexdigest() if digest else token,
+            expiry.isoformat(), (expiry - timedelta(days=30)).isoformat(),
+        ))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO active_users VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO active_users VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    return picked
+
+
+def _time_lookups(conn, sql: str, keys) -> dict:
+    latencies = []
+    for key in keys:
+        started = time.perf_counter()
+        row = conn.execute(sql, (key,)).fetchone()
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert row is not None
+    latencies.sort()
+    return {
+        "lookups": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+        "max_ms": round(latencies[-1], 3),
+    }
+
+
+def run(rows: int, lookups: int, legacy_lookups: int, seed: int) -> dict:
+    results = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, digest in (("legacy", False), ("digest", True)):
+            conn = sqlite3.connect(os.path.join(tmp, f"{name}.db"))
+            conn.execute(SCHEMA)
+            rng = random.Random(seed)
+            started = time.perf_counter()
+            tokens = _fill(conn, rows, digest, rng, max(lookups, legacy_lookups))
+            fill_s = time.perf_counter() - started
+
+            if digest:
+                conn.execute("CREATE INDEX ix_active_users_bearer_token ON active_users (bearer_token)")
+                conn.execute("CREATE INDEX ix_active_users_bearer_expiry_time ON active_users (bearer_expiry_time)")
+                keys = [hashlib.sha256(t.encode()).hexdigest() for t in tokens[:lookups]]
+                sql = "SELECT * FROM active_users WHERE bearer_token = ? LIMIT 1"
+            else:
+                keys = tokens[:legacy_lookups]
+                sql = "SELECT * FROM active_users WHERE bearer_token = ? ORDER BY created_at DESC LIMIT 1"
+
+            results[name] = _time_lookups(conn, sql, keys)
+            results[name]["fill_s"] = round(fill_s, 1)
+
+            if digest:
+                started = time.perf_counter()
+                purged = 0
+                while True:
+                    cur = conn.execute(
+                        "DELETE FROM active_users WHERE rowid IN (SELECT rowid FROM active_users "
+                        "WHERE bearer_expiry_time <= ? LIMIT 5000)",
+                        (datetime.now(timezone.utc).isoformat(),),
+                    )
+                    conn.commit()
+                    purged += cur.rowcount
+                    if cur.rowcount < 5000:
+                        break
+                results["purge"] = {"rows": purged, "seconds": round(time.perf_counter() - started, 2)}
+            conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="active_users token lookup benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Sessions in the table")
+    parser.add_argument("--lookups", type=int, default=1000, help="Indexed lookups to time")
+    parser.add_argument("--legacy-lookups", type=int, default=20, help="Full-scan lookups to time")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.rows, args.lookups, args.legacy_lookups, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+/ws/client load generator and capacity curve.
+
+Two steps. `seed` builds a SQLite stand-in for the API database. It
+creates the tables from the app's own models, adds --users verified
+agents, issues each one a JWT locally with APP_SECRET_KEY, and stores the
+token digests in active_users, the same way signin does. No passwords
+are hashed and no mail is sent. `run` opens sessions with those tokens
+against a server started on that database, and streams PCM16 chunks from
+recorded WAVs at real-time pace.
+
+    cd backend
+    APP_SECRET_KEY=bench python benchmarks/ws_load.py seed --db bench_ws.db --users 500
+    DATABASE_URL=sqlite:///bench_ws.db APP_SECRET_KEY=bench uvicorn main:app --port 8000
+    python benchmarks/ws_load.py run --tokens bench_ws_tokens.json --wav-dir samples/ \\
+        --levels 10,25,50,100,200 --duration 60 --hardware-profile "1x A10G, 8 vCPU"
+
+For every concurrency level the run reports:
+- turn latency, from the last speech chunk sent to the voice reply;
+- transcription latency, from the latest chunk sent to each transcription;
+- websocket ping RTT and how late chunks were sent (socket lag);
+- rejections: a 1013 close, or the server's capacity error.
+
+The result is a capacity curve of sessions against p95 turn latency.
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import base64
+import random
+import asyncio
+import argparse
+import platform
+
+import numpy as np
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    ms = np.array(values) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+# ---------------------------------------------------------------- seeding
+
+
+async def _seed(args):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    if not os.getenv("APP_SECRET_KEY"):
+        raise SystemExit("Set APP_SECRET_KEY to the value the server under test will use.")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from datetime import datetime, timedelta, timezone
+    from config import Base, engine, SessionLocal
+    from models import User, ActiveUsers
+    from utils import security
+
+    Base.metadata.create_all(engine)
+    expiry_time = datetime.now(timezone.utc) + timedelta(hours=args.token_hours)
+    tokens = []
+    with SessionLocal() as db:
+        for i in range(args.users):
+            username = f"{args.prefix}{i}"
+            user = db.query(User).filter(User.username == username).first()
+            if user is None:
+                user = User(
+                    first_name="Load",
+                    last_name=str(i),
+                    username=username,
+                    email=f"{username}@loadtest.local",
+                    # Never checked: sessions come from the tokens issued below.
+                    password_hash="!",
+                    role=args.role,
+                    is_verified=True,
+                )
+                db.add(user)
+                db.flush()
+
+            token = await security.create_jwt(
+                user.id, user.username, user.role, expires_in_hrs=args.token_hours
+            )
+            db.add(ActiveUsers(
+                user_id=user.id,
+                username=user.username,
+                role=user.role,
+                bearer_token=security.token_digest(token),
+                bearer_expiry_time=expiry_time,
+            ))
+            tokens.append({"username": username, "token": token})
+        db.commit()
+
+    with open(args.tokens, "w") as f:
+        json.dump(tokens, f)
+    print(json.dumps({
+        "db": os.path.abspath(args.db),
+        "users": len(tokens),
+        "tokens": os.path.abspath(args.tokens),
+        "server_env": {"DATABASE_URL": os.environ["DATABASE_URL"], "APP_SECRET_KEY": "<same as here>"},
+    }, indent=2))
+
+
+# ---------------------------------------------------------------- load
+
+
+def load_utterances(wav_dir: str, sample_rate: int, chunk_ms: int):
+    """Base64 PCM16 chunk lists, one per WAV (PCM16 WAVs; other rates are resampled linearly)."""
+    utterances = []
+    per_chunk = int(sample_rate * chunk_ms / 1000)
+    for name in sorted(os.listdir(wav_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        with wave.open(os.path.join(wav_dir, name)) as w:
+            if w.getsampwidth() != 2:
+                raise SystemExit(f"{name}: only 16-bit PCM WAVs are supported")
+            pcm = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+            pcm = pcm.reshape(-1, w.getnchannels()).mean(axis=1)
+            if w.getframerate() != sample_rate:
+                n = int(len(pcm) * sample_rate / w.getframerate())
+                pcm = np.interp(np.linspace(0, len(pcm) - 1, n), np.arange(len(pcm)), pcm)
+        pcm = pcm.astype(np.int16)
+        utterances.append([
+            base64.b64encode(pcm[i:i + per_chunk].tobytes()).decode("utf-8")
+            for i in range(0, len(pcm), per_chunk)
+        ])
+    return utterances
+
+
+class LevelStats:
+    def __init__(self):
+        self.connect = []
+        self.turns = []
+        self.transcriptions = []
+        self.ping = []
+        self.send_lag = []
+        self.connected = 0
+        self.rejected = 0
+        self.failed = 0
+        self.unanswered_turns = 0
+        self.errors = 0
+
+
+async def run_session(index: int, token: str, utterances, args, stats: LevelStats, stop_at: float):
+    import websockets
+
+    chunk_s = args.chunk_ms / 1000
+    silence = base64.b64encode(np.zeros(int(args.sample_rate * chunk_s), dtype=np.int16).tobytes()).decode()
+    state = {"last_sent": None, "speech_end": None, "replied": asyncio.Event(), "at_capacity": False}
+
+    def _message(chunk: str) -> str:
+        return json.dumps({
+            "type": "audio_chunk",
+            "data": {"current_audio_chunk": chunk, "sample_rate": args.sample_rate, "language": args.language},
+        })
+
+    async def _receive(ws):
+        async for raw in ws:
+            now = time.perf_counter()
+            message = json.loads(raw)
+            kind = message.get("type")
+            if kind == "transcription" and state["last_sent"] is not None:
+                stats.transcriptions.append(now - state["last_sent"])
+            elif kind == "voice" and state["speech_end"] is not None:
+                stats.turns.append(now - state["speech_end"])
+                state["speech_end"] = None
+                state["replied"].set()
+            elif kind == "error":
+                if "capacity" in message.get("message", "").lower():
+                    state["at_capacity"] = True
+                else:
+                    stats.errors += 1
+
+    async def _ping(ws):
+        while True:
+            await asyncio.sleep(5)
+            started = time.perf_counter()
+            await (await ws.ping())
+            stats.ping.append(time.perf_counter() - started)
+
+    async def _send(ws, chunk: str, scheduled: float):
+        stats.send_lag.append(max(0.0, time.perf_counter() - scheduled))
+        await ws.send(_message(chunk))
+        state["last_sent"] = time.perf_counter()
+
+    async def _stream(ws, receiver):
+        # Offset session starts so chunks don't all arrive on the same tick.
+        await asyncio.sleep(random.random() * chunk_s)
+        turn = index
+        while time.perf_counter() < stop_at and not receiver.done():
+            state["replied"].clear()
+            next_at = time.perf_counter()
+            for chunk in utterances[turn % len(utterances)]:
+                await _send(ws, chunk, next_at)
+                next_at += chunk_s
+                await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            state["speech_end"] = time.perf_counter()
+
+            # Muted mic until the agent answers, as the frontend keeps streaming.
+            deadline = min(state["speech_end"] + args.reply_timeout, stop_at)
+            while not state["replied"].is_set() and time.perf_counter() < deadline:
+                await _send(ws, silence, next_at)
+                next_at += chunk_s
+                try:
+                    await asyncio.wait_for(state["replied"].wait(), max(0.0, next_at - time.perf_counter()))
+                except asyncio.TimeoutError:
+                    pass
+            if not state["replied"].is_set() and not receiver.done():
+                stats.unanswered_turns += 1
+            turn += 1
+
+    close_code = connect_s = None
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(
+            f"{args.url}?token={token}", max_size=None, open_timeout=30, ping_interval=None
+        ) as ws:
+            connect_s = time.perf_counter() - started
+            receiver = asyncio.create_task(_receive(ws))
+            pinger = asyncio.create_task(_ping(ws))
+            try:
+                await _stream(ws, receiver)
+            finally:
+                pinger.cancel()
+                receiver.cancel()
+                await asyncio.gather(receiver, pinger, return_exceptions=True)
+            close_code = ws.close_code
+    except websockets.ConnectionClosed as e:
+        close_code = e.rcvd.code if e.rcvd else None
+    except Exception:
+        stats.failed += 1
+        return
+
+    if state["at_capacity"] or close_code == 1013:
+        stats.rejected += 1
+    elif connect_s is not None:
+        stats.connected += 1
+        stats.connect.append(connect_s)
+    else:
+        stats.failed += 1
+
+
+async def run_level(sessions: int, tokens, utterances, args) -> dict:
+    stats = LevelStats()
+    started = time.perf_counter()
+    stop_at = started + args.ramp_s + args.duration
+    tasks = []
+    for i in range(sessions):
+        tasks.append(asyncio.create_task(
+            run_session(i, tokens[i % len(tokens)]["token"], utterances, args, stats, stop_at)
+        ))
+        await asyncio.sleep(args.ramp_s / sessions)
+    await asyncio.gather(*tasks)
+
+    return {
+        "sessions": sessions,
+        "connected": stats.connected,
+        "rejected": stats.rejected,
+        "failed": stats.failed,
+        "server_errors": stats.errors,
+        "turns": len(stats.turns),
+        "unanswered_turns": stats.unanswered_turns,
+        "turn_latency": _percentiles(stats.turns),
+        "transcription_latency": _percentiles(stats.transcriptions),
+        "ping_rtt": _percentiles(stats.ping),
+        "send_lag": _percentiles(stats.send_lag),
+        "connect": _percentiles(stats.connect),
+        "wall_s": round(time.perf_counter() - started, 1),
+    }
+
+
+async def _run(args):
+    with open(args.tokens) as f:
+        tokens = json.load(f)
+    utterances = load_utterances(args.wav_dir, args.sample_rate, args.chunk_ms)
+    if not utterances:
+        raise SystemExit(f"No .wav files in {args.wav_dir}")
+
+    levels = [int(n) for n in args.levels.split(",")]
+    curve = []
+    for sessions in levels:
+        result = await run_level(sessions, tokens, utterances, args)
+        curve.append(result)
+        print(json.dumps({k: result[k] for k in ("sessions", "connected", "rejected", "turns")}
+                         | {"turn_p95_ms": result["turn_latency"].get("p95_ms")}), file=sys.stderr)
+        await asyncio.sleep(args.cooldown_s)
+
+    within_slo = [
+        r["sessions"] for r in curve
+        if r["turn_latency"].get("p95_ms", float("inf")) <= args.slo_ms and not r["rejected"]
+    ]
+    report = {
+        "hardware_profile": args.hardware_profile,
+        "client": {"host": platform.node(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "url": args.url, "duration_s": args.duration, "ramp_s": args.ramp_s, "chunk_ms": args.chunk_ms,
+            "sample_rate": args.sample_rate, "utterances": len(utterances), "slo_ms": args.slo_ms,
+        },
+        "capacity_curve": [
+            {"sessions": r["sessions"], "turn_p95_ms": r["turn_latency"].get("p95_ms"), "rejected": r["rejected"]}
+            for r in curve
+        ],
+        "max_sessions_within_slo": max(within_slo) if within_slo else 0,
+        "levels": curve,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/ws/client load generator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed = sub.add_parser("seed", help="Create the SQLite stand-in with users and live sessions")
+    seed.add_argument("--db", default="bench_ws.db")
+    seed.add_argument("--tokens", default="bench_ws_tokens.json", help="Where to write the issued tokens")
+    seed.add_argument("--users", type=int, default=200)
+    seed.add_argument("--prefix", default="loadtest")
+    seed.add_argument("--role", default="agent")
+    seed.add_argument("--token-hours", type=int, default=12)
+
+    run = sub.add_parser("run", help="Stream audio over concurrent sessions and build the capacity curve")
+    run.add_argument("--url", default="ws://localhost:8000/ws/client")
+    run.add_argument("--tokens", default="bench_ws_tokens.json")
+    run.add_argument("--wav-dir", required=True, help="Folder of 16-bit PCM .wav utterances")
+    run.add_argument("--levels", default="10,25,50,100", help="Comma-separated concurrent session counts")
+    run.add_argument("--duration", type=float, default=60.0, help="Seconds at full load per level")
+    run.add_argument("--ramp-s", type=float, default=10.0, help="Seconds to open a level's connections over")
+    run.add_argument("--cooldown-s", type=float, default=10.0)
+    run.add_argument("--chunk-ms", type=int, default=1000)
+    run.add_argument("--sample-rate", type=int, default=16000)
+    run.add_argument("--language", default="auto")
+    run.add_argument("--reply-timeout", type=float, default=30.0)
+    run.add_argument("--slo-ms", type=float, default=3000.0, help="p95 turn latency target")
+    run.add_argument("--hardware-profile", default="unspecified", help="Label for the server hardware")
+    run.add_argument("--output")
+
+    args = parser.parse_args()
+    asyncio.run(_seed(args) if args.command == "seed" else _run(args))
+
+
+if __name__ == "__main__":
+    main()
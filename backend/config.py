@@ -1,7 +1,9 @@
 import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 load_dotenv()
 
@@ -22,9 +24,63 @@ ADMIN = {
 PERMISSIONS = os.getenv("PERMISSIONS")
 
 
-engine = create_engine(DATABASE_URL, echo=False)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _pool_kwargs(url) -> dict:
+    # SQLite (local stand-in) uses SQLAlchemy's default file/memory pools.
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def async_database_url(url: str) -> str:
+    """Same database, through the asyncio driver (asyncpg / aiosqlite)."""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=driver).render_as_string(hide_password=False) if driver else str(url)
+
+
+_sync_url = make_url(DATABASE_URL)
+
+# Sync engine: alembic, worker processes and offline tools.
+engine = create_engine(DATABASE_URL, echo=False, **_pool_kwargs(_sync_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: everything running on the API's event loop.
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL), echo=False, **_pool_kwargs(_sync_url)
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+def pool_metrics() -> dict:
+    metrics = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        stats = {"status": pool.status()}
+        for attr in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, attr):
+                stats[attr] = getattr(pool, attr)()
+        metrics[name] = stats
+    return metrics
+
 Base = declarative_base()
 
 smtp_port = os.getenv("SMTP_PORT")
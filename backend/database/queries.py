@@ -1,11 +1,12 @@
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from config import ADMIN
 from utils import security, smtp_setup
+from utils.auth_cache import user_cache, user_snapshot, invalidate_user
 from datetime import datetime, timedelta, timezone
-import asyncio
 from models import User, AdminVerification, VerificationStatus, PasswordResetOTP, ActiveUsers, CallAnalysis
 from fastapi import HTTPException
-from sqlalchemy import or_
+from sqlalchemy import or_, select, delete, update
 import logging
 import json
 
@@ -15,20 +16,32 @@ logger = logging.getLogger(__name__)
 
 
 
-def signup(db: Session, first_name, last_name, username, email, password, role="agent", auto_verify=False):
+async def _first(db: AsyncSession, stmt):
+    result = await db.execute(stmt.limit(1))
+    return result.scalars().first()
+
+
+async def _user_by_login(db: AsyncSession, username_or_email: str):
+    return await _first(
+        db,
+        select(User).where((User.username == username_or_email) | (User.email == username_or_email)),
+    )
+
+
+async def signup(db: AsyncSession, first_name, last_name, username, email, password, role="agent", auto_verify=False):
     if role == ADMIN["role"]:
-        exists = db.query(User).filter(User.role == ADMIN["role"]).first()
+        exists = await _first(db, select(User).where(User.role == ADMIN["role"]))
         if exists:
             return {"error": "Admin already exists. Cannot create another."}
         auto_verify = True
 
-    if db.query(User).filter((User.username == username) | (User.email == email)).first():
+    if await _first(db, select(User).where((User.username == username) | (User.email == email))):
         return {"error": "User already exists."}
 
     if len(password) < 8:
         return {"error": "Required atleast 8 characters in a password."}
 
-    hashed_password = asyncio.run(security.hash_password(password))
+    hashed_password = await security.hash_password(password)
 
     user = User(
         first_name=first_name,
@@ -40,15 +53,15 @@ def signup(db: Session, first_name, last_name, username, email, password, role="
         is_verified=auto_verify,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     if role != ADMIN["role"]:
         verification = AdminVerification(
             user_id=user.id, verified_flag=VerificationStatus.pending
         )
         db.add(verification)
-        db.commit()
+        await db.commit()
 
     return {
         "message": "Signup successful. Awaiting admin verification.",
@@ -56,11 +69,8 @@ def signup(db: Session, first_name, last_name, username, email, password, role="
     }
 
 
-async def signin(db: Session, username_or_email, password):
-    user = db.query(User).filter(
-        (User.username == username_or_email) | (
-            User.email == username_or_email)
-    ).first()
+async def signin(db: AsyncSession, username_or_email, password):
+    user = await _user_by_login(db, username_or_email)
 
     if not user or not await security.verify_password(password, user.password_hash):
         return {"error": "Invalid username/email or password"}
@@ -76,12 +86,11 @@ async def signin(db: Session, username_or_email, password):
         user_id=user.id,
         username=user.username,
         role=user.role,
-        bearer_token=token,
+        bearer_token=security.token_digest(token),
         bearer_expiry_time=expiry_time
     )
     db.add(active_session)
-    db.commit()
-    db.refresh(active_session)
+    await db.commit()
 
     return {
         "message": "Signin successful",
@@ -91,13 +100,13 @@ async def signin(db: Session, username_or_email, password):
     }
 
 
-async def update_user_verification(db: Session, username: str, verified: bool, verified_by: str):
-    user = db.query(User).filter(User.username == username).first()
+async def update_user_verification(db: AsyncSession, username: str, verified: bool, verified_by: str):
+    user = await _first(db, select(User).where(User.username == username))
     if not user:
         return {"error": f"User '{username}' not found."}
     user_role = user.role
 
-    admin = db.query(User).filter(User.username == verified_by).first()
+    admin = await _first(db, select(User).where(User.username == verified_by))
     if not admin:
         return {"error": f"Verifier '{verified_by}' not found."}
 
@@ -111,10 +120,12 @@ async def update_user_verification(db: Session, username: str, verified: bool, v
         return {"error": f"Manager '{verified_by}' is not allowed to verify '{user_role}' users."}
 
     user.is_verified = verified
-    db.commit()
+    await db.commit()
+    invalidate_user(user.id, user.username)
 
-    verification = db.query(AdminVerification).filter_by(
-        user_id=user.id).first()
+    verification = await _first(
+        db, select(AdminVerification).where(AdminVerification.user_id == user.id)
+    )
     if not verification:
         return {"error": f"User '{username}' not found in Admin_Verification table."}
 
@@ -122,7 +133,7 @@ async def update_user_verification(db: Session, username: str, verified: bool, v
         VerificationStatus.approved if verified else VerificationStatus.rejected
     )
     verification.verified_by = verified_by
-    db.commit()
+    await db.commit()
 
     return {
         "message": (
@@ -132,24 +143,23 @@ async def update_user_verification(db: Session, username: str, verified: bool, v
     }
 
 
-async def forgot_password_request(db: Session, username_or_email: str):
-    user = db.query(User).filter(
-        (User.username == username_or_email) | (
-            User.email == username_or_email)
-    ).first()
+async def forgot_password_request(db: AsyncSession, username_or_email: str):
+    user = await _user_by_login(db, username_or_email)
     if not user:
         return {"error": "User not found."}
 
     if not user.is_verified:
         return {"error": f"Account '{user.email}' is not verified yet. Cannot reset password."}
 
-    db.query(PasswordResetOTP).filter(
-        PasswordResetOTP.user_id == user.id,
-        PasswordResetOTP.expires_at > datetime.now(timezone.utc),
-        PasswordResetOTP.used_once == False
-    ).update(
-        {PasswordResetOTP.expires_at: datetime.now(timezone.utc)},
-        synchronize_session=False
+    await db.execute(
+        update(PasswordResetOTP)
+        .where(
+            PasswordResetOTP.user_id == user.id,
+            PasswordResetOTP.expires_at > datetime.now(timezone.utc),
+            PasswordResetOTP.used_once == False
+        )
+        .values(expires_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
     )
 
     otp_code = await security.generate_otp()
@@ -161,8 +171,7 @@ async def forgot_password_request(db: Session, username_or_email: str):
     )
 
     db.add(otp_entry)
-    db.commit()
-    db.refresh(otp_entry)
+    await db.commit()
 
     email_status = await smtp_setup.send_email(
         user.email,
@@ -176,24 +185,22 @@ async def forgot_password_request(db: Session, username_or_email: str):
         return {"error": f"Failed to send OTP email to {user.email}."}
 
 
-async def verify_otp(db: Session, username_or_email: str, otp: str):
-    user = db.query(User).filter(
-        (User.username == username_or_email) | (User.email == username_or_email)
-    ).first()
+async def verify_otp(db: AsyncSession, username_or_email: str, otp: str):
+    user = await _user_by_login(db, username_or_email)
     if not user:
         return {"error": "Username not found."}
 
     if not user.is_verified:
         return {"error": f"Account '{user.email}' is not verified yet. Cannot reset password."}
 
-    otp_entry = (
-        db.query(PasswordResetOTP)
-        .filter(
+    otp_entry = await _first(
+        db,
+        select(PasswordResetOTP)
+        .where(
             PasswordResetOTP.user_id == user.id,
             PasswordResetOTP.otp_code == otp
         )
         .order_by(PasswordResetOTP.created_at.desc())
-        .first()
     )
 
     if not otp_entry:
@@ -206,28 +213,28 @@ async def verify_otp(db: Session, username_or_email: str, otp: str):
         return {"error": "OTP expired. Please request a new one."}
 
     otp_entry.used_once = True
-    db.commit()
+    await db.commit()
 
     temp_password = await security.generate_temp_password()
     user.password_hash = await security.hash_password(temp_password)
-    db.commit()
+    await db.commit()
 
     token = await security.create_jwt(user.id, user.username, user.role)
     temp_time = 5
     expiry_time = datetime.now(timezone.utc) + timedelta(minutes=temp_time)
 
-    db.query(ActiveUsers).filter(ActiveUsers.user_id == user.id).delete()
+    await db.execute(delete(ActiveUsers).where(ActiveUsers.user_id == user.id))
 
     active_session = ActiveUsers(
         user_id=user.id,
         username=user.username,
         role=user.role,
-        bearer_token=token,
+        bearer_token=security.token_digest(token),
         bearer_expiry_time=expiry_time
     )
     db.add(active_session)
-    db.commit()
-    db.refresh(active_session)
+    await db.commit()
+    invalidate_user(user.id, user.username)
 
     return {
         "message": "OTP verified successfully. Use temp password to login and change password.",
@@ -237,19 +244,21 @@ async def verify_otp(db: Session, username_or_email: str, otp: str):
     }
 
 
-async def verify_bearer_token(db: Session, token: str):
+async def verify_bearer_token(db: AsyncSession, token: str):
 
-    latest_session = (
-        db.query(ActiveUsers)
-        .filter(ActiveUsers.bearer_token == token)
-        .order_by(ActiveUsers.created_at.desc())
-        .first()
+    latest_session = await _first(
+        db, select(ActiveUsers).where(ActiveUsers.bearer_token == security.token_digest(token))
     )
 
     if not latest_session:
         return {"error": "Invalid or expired token."}
 
-    if latest_session.bearer_expiry_time <= datetime.now(timezone.utc):
+    expiry_time = latest_session.bearer_expiry_time
+    if expiry_time.tzinfo is None:
+        # SQLite (local stand-in) hands back naive datetimes; they were written as UTC.
+        expiry_time = expiry_time.replace(tzinfo=timezone.utc)
+
+    if expiry_time <= datetime.now(timezone.utc):
         return {"error": "Token expired."}
 
     return {
@@ -257,14 +266,55 @@ async def verify_bearer_token(db: Session, token: str):
         "user_id": latest_session.user_id,
         "username": latest_session.username,
         "role": latest_session.role,
+        "bearer_expiry_time": expiry_time,
     }
 
 
-async def change_password(db: Session, username_or_email: str, current_password: str, new_password: str):
-    user = db.query(User).filter(
-        (User.username == username_or_email) | (
-            User.email == username_or_email)
-    ).first()
+async def purge_expired_sessions(db: AsyncSession, batch_size: int = 5000) -> int:
+    """Delete expired active_users rows in batches, so no single statement holds long locks."""
+    purged = 0
+    while True:
+        expired = (
+            select(ActiveUsers.bearer_token)
+            .where(ActiveUsers.bearer_expiry_time <= datetime.now(timezone.utc))
+            .limit(batch_size)
+        )
+        tokens = (await db.execute(expired)).scalars().all()
+        if not tokens:
+            return purged
+        result = await db.execute(
+            delete(ActiveUsers)
+            .where(
+                ActiveUsers.bearer_token.in_(tokens),
+                ActiveUsers.bearer_expiry_time <= datetime.now(timezone.utc),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        purged += result.rowcount
+        if len(tokens) < batch_size:
+            return purged
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    """
+    Read-only snapshot of a user, served from the auth cache when possible.
+    Query the User model directly for anything that writes to the row.
+    """
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+
+    row = await _first(db, select(User).where(User.username == username))
+    if not row:
+        return None
+    user = user_snapshot(row)
+    user_cache.set(username, user)
+    return user
+
+
+async def change_password(db: AsyncSession, username_or_email: str, current_password: str, new_password: str):
+    user = await _user_by_login(db, username_or_email)
 
     if not user:
         return {"error": "User not found."}
@@ -276,18 +326,17 @@ async def change_password(db: Session, username_or_email: str, current_password:
         return {"error": "Password must be at least 8 characters long."}
 
     user.password_hash = await security.hash_password(new_password)
-    db.commit()
+    await db.commit()
+    invalidate_user(user.id, user.username)
     return {"message": "Password updated successfully."}
 
 
-async def remove_user(db: Session, current_user_id: int, current_user_role: str, username_or_email: str):
-    current_user = db.query(User).filter(User.username == current_user_id).first()
+async def remove_user(db: AsyncSession, current_user_id: int, current_user_role: str, username_or_email: str):
+    current_user = await _first(db, select(User).where(User.username == current_user_id))
     if not current_user:
         return {"error": "Current user not found."}
 
-    target_user = db.query(User).filter(
-        (User.username == username_or_email) | (User.email == username_or_email)
-    ).first()
+    target_user = await _user_by_login(db, username_or_email)
 
     if not target_user:
         return {"error": "User not found."}
@@ -307,35 +356,37 @@ async def remove_user(db: Session, current_user_id: int, current_user_role: str,
     if current_role == "admin" and target_role == "admin":
         return {"error": "Admin users cannot remove other admins."}
 
-    db.delete(target_user)
-    db.commit()
+    target_id, target_username = target_user.id, target_user.username
+    await db.delete(target_user)
+    await db.commit()
+    invalidate_user(target_id, target_username)
 
-    return {"message": f"User '{target_user.username}' has been removed successfully."}
+    return {"message": f"User '{target_username}' has been removed successfully."}
 
 
-async def add_voice_sample(db: Session, username: str, file_path: str):
+async def add_voice_sample(db: AsyncSession, username: str, file_path: str):
     """
     Save the audio file path against the given user_id in DB.
     """
-    user = db.query(User).filter(User.username == username).first()
+    user = await _first(db, select(User).where(User.username == username))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     try:
         user.voice_sample_path = file_path 
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        invalidate_user(user.id, user.username)
 
         return {"message": f"Voice sample saved for user '{user.username}'", "voice_path": file_path}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to save voice sample: {str(e)}")
     
 
-async def get_verified_users(db: Session, requester_role: str):
+async def get_verified_users(db: AsyncSession, requester_role: str):
     try:
         query = (
-            db.query(
+            select(
                 User.id,
                 User.first_name,
                 User.last_name,
@@ -346,7 +397,7 @@ async def get_verified_users(db: Session, requester_role: str):
                 AdminVerification.verified_flag,
             )
             .join(AdminVerification, AdminVerification.user_id == User.id)
-            .filter(
+            .where(
                 or_(
                     AdminVerification.verified_flag == VerificationStatus.pending,
                     AdminVerification.verified_flag == VerificationStatus.approved,
@@ -355,13 +406,13 @@ async def get_verified_users(db: Session, requester_role: str):
         )
 
         if requester_role == "manager":
-            query = query.filter(User.role == "agent")
+            query = query.where(User.role == "agent")
         elif requester_role == "admin":
-            query = query.filter(User.role.in_(["agent", "manager"]))
+            query = query.where(User.role.in_(["agent", "manager"]))
         else:
             return {"error": f"Role '{requester_role}' is not allowed to view users."}
 
-        results = query.all()
+        results = (await db.execute(query)).all()
 
         return [
             {
@@ -382,49 +433,79 @@ async def get_verified_users(db: Session, requester_role: str):
         return {"error": f"Unexpected error: {str(e)}"}
 
 
-async def save_call_analysis(db: Session, user_id: int, call_id: str, analysis_result: dict):
+def _call_analysis_row(user_id: int, call_id: str, analysis_result: dict) -> CallAnalysis:
+    agent_dialogs_transcriptions = []
+    cx_dialogs_transcriptions = []
+
+    for segment in analysis_result['segments']:
+        agent_dialogs = segment.get('agent', [])
+        cx_dialogs = segment.get('customer', [])
+
+        if agent_dialogs:
+            agent_dialogs_transcriptions.extend(agent_dialogs)
+        if cx_dialogs:
+            cx_dialogs_transcriptions.extend(cx_dialogs)
+
+    cx_sentiment_result = analysis_result.get('cx_sentiment_result', {})
+    positive_sentiment_percentage = float(cx_sentiment_result.get("positive", "0.0%").strip('%'))
+    negative_sentiment_percentage = float(cx_sentiment_result.get("negative", "0.0%").strip('%'))
+    neutral_sentiment_percentage = float(cx_sentiment_result.get("neutral", "0.0%").strip('%'))
+
+    sentiments = {
+        "positive": positive_sentiment_percentage,
+        "negative": negative_sentiment_percentage,
+        "neutral": neutral_sentiment_percentage
+    }
+
+    max_sentiment_type = max(sentiments, key=sentiments.get)
+
+    return CallAnalysis(
+        user_id=user_id,
+        call_id=call_id,
+        agent_dialogs=json.dumps(agent_dialogs_transcriptions),
+        customer_dialogs=json.dumps(cx_dialogs_transcriptions), 
+        cx_neutral_percentage=neutral_sentiment_percentage,
+        cx_positive_percentage=positive_sentiment_percentage,
+        cx_negative_percentage=negative_sentiment_percentage,
+        overall_call_sentiment=max_sentiment_type
+    )
+
+
+async def save_call_analysis(db: AsyncSession, user_id: int, call_id: str, analysis_result: dict):
     try:
-        agent_dialogs_transcriptions = []
-        cx_dialogs_transcriptions = []
-
-        for segment in analysis_result['segments']:
-            agent_dialogs = segment.get('agent', [])
-            cx_dialogs = segment.get('customer', [])
-
-            if agent_dialogs:
-                agent_dialogs_transcriptions.extend(agent_dialogs)
-            if cx_dialogs:
-                cx_dialogs_transcriptions.extend(cx_dialogs)
-
-        cx_sentiment_result = analysis_result.get('cx_sentiment_result', {})
-        positive_sentiment_percentage = float(cx_sentiment_result.get("positive", "0.0%").strip('%'))
-        negative_sentiment_percentage = float(cx_sentiment_result.get("negative", "0.0%").strip('%'))
-        neutral_sentiment_percentage = float(cx_sentiment_result.get("neutral", "0.0%").strip('%'))
-
-        sentiments = {
-            "positive": positive_sentiment_percentage,
-            "negative": negative_sentiment_percentage,
-            "neutral": neutral_sentiment_percentage
-        }
-
-        max_sentiment_type = max(sentiments, key=sentiments.get)
-
-        new_analysis = CallAnalysis(
-            user_id=user_id,
-            call_id=call_id,
-            agent_dialogs=json.dumps(agent_dialogs_transcriptions),
-            customer_dialogs=json.dumps(cx_dialogs_transcriptions), 
-            cx_neutral_percentage=neutral_sentiment_percentage,
-            cx_positive_percentage=positive_sentiment_percentage,
-            cx_negative_percentage=negative_sentiment_percentage,
-            overall_call_sentiment=max_sentiment_type
-        )
+        new_analysis = _call_analysis_row(user_id, call_id, analysis_result)
 
         db.add(new_analysis)
-        db.commit()
-        db.refresh(new_analysis)
+        await db.commit()
         return new_analysis
 
     except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to save analysis result: {str(e)}")
+
+
+# Sync helpers below are for offline tools running on config.SessionLocal.
+
+def save_call_analyses_bulk(db: Session, rows: list, replace: bool = False):
+    """
+    Insert many analyses in one transaction. `rows` holds (user_id, call_id,
+    analysis_result) tuples. Used by the offline batch runner; with `replace`
+    earlier analyses of the same calls are deleted first.
+    """
+    try:
+        if replace:
+            for user_id, call_id, _ in rows:
+                db.query(CallAnalysis).filter(
+                    CallAnalysis.user_id == user_id, CallAnalysis.call_id == call_id
+                ).delete(synchronize_session=False)
+        db.add_all([_call_analysis_row(*row) for row in rows])
+        db.commit()
+        return len(rows)
+    except Exception:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to save analysis result: {str(e)}")
\ No newline at end of file
+        raise
+
+
+def get_user_ids(db: Session, usernames):
+    rows = db.query(User.id, User.username).filter(User.username.in_(list(usernames))).all()
+    return {r.username: r.id for r in rows}
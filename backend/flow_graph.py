@@ -4,6 +4,15 @@ from langgraph.graph import StateGraph, END
 import asyncio
 from typing import Dict, Optional
 
+from metrics import metrics
+from turn_tracing import span as turn_span
+
+
+def _reply_tokens(state, default=50):
+    """Token budget for a reply node, capped by the session's quality level."""
+    cap = state.get("max_reply_tokens")
+    return min(default, cap) if cap else default
+
 
 async def check_balance(state):
     """Handle balance check queries."""
@@ -30,6 +39,7 @@ async def check_balance(state):
         llm_pipeline=state["llm"],
         sm={**sm, "chat_history": [system_info]},
         interal_flow=False,
+        max_tokens=_reply_tokens(state),
     )
 
     state["result"] = llm_response
@@ -59,6 +69,7 @@ async def query_status(state):
         llm_pipeline=state["llm"],
         sm={**sm, "chat_history": [system_info]},
         interal_flow=False,
+        max_tokens=_reply_tokens(state),
     )
 
     state["result"] = llm_response
@@ -92,6 +103,7 @@ async def generate_complaint(state):
         llm_pipeline=state["llm"],
         sm={**sm, "chat_history": [system_info]},
         interal_flow=False,
+        max_tokens=_reply_tokens(state),
     )
 
     state["result"] = llm_response
@@ -120,6 +132,7 @@ async def route_to_call_agent(state):
         llm_pipeline=state["llm"],
         sm={**sm, "chat_history": [system_info]},
         interal_flow=False,
+        max_tokens=_reply_tokens(state),
     )
 
     state["result"] = llm_response
@@ -173,7 +186,7 @@ async def ai_reply(state):
         llm_pipeline=state["llm"],
         sm={"chat_history": messages},
         interal_flow=False,
-        max_tokens=300,
+        max_tokens=_reply_tokens(state, 300),
     )
 
     state["result"] = llm_response
@@ -200,6 +213,7 @@ async def end_conversation(state):
         llm_pipeline=state["llm"],
         sm={**sm, "chat_history": [system_info]},
         interal_flow=False,
+        max_tokens=_reply_tokens(state),
     )
 
     state["result"] = llm_response
@@ -281,6 +295,7 @@ class State(dict):
     language: str
     llm: object
     tokenizer: object
+    max_reply_tokens: Optional[int]
 
 
 workflow = StateGraph(State)
@@ -332,9 +347,13 @@ async def llm_call(
             messages, tokenize=False, add_generation_prompt=True
         )
 
-    outputs = await asyncio.to_thread(
-        llm_pipeline, prompt, max_new_tokens=max_tokens, do_sample=False
-    )
+    stage = "llm_router" if interal_flow else "llm_action"
+    with metrics.timed("realtime", stage), turn_span(
+        "router" if interal_flow else "action_llm", max_tokens=max_tokens
+    ):
+        outputs = await asyncio.to_thread(
+            llm_pipeline, prompt, max_new_tokens=max_tokens, do_sample=False
+        )
     raw_text = outputs[0].get("generated_text", "")
     # print("==== RAW TEXT ====")
     # print(raw_text)
@@ -362,7 +381,7 @@ class Agent:
             return "ar"  # default fallback
         return "ar" if lang.iso_code_639_1.name.lower() == "ar" else "en"
 
-    async def invoke(self, sm, llm_tokenizer, llm_pipeline):
+    async def invoke(self, sm, llm_tokenizer, llm_pipeline, max_reply_tokens=None):
         print("======ENTERED IN AGENTIC AI======")
 
         user_id = sm["user_id"]
@@ -381,6 +400,7 @@ class Agent:
                 "language": full_form_lang,
                 "llm": llm_pipeline,
                 "tokenizer": llm_tokenizer,
+                "max_reply_tokens": max_reply_tokens,
             }
         )
 
@@ -0,0 +1,204 @@
+import os
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+LIVE_SENTIMENT_ENABLED = os.getenv("LIVE_SENTIMENT_ENABLED", "false").lower() == "true"
+LIVE_SENTIMENT_BATCH_SIZE = int(os.getenv("LIVE_SENTIMENT_BATCH_SIZE", "8"))
+LIVE_SENTIMENT_MAX_WAIT_MS = 200  # how long a batch waits for more utterances
+LIVE_SENTIMENT_MAX_PENDING = 256  # utterances beyond this are dropped, not queued
+LIVE_SENTIMENT_MAX_UTTERANCE_S = 30.0  # audio kept per utterance for emotion scoring
+LIVE_SENTIMENT_SR = 16000
+# The worker is shared by every session; one client that isn't draining can hold it this long at most.
+LIVE_SENTIMENT_SEND_TIMEOUT_S = float(os.getenv("LIVE_SENTIMENT_SEND_TIMEOUT_S", "0.5"))
+
+
+class LiveSentiment:
+    """
+    Scores finished utterances of /ws/client sessions off the hot path.
+
+    VoiceProcessor hands over the transcript and speech audio it already has
+    for an utterance; a background task scores them in batches with the same
+    text/audio models as the post-call analyzer, pushes a "sentiment" event
+    to the client and keeps a rolling per-session timeline in the analyzer's
+    output format.
+    """
+
+    def __init__(
+        self,
+        send_message: Optional[Callable[[dict, str], Awaitable[None]]] = None,
+        on_session_end: Optional[Callable[[str, Any, dict], Awaitable[None]]] = None,
+    ):
+        # Deferred so the models only load in processes that enable this stage.
+        from nltk.tokenize import sent_tokenize
+        from sentiment_scoring import SentimentScorer, customer_sentiment_summary
+
+        self._sent_tokenize = sent_tokenize
+        self._summary = customer_sentiment_summary
+        self.scorer = SentimentScorer()
+        self.send_message = send_message
+        self.on_session_end = on_session_end
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending = 0
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.send_timeouts = 0
+        self.send_errors = 0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._worker())
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+
+    def submit(self, session_id: str, text: str, audio: np.ndarray, start: float, end: float):
+        """Queue a finished utterance. Never blocks; drops when the stage is behind."""
+        if self._pending >= LIVE_SENTIMENT_MAX_PENDING:
+            self.dropped += 1
+            logger.warning("Live sentiment backlog full, dropping utterance of %s", session_id)
+            return
+        self._pending += 1
+        self._queue.put_nowait(
+            {"session_id": session_id, "text": text, "audio": audio, "start": start, "end": end}
+        )
+
+    def end_session(self, session_id: str, user_id: Any):
+        """Finalise a session once every utterance queued before this call is scored."""
+        self._queue.put_nowait({"session_id": session_id, "end_of_session": True, "user_id": user_id})
+
+    def summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        return {
+            "segments": session["timeline"],
+            "cx_sentiment_result": self._summary(session["timeline"]),
+        }
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + LIVE_SENTIMENT_MAX_WAIT_MS / 1000
+        while len(batch) < LIVE_SENTIMENT_BATCH_SIZE and not batch[-1].get("end_of_session"):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, utterances: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Runs in a worker thread: one text batch and one audio batch per call."""
+        sentences = [self._sent_tokenize(u["text"]) or [u["text"]] for u in utterances]
+        text_sents = iter(self.scorer._get_text_sentiments([s for sents in sentences for s in sents]))
+
+        # Utterances without audio get no span: padding a zero-length span would
+        # score the neighbouring utterances' audio in the concatenated batch.
+        voiced = [u for u in utterances if len(u["audio"])]
+        audio = np.concatenate([u["audio"] for u in voiced]) if voiced else np.zeros(0, dtype=np.float32)
+        spans, offset = [], 0
+        for u in voiced:
+            spans.append((offset / LIVE_SENTIMENT_SR, (offset + len(u["audio"])) / LIVE_SENTIMENT_SR))
+            offset += len(u["audio"])
+        voiced_sents = iter(self.scorer._get_audio_sentiments(audio, LIVE_SENTIMENT_SR, spans) if spans else [])
+        audio_sents = [next(voiced_sents) if len(u["audio"]) else ("neu", 0.0) for u in utterances]
+
+        results = []
+        for u, sents, audio_sent in zip(utterances, sentences, audio_sents):
+            rows = []
+            for sent in sents:
+                final_sent, final_conf = self.scorer._fuse_sentiment(next(text_sents), audio_sent)
+                rows.append(
+                    {
+                        "sentence": sent,
+                        "sentiment": final_sent,
+                        "confidence": round(final_conf, 2),
+                        "start": round(u["start"], 2),
+                        "end": round(u["end"], 2),
+                    }
+                )
+            results.append(rows)
+        return results
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            utterances = [item for item in batch if not item.get("end_of_session")]
+            self._pending -= len(utterances)
+
+            if utterances:
+                for u, rows in zip(utterances, await self._score_batch(utterances)):
+                    if rows is None:
+                        continue
+                    try:
+                        await self._publish(u, rows)
+                    except Exception:
+                        # A closed socket must not end the worker every session shares.
+                        self.send_errors += 1
+                        logger.exception("Failed to publish live sentiment of %s", u["session_id"])
+
+            for item in batch:
+                if item.get("end_of_session"):
+                    await self._finish(item["session_id"], item["user_id"])
+
+    async def _score_batch(self, utterances: List[Dict[str, Any]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """Score as one batch; if that fails, one utterance at a time so only the bad ones are lost."""
+        try:
+            return await asyncio.to_thread(self._score, utterances)
+        except Exception:
+            if len(utterances) == 1:
+                logger.exception("Live sentiment failed for an utterance of %s", utterances[0]["session_id"])
+                return [None]
+            logger.exception("Live sentiment failed for a batch of %d, retrying one by one", len(utterances))
+
+        results = []
+        for u in utterances:
+            try:
+                results.extend(await asyncio.to_thread(self._score, [u]))
+            except Exception:
+                logger.exception("Live sentiment failed for an utterance of %s", u["session_id"])
+                results.append(None)
+        return results
+
+    async def _publish(self, utterance: Dict[str, Any], rows: List[Dict[str, Any]]):
+        session_id = utterance["session_id"]
+        session = self._sessions.setdefault(session_id, {"timeline": []})
+        session["timeline"].append(
+            {"customer": rows, "start": round(utterance["start"], 2), "end": round(utterance["end"], 2)}
+        )
+
+        if self.send_message:
+            message = {
+                "type": "sentiment",
+                "data": {
+                    "utterance": rows,
+                    "cx_sentiment_result": self._summary(session["timeline"]),
+                },
+            }
+            try:
+                await asyncio.wait_for(self.send_message(message, session_id), LIVE_SENTIMENT_SEND_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                # The timeline still has it; the session's summary is stored in full.
+                self.send_timeouts += 1
+                logger.warning("Outbound queue of %s is full, live sentiment update not delivered", session_id)
+
+    async def _finish(self, session_id: str, user_id: Any):
+        summary = self.summary(session_id)
+        self._sessions.pop(session_id, None)
+        if summary is None or self.on_session_end is None:
+            return
+        try:
+            await self.on_session_end(session_id, user_id, summary)
+        except Exception:
+            logger.exception("Failed to store live sentiment summary of %s", session_id)
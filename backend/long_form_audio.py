@@ -0,0 +1,201 @@
+import struct
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torchaudio
+import noisereduce as nr
+
+
+logger = logging.getLogger(__name__)
+
+
+def _wav_layout(path: str) -> Optional[Dict]:
+    """Parse a RIFF/WAVE header. Returns None for anything we can't memory-map."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if audio_format == 0xFFFE and len(body) >= 26:  # WAVE_FORMAT_EXTENSIBLE
+                    audio_format = struct.unpack("<H", body[24:26])[0]
+                fmt = (audio_format, channels, sample_rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                audio_format, channels, sample_rate, bits = fmt
+                if audio_format == 1 and bits == 16:
+                    dtype = np.dtype("<i2")
+                elif audio_format == 3 and bits == 32:
+                    dtype = np.dtype("<f4")
+                else:
+                    return None
+                frame_bytes = dtype.itemsize * channels
+                return {
+                    "offset": f.tell(),
+                    "frames": chunk_size // frame_bytes,
+                    "channels": channels,
+                    "sample_rate": sample_rate,
+                    "dtype": dtype,
+                }
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+class MemmapWav:
+    """
+    Read-only view of a PCM WAV file as mono float32 at `target_sr`.
+
+    Indexing is in `target_sr` samples: `audio[a:b]` maps only that span of
+    the file, converts it, and unmaps it again. Resident memory therefore
+    tracks the size of the slice, not the length of the recording.
+    """
+
+    def __init__(self, path: str, layout: Dict, target_sr: int = 16000, denoise: bool = True):
+        self.path = path
+        self.layout = layout
+        self.target_sr = target_sr
+        self.denoise = denoise
+        self.source_sr = layout["sample_rate"]
+        self.duration = layout["frames"] / self.source_sr
+
+    @classmethod
+    def open(cls, path: str, target_sr: int = 16000, denoise: bool = True):
+        layout = _wav_layout(path)
+        if layout is None:
+            return None
+        return cls(path, layout, target_sr=target_sr, denoise=denoise)
+
+    def __len__(self):
+        return int(self.duration * self.target_sr)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("MemmapWav only supports slicing")
+        start, stop, _ = key.indices(len(self))
+        return self.read(start, stop)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        n_out = max(0, stop - start)
+        if n_out == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        layout = self.layout
+        src_start = start * self.source_sr // self.target_sr
+        src_stop = min(layout["frames"], -(-stop * self.source_sr // self.target_sr))
+        if src_stop <= src_start:
+            return np.zeros(n_out, dtype=np.float32)
+
+        frame_bytes = layout["dtype"].itemsize * layout["channels"]
+        mapped = np.memmap(
+            self.path,
+            mode="r",
+            dtype=layout["dtype"],
+            offset=layout["offset"] + src_start * frame_bytes,
+            shape=(src_stop - src_start, layout["channels"]),
+        )
+        try:
+            audio = mapped.mean(axis=1, dtype=np.float32)
+        finally:
+            del mapped
+        if layout["dtype"].kind == "i":
+            audio /= 32768.0
+
+        if self.source_sr != self.target_sr:
+            audio = torchaudio.functional.resample(
+                torch.from_numpy(audio), self.source_sr, self.target_sr
+            ).numpy()
+
+        if len(audio) >= n_out:
+            audio = audio[:n_out]
+        else:
+            audio = np.pad(audio, (0, n_out - len(audio)))
+
+        if self.denoise and n_out > self.target_sr // 10:
+            audio = nr.reduce_noise(y=audio, sr=self.target_sr)
+        return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+class SpeakerStitcher:
+    """
+    Keeps speaker labels consistent across independently diarized windows by
+    matching each window's centroids to running global centroids.
+    """
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self._sums: List[np.ndarray] = []
+        self._counts: List[int] = []
+
+    def _normalised(self) -> np.ndarray:
+        centroids = np.stack([s / c for s, c in zip(self._sums, self._counts)])
+        return centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def assign(self, local_centroids: Dict[str, np.ndarray]) -> Dict[str, str]:
+        """Map window-local labels to global labels (one-to-one within a window)."""
+        mapping = {}
+        local = {
+            label: c / np.linalg.norm(c)
+            for label, c in local_centroids.items()
+            if np.linalg.norm(c) > 0
+        }
+
+        if self._sums and local:
+            labels = list(local)
+            scores = np.stack([local[label] for label in labels]) @ self._normalised().T
+            taken = set()
+            for flat in np.argsort(-scores, axis=None):
+                i, j = np.unravel_index(flat, scores.shape)
+                if scores[i, j] < self.threshold:
+                    break
+                if labels[i] in mapping or j in taken:
+                    continue
+                mapping[labels[i]] = j
+                taken.add(j)
+
+        for label, centroid in local.items():
+            j = mapping.get(label)
+            if j is None:
+                self._sums.append(centroid.copy())
+                self._counts.append(1)
+                mapping[label] = len(self._sums) - 1
+            else:
+                self._sums[j] += centroid
+                self._counts[j] += 1
+
+        return {label: f"SPEAKER_{j:02d}" for label, j in mapping.items()}
+
+    def centroids(self) -> Dict[str, np.ndarray]:
+        return {
+            f"SPEAKER_{j:02d}": (s / c).astype(np.float32)
+            for j, (s, c) in enumerate(zip(self._sums, self._counts))
+        }
+
+
+def window_bounds(duration: float, window_s: float, overlap_s: float) -> List[Tuple[float, float, float, float]]:
+    """
+    (start, end, keep_from, keep_to) per window. Turns are kept only inside
+    [keep_from, keep_to), which splits every overlap at its midpoint.
+    """
+    step = window_s - overlap_s
+    bounds = []
+    start = 0.0
+    while True:
+        end = min(start + window_s, duration)
+        last = end >= duration
+        keep_from = 0.0 if start == 0.0 else start + overlap_s / 2
+        keep_to = duration if last else end - overlap_s / 2
+        bounds.append((start, end, keep_from, keep_to))
+        if last:
+            return bounds
+        start += step
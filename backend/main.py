@@ -1,9 +1,13 @@
 import os
-from datetime import datetime
+import base64
+from datetime import datetime, timezone
 from utils.security import permissions, decode_token
+from utils.auth_cache import token_cache
+from utils.hashing import hashing_executor
 from contextlib import asynccontextmanager
 
 import asyncio
+import time
 from fastapi import (
     FastAPI,
     WebSocket,
@@ -17,23 +21,23 @@ from fastapi import (
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from sqlalchemy.orm import Session
-from models import User
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.queries import (signup, signin, update_user_verification, forgot_password_request, 
                               verify_otp, verify_bearer_token, change_password, remove_user, 
-                              add_voice_sample, get_verified_users, save_call_analysis)
+                              add_voice_sample, get_verified_users, save_call_analysis,
+                              get_user_by_username, purge_expired_sessions)
 
-from config import SessionLocal
+from config import AsyncSessionLocal, async_engine, pool_metrics
 
 
 # from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, FileResponse
 
 import json
 import logging
 
 import uuid
-from typing import List, Dict
+from typing import Dict
 import uuid
 from pydantic import BaseModel
 from typing import Optional
@@ -41,9 +45,17 @@ from typing import Optional
 
 
 # ============== MY IMPORTS...
-from voice_processor import VoiceProcessor, SentimentAnalyzer 
-# from voice_processor import SentimentAnalyzer
+from voice_processor import VoiceProcessor, tts_cache
 from voice_registration import UserVoiceRegistration, UserVoiceProcessing
+from speaker_embeddings import AgentVoiceEmbeddings
+from analysis_jobs import AnalysisJobStore, AnalysisJobQueue, JOB_DONE, spool_stream, UploadTooLarge
+from live_sentiment import LiveSentiment, LIVE_SENTIMENT_ENABLED
+from session_actor import SessionInputActor
+from admission import admission
+from quality_ladder import quality_ladder
+from metrics import metrics, SystemMetricsWriter, METRICS_TOKEN
+from turn_tracing import turn_tracer, current_turn
+from profiling import profiler, ARTIFACTS as PROFILE_ARTIFACTS
 
 
 logging.basicConfig(
@@ -57,14 +69,54 @@ logger = logging.getLogger(__name__)
 
 RBAC_PERMISSIONS = None
 
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "64"))
+COALESCED_MESSAGE_TYPES = ("sentiment",)  # merged while queued, see ClientConnection
+SESSION_PURGE_INTERVAL_S = int(os.getenv("SESSION_PURGE_INTERVAL_S", "3600"))
+SESSION_PURGE_BATCH_SIZE = int(os.getenv("SESSION_PURGE_BATCH_SIZE", "5000"))
+
+analysis_queue = AnalysisJobQueue(AnalysisJobStore())
+system_metrics_writer = SystemMetricsWriter(metrics, active_connections=lambda: len(manager.connections))
+
+
+async def purge_expired_sessions_periodically():
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                purged = await purge_expired_sessions(db, SESSION_PURGE_BATCH_SIZE)
+            if purged:
+                logger.info("Purged %d expired sessions from active_users.", purged)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Expired session purge failed")
+        await asyncio.sleep(SESSION_PURGE_INTERVAL_S)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global RBAC_PERMISSIONS
     RBAC_PERMISSIONS = await permissions()
     logger.info("RBAC permissions loaded at startup.")
+    await analysis_queue.start()
+    logger.info("Call analysis queue started with %d workers.", analysis_queue.max_workers)
+    session_purge_task = asyncio.create_task(purge_expired_sessions_periodically())
+    system_metrics_task = asyncio.create_task(system_metrics_writer.run(async_engine))
+    if live_sentiment:
+        await live_sentiment.start()
+        logger.info("Live sentiment stage started.")
     yield
     logger.info("Shutting down Sound360 API...")
+    session_purge_task.cancel()
+    system_metrics_task.cancel()
+    try:
+        # Let the writer flush the rows it still holds.
+        await system_metrics_task
+    except asyncio.CancelledError:
+        pass
+    await analysis_queue.shutdown()
+    hashing_executor.shutdown()
+    if live_sentiment:
+        await live_sentiment.shutdown()
 
 
 app = FastAPI(
@@ -88,6 +140,21 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.observe_request(
+            request.method, route.path if route else "unmatched", status, time.perf_counter() - started
+        )
+
+
 os.makedirs("agents_audios", exist_ok=True)
 app.mount("/static", StaticFiles(directory="agents_audios"), name="static")
 
@@ -97,9 +164,115 @@ app.mount("/static", StaticFiles(directory="agents_audios"), name="static")
 # os.environ["PATH"] = ffmpeg_path + os.pathsep + os.environ.get("PATH", "")
 
 
+class ClientConnection:
+    """
+    One connected socket with its own bounded outbound queue and writer task,
+    so a slow client only ever delays its own messages.
+
+    Backpressure: sentiment updates still waiting in the queue are merged into
+    one, keeping every utterance and only the latest summary; everything else
+    (transcript deltas, voice, errors) is never merged or dropped and makes the
+    producer wait for room instead.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str, maxsize: int = WS_OUTBOUND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # type -> the queued message of that type later updates are merged into
+        self._pending: Dict[str, dict] = {}
+        self.closed = False
+
+        self.sent = 0
+        self.coalesced = 0
+        self.backpressure_waits = 0
+        self.max_depth = 0
+
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @staticmethod
+    def _merge(pending: dict, message: dict):
+        # Every utterance in order; the running summary replaces the older one.
+        pending["data"]["utterance"] = pending["data"]["utterance"] + message["data"]["utterance"]
+        pending["data"]["cx_sentiment_result"] = message["data"]["cx_sentiment_result"]
+
+    async def enqueue(self, message):
+        if self.closed:
+            return
+
+        kind = message.get("type") if isinstance(message, dict) else None
+        if kind in COALESCED_MESSAGE_TYPES:
+            pending = self._pending.get(kind)
+            if pending is not None:
+                self._merge(pending, message)
+                self.coalesced += 1
+                return
+            message = {"type": kind, "data": dict(message["data"])}
+
+        # A turn's first reply frame is traced until the writer has sent it.
+        turn = current_turn.get() if kind == "voice" else None
+        if turn is not None and not turn.claim_frame():
+            turn = None
+
+        if self.queue.full():
+            # For coalesced types: nothing queued to merge into, so wait like any other message.
+            self.backpressure_waits += 1
+        try:
+            await self.queue.put((message, turn))
+        except asyncio.CancelledError:
+            if turn is not None:
+                turn_tracer.frame_sent(turn, error="cancelled before queued")
+            raise
+        # Only once it is actually queued: a cancelled put must not leave a merge target behind.
+        if kind in COALESCED_MESSAGE_TYPES:
+            self._pending[kind] = message
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _write_loop(self):
+        while True:
+            message, turn = await self.queue.get()
+            if isinstance(message, dict) and self._pending.get(message.get("type")) is message:
+                del self._pending[message["type"]]
+            try:
+                text = message if isinstance(message, str) else json.dumps(message)
+                await self.websocket.send_text(text)
+                self.sent += 1
+            except BaseException as e:
+                if turn is not None:
+                    turn_tracer.frame_sent(turn, error=f"{type(e).__name__}: {e}")
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                logger.error(f"Error sending to session_id={self.session_id}: {e}")
+                self._discard()
+                return
+            if turn is not None:
+                turn_tracer.frame_sent(turn, **{"ws.queue_depth": self.queue.qsize()})
+
+    def _discard(self):
+        self.closed = True
+        # Unblock producers waiting for room on a socket that is gone.
+        while not self.queue.empty():
+            _, turn = self.queue.get_nowait()
+            if turn is not None:
+                turn_tracer.frame_sent(turn, error="connection closed")
+
+    def close(self):
+        self._writer.cancel()
+        self._discard()
+
+    def metrics(self) -> Dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+
 class ProductionConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.connections: Dict[str, ClientConnection] = {}
         self.client_sessions: Dict[WebSocket, str] = {}
         self.customer_info: Dict[str, Dict] = {}
 
@@ -107,7 +280,7 @@ class ProductionConnectionManager:
         self, websocket: WebSocket, session_id: str, customer_info: Dict = None
     ):
         # await websocket.accept()
-        self.active_connections.append(websocket)
+        self.connections[session_id] = ClientConnection(websocket, session_id)
         self.client_sessions[websocket] = session_id
         if customer_info:
             self.customer_info[session_id] = customer_info
@@ -115,61 +288,90 @@ class ProductionConnectionManager:
         logger.info(f"Customer connected: {session_id}")
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            session_id = self.client_sessions.pop(websocket, "unknown")
-            self.customer_info.pop(session_id, None)
-            logger.info(f"Customer disconnected: {session_id}")
-            voice_processor.clear_session_memory(session_id)
+        session_id = self.client_sessions.pop(websocket, None)
+        if session_id is None:
+            return
+        connection = self.connections.pop(session_id, None)
+        if connection:
+            connection.close()
+        self.customer_info.pop(session_id, None)
+        logger.info(f"Customer disconnected: {session_id}")
+        voice_processor.clear_session_memory(session_id)
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
+        connection = self.connections.get(self.client_sessions.get(websocket))
+        if connection:
+            # Keep ordering with queued messages; never write the socket from two tasks.
+            await connection.enqueue(message)
+            return
         try:
             await websocket.send_text(message)
         except Exception as e:
             logger.error(f"Error sending message: {e}")
 
     async def send_data(self, message: dict, session_id: str):
-        try:
-            websocket = None
-            for ws, sid in self.client_sessions.items():
-                if sid == session_id:
-                    websocket = ws
-                    break
-
-            if websocket:
-                await websocket.send_text(json.dumps(message))
-            else:
-                logger.warning(
-                    f"No active websocket for session_id: {session_id}")
-
-        except Exception as e:
-            logger.error(
-                f"Error sending transcription for session_id={session_id}: {e}",
-                exc_info=True,
-            )
+        connection = self.connections.get(session_id)
+        if connection:
+            await connection.enqueue(message)
+        else:
+            logger.warning(
+                f"No active websocket for session_id: {session_id}")
 
     async def broadcast_to_admins(self, message: str):
         # Broadcast to admin connections only
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+        for connection in list(self.connections.values()):
+            await connection.enqueue(message)
+
+    def metrics(self) -> Dict:
+        per_session = {sid: c.metrics() for sid, c in self.connections.items()}
+        depths = [m["queue_depth"] for m in per_session.values()]
+        return {
+            "connections": len(per_session),
+            "max_queue_depth": max(depths, default=0),
+            "total_queued": sum(depths),
+            "sessions": per_session,
+        }
+
+
+async def save_live_sentiment_summary(session_id: str, user_id: int, summary: dict):
+    """Store a /ws/client session's live sentiment like a post-call analysis."""
+    async with AsyncSessionLocal() as db:
+        await save_call_analysis(db, user_id, f"live-{session_id}", summary)
 
 
 manager = ProductionConnectionManager()
-voice_processor = VoiceProcessor(send_message=manager.send_data)
+session_inputs: Dict[str, SessionInputActor] = {}
+live_sentiment = (
+    LiveSentiment(send_message=manager.send_data, on_session_end=save_live_sentiment_summary)
+    if LIVE_SENTIMENT_ENABLED
+    else None
+)
+voice_processor = VoiceProcessor(send_message=manager.send_data, live_sentiment=live_sentiment)
 
+metrics.register_gauge("sound360_active_connections", "Open websocket sessions.", lambda: len(manager.connections))
+metrics.register_gauge(
+    "sound360_session_input_lag_ms",
+    "Worst input lag across /ws/client sessions.",
+    lambda: max((a.current_lag_ms() for a in session_inputs.values()), default=0.0),
+)
+metrics.register_gauge(
+    "sound360_stage_in_flight",
+    "Requests holding or waiting for a shared inference stage.",
+    lambda: {name: s.in_use + s.waiting for name, s in admission.stages.items()},
+    label="stage",
+)
+metrics.register_gauge(
+    "sound360_analysis_queue_depth", "Queued call analysis jobs.", lambda: analysis_queue.metrics()["queue_depth"]
+)
+metrics.register_gauge("sound360_quality_level", "Node quality ladder level (0 = full).", lambda: quality_ladder.node.level)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-async def validate_bearer_token(authorization: str, db: Session):
+async def validate_bearer_token(authorization: str, db: AsyncSession):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(
             status_code=401, detail="Missing or invalid Authorization header")
@@ -181,16 +383,24 @@ async def validate_bearer_token(authorization: str, db: Session):
         logger.warning(f"Token decode failed: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    # Signature and exp are checked above on every call; the active session
+    # lookup is cached until the session is invalidated or expires.
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
     verification = await verify_bearer_token(db, token)
     if "error" in verification:
         raise HTTPException(status_code=401, detail=verification["error"])
 
+    session_ttl = (verification["bearer_expiry_time"] - datetime.now(timezone.utc)).total_seconds()
+    token_cache.set(token, (token_data, verification), ttl_s=session_ttl)
     return token_data, verification
 
 
 
 @app.post("/api/signup")
-async def register_user(request: Request, db: Session = Depends(get_db)):
+async def register_user(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         try:
             data = await request.json()
@@ -204,8 +414,7 @@ async def register_user(request: Request, db: Session = Depends(get_db)):
             raise HTTPException(
                 status_code=400, detail=f"Missing required fields: {', '.join(missing)}")
 
-        status = await asyncio.to_thread(
-            signup,
+        status = await signup(
             db,
             data["first_name"],
             data["last_name"],
@@ -228,7 +437,7 @@ async def register_user(request: Request, db: Session = Depends(get_db)):
 
 
 @app.post("/api/signin")
-async def login(request: Request, db: Session = Depends(get_db)):
+async def login(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         try:
             data = await request.json()
@@ -260,7 +469,7 @@ async def login(request: Request, db: Session = Depends(get_db)):
 async def verify_user(
     request: Request,
     authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         token_data, _ = await validate_bearer_token(authorization, db)
@@ -303,7 +512,7 @@ async def verify_user(
 async def change_user_password(
     request: Request,
     authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         token_data, _ = await validate_bearer_token(authorization, db)
@@ -338,7 +547,7 @@ async def change_user_password(
 async def remove_existing_user(
     request: Request,
     authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         token_data, _ = await validate_bearer_token(authorization, db)
@@ -377,7 +586,7 @@ async def remove_existing_user(
 
 
 @app.post("/api/forgot_password")
-async def forgot_password(request: Request, db: Session = Depends(get_db)):
+async def forgot_password(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         try:
             data = await request.json()
@@ -404,7 +613,7 @@ async def forgot_password(request: Request, db: Session = Depends(get_db)):
 
 
 @app.post("/api/verify_otp")
-async def verify_user_otp(request: Request, db: Session = Depends(get_db)):
+async def verify_user_otp(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         try:
             data = await request.json()
@@ -443,9 +652,16 @@ async def health_event_stream(request: Request):
                 health_data = {
                     "status": "healthy",
                     "timestamp": datetime.now().isoformat(),
-                    "active_connections": len(manager.active_connections),
+                    "active_connections": len(manager.connections),
+                    "websocket_queues": manager.metrics(),
+                    "session_inputs": {sid: a.metrics() for sid, a in session_inputs.items()},
+                    "capacity": admission.capacity(),
+                    "quality": {**quality_ladder.metrics(), "tts_cache": tts_cache.metrics()},
                     "version": "1.0.0",
-                    "performance": []
+                    "performance": metrics.summary(),
+                    "analysis_queue": analysis_queue.metrics(),
+                    "db_pool": pool_metrics(),
+                    "password_hashing": hashing_executor.metrics(),
                 }
 
                 yield f"data: {json.dumps(health_data)}\n\n"
@@ -477,7 +693,7 @@ async def health_stream(request: Request):
 async def register_agent_voice(
     agent: UserVoiceRegistration,
     authorization: str = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         if not authorization or not authorization.startswith("Bearer "):
@@ -487,7 +703,7 @@ async def register_agent_voice(
         username = token_data.get("username")
         user_role = token_data.get("role")
 
-        user = db.query(User).filter(User.username == username).first()
+        user = await get_user_by_username(db, username)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -495,10 +711,24 @@ async def register_agent_voice(
         if user_role not in allowed_roles:
             raise HTTPException(status_code=403, detail="Not allowed to register voice")
 
-        voice_processor = UserVoiceProcessing(username=username, request_data=agent.model_dump())
-        file_path = voice_processor.save_audio(target_sr=24000, denoise=True)
+        voice_processing = UserVoiceProcessing(username=username, request_data=agent.model_dump())
+        file_path = voice_processing.save_audio(target_sr=24000, denoise=True)
 
-        db_response = await add_voice_sample(db, username, file_path)
+        try:
+            # A previous sample at this path may have left its embedding behind.
+            AgentVoiceEmbeddings.invalidate(file_path)
+            try:
+                await analysis_queue.precompute_agent_voice(file_path)
+            except Exception:
+                # Not fatal: the first analysis computes and stores it instead.
+                logger.exception("Could not precompute speaker embedding for %s", username)
+
+            db_response = await add_voice_sample(db, username, file_path)
+        except BaseException:
+            # Otherwise every retry would get 409 for a sample that was never registered.
+            AgentVoiceEmbeddings.invalidate(file_path)
+            os.remove(file_path)
+            raise
 
         logger.info(f"User {username} registered. Audio saved at {file_path}")
         return {
@@ -516,7 +746,7 @@ async def register_agent_voice(
 
 
 @app.get("/api/get_all_users")
-async def get_all_users(db: Session = Depends(get_db), authorization: str = Header(None)):
+async def get_all_users(db: AsyncSession = Depends(get_db), authorization: str = Header(None)):
     """
     Get the list of all agents (pending/approved).
     """
@@ -544,15 +774,12 @@ async def get_all_users(db: Session = Depends(get_db), authorization: str = Head
         raise HTTPException(status_code=500, detail="Unexpected server error")
 
 
-@app.post("/api/call_analyzer")
-async def call_analyzer(
-    request: Request,
-    db: Session = Depends(get_db),
-    authorization: str = Header(None)
-):
-    """
-    Analyze the call and save the detailed output.
-    """
+def _write_spool_file(path: str, call_recording_b64: str):
+    with open(path, "wb") as f:
+        f.write(base64.b64decode(call_recording_b64, validate=True))
+
+
+async def _authorize_call_analysis(authorization: str, db: AsyncSession, endpoint: str):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
 
@@ -563,11 +790,11 @@ async def call_analyzer(
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token validation failed: {str(e)}")
 
-    allowed_roles = RBAC_PERMISSIONS["api_endpoints"].get("POST /api/call_analyzer", [])
+    allowed_roles = RBAC_PERMISSIONS["api_endpoints"].get(endpoint, [])
     if user_role not in allowed_roles:
         raise HTTPException(status_code=403, detail="Access denied. Contact administration.")
 
-    user = db.query(User).filter(User.username == username).first()
+    user = await get_user_by_username(db, username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -576,6 +803,139 @@ async def call_analyzer(
             status_code=400,
             detail="No voice sample found. Please upload a voice sample of yours before analyzing calls."
         )
+    return user
+
+
+async def _authorize_admin(authorization: str, db: AsyncSession, endpoint: str) -> dict:
+    token_data, _ = await validate_bearer_token(authorization, db)
+    allowed_roles = RBAC_PERMISSIONS["api_endpoints"].get(endpoint, [])
+    if token_data.get("role") not in allowed_roles:
+        raise HTTPException(status_code=403, detail="Access denied. Contact administration.")
+    return token_data
+
+
+def _admit_analysis():
+    admitted, retry_after, reason = admission.admit_analysis(analysis_queue.metrics())
+    if not admitted:
+        raise HTTPException(
+            status_code=503, detail=reason, headers={"Retry-After": str(int(retry_after))}
+        )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: str = Header(None)):
+    """Stage histograms, request counters and gauges in Prometheus text format."""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/admin/turns/slowest")
+async def slowest_turns(
+    limit: int = 20,
+    session_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None),
+):
+    """Slowest traced voice turns (end of speech to first reply frame) with their span breakdown."""
+    await _authorize_admin(authorization, db, "GET /api/admin/turns/slowest")
+    limit = max(1, min(limit, 200))
+    turns = await asyncio.to_thread(turn_tracer.slowest, limit, session_id)
+    return {"count": len(turns), "turns": turns}
+
+
+@app.post("/api/admin/profile", status_code=202)
+async def start_profile(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None),
+):
+    """
+    Start a time-boxed capture on the worker serving this request: stack
+    samples of every thread, plus optionally a torch.profiler trace and a
+    tracemalloc diff. Poll /api/admin/profile/{capture_id} for the artifacts.
+    """
+    await _authorize_admin(authorization, db, "POST /api/admin/profile")
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+
+    try:
+        capture = profiler.start(
+            duration_s=float(data.get("duration_s", 30)),
+            interval_ms=float(data.get("interval_ms", 10)),
+            torch_trace=bool(data.get("torch", False)),
+            memory=bool(data.get("tracemalloc", True)),
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="duration_s and interval_ms must be numbers")
+    return capture.describe()
+
+
+@app.get("/api/admin/profile/{capture_id}")
+async def profile_status(
+    capture_id: str,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None),
+):
+    await _authorize_admin(authorization, db, "GET /api/admin/profile")
+    capture = profiler.captures.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found")
+    return capture.describe()
+
+
+@app.get("/api/admin/profile/{capture_id}/{artifact}")
+async def profile_artifact(
+    capture_id: str,
+    artifact: str,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None),
+):
+    await _authorize_admin(authorization, db, "GET /api/admin/profile")
+    path = profiler.artifact_path(capture_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return FileResponse(
+        path, media_type=PROFILE_ARTIFACTS[artifact], filename=f"{capture_id}-{artifact}"
+    )
+
+
+@app.get("/api/capacity")
+async def capacity():
+    """
+    Current headroom for load balancers: 200 while new sessions are admitted,
+    503 (with Retry-After) while they would be rejected.
+    """
+    report = admission.capacity(analysis_queue.metrics())
+    if report["accepting_sessions"]:
+        return report
+    return JSONResponse(
+        status_code=503, content=report, headers={"Retry-After": str(int(report["retry_after_s"]))}
+    )
+
+
+def _duplicate_call(call_id: str, job_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=409, detail=f"Call '{call_id}' is already queued or analyzed (job_id {job_id})."
+    )
+
+
+@app.post("/api/call_analyzer", status_code=202)
+async def call_analyzer(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None)
+):
+    """
+    Queue the call for analysis. Poll /api/call_analyzer/jobs/{job_id} for the outcome.
+    Prefer /api/call_analyzer/upload for long recordings.
+    """
+    user = await _authorize_call_analysis(authorization, db, "POST /api/call_analyzer")
+    username = user.username
 
     try:
         request_data = await request.json()
@@ -586,33 +946,131 @@ async def call_analyzer(
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid request body: {str(e)}")
 
+    existing = await asyncio.to_thread(analysis_queue.store.find_active, username, call_id)
+    if existing:
+        raise _duplicate_call(call_id, existing)
+
+    _admit_analysis()
+
+    spool_path = analysis_queue.spool_path(uuid.uuid4().hex)
     try:
-        sentiment_anlayzer = SentimentAnalyzer(
-            agent_id=username,
-            call_id=call_id,
-            call_recording_b64=call_recording_b64,
-        )
-        analyzed_result = await sentiment_anlayzer.analyze()
+        await asyncio.to_thread(_write_spool_file, spool_path, call_recording_b64)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Call analysis failed: {str(e)}")
-    
-    with open("test.json", "w") as file:
-        json.dump(analyzed_result, file, indent=4)
+        raise HTTPException(status_code=400, detail=f"Invalid call recording data: {str(e)}")
+
+    job_id, created = await analysis_queue.submit(user.id, username, call_id, spool_path)
+    if not created:
+        # Lost a race with a concurrent upload of the same call.
+        os.remove(spool_path)
+        raise _duplicate_call(call_id, job_id)
+
+    return {
+        "status": "queued",
+        "job_id": job_id,
+    }
+
+
+@app.post("/api/call_analyzer/upload", status_code=202)
+async def call_analyzer_upload(
+    request: Request,
+    call_id: str,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None),
+    x_content_sha256: Optional[str] = Header(None),
+):
+    """
+    Queue a call for analysis from a raw audio request body (any format
+    torchaudio can read). The body is streamed to disk, never held in memory.
+    """
+    user = await _authorize_call_analysis(authorization, db, "POST /api/call_analyzer/upload")
+    username = user.username
 
+    existing = await asyncio.to_thread(analysis_queue.store.find_active, username, call_id)
+    if existing:
+        raise _duplicate_call(call_id, existing)
+
+    _admit_analysis()
+
+    spool_path = analysis_queue.spool_path(uuid.uuid4().hex)
     try:
-        saved_analysis = await save_call_analysis(db, user.id, call_id, analyzed_result)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to persist analysis result: {str(e)}")
+        size, sha256 = await spool_stream(request.stream(), spool_path)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    if size == 0:
+        os.remove(spool_path)
+        raise HTTPException(status_code=400, detail="Empty call recording")
+
+    if x_content_sha256 and x_content_sha256.lower() != sha256:
+        os.remove(spool_path)
+        raise HTTPException(status_code=400, detail="Checksum mismatch, upload corrupted")
 
+    job_id, created = await analysis_queue.submit(user.id, username, call_id, spool_path)
+    if not created:
+        # Lost a race with a concurrent upload of the same call.
+        os.remove(spool_path)
+        raise _duplicate_call(call_id, job_id)
+
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "bytes": size,
+        "sha256": sha256,
+    }
+
+
+async def _get_authorized_job(job_id: str, authorization: str, db: AsyncSession, endpoint: str):
+    token_data, _ = await validate_bearer_token(authorization, db)
+    allowed_roles = RBAC_PERMISSIONS["api_endpoints"].get(endpoint, [])
+    if token_data.get("role") not in allowed_roles:
+        raise HTTPException(status_code=403, detail="Access denied. Contact administration.")
+
+    job = await asyncio.to_thread(analysis_queue.store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if token_data.get("role") == "agent" and job["user_id"] != token_data.get("user_id"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/call_analyzer/jobs/{job_id}")
+async def call_analyzer_job_status(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None)
+):
+    job = await _get_authorized_job(job_id, authorization, db, "GET /api/call_analyzer/jobs")
+    return {
+        "job_id": job["job_id"],
+        "call_id": job["call_id"],
+        "status": job["status"],
+        "error": job["error"],
+        "stage_timings": job["stage_timings"],
+        "stage_memory": job["stage_memory"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+@app.get("/api/call_analyzer/jobs/{job_id}/result")
+async def call_analyzer_job_result(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    authorization: str = Header(None)
+):
+    job = await _get_authorized_job(job_id, authorization, db, "GET /api/call_analyzer/jobs")
+    if job["status"] != JOB_DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, no result yet.")
     return {
         "status": "success",
-        "response": saved_analysis,
-        "saved_id": saved_analysis.id
+        "response": job["result"],
+        "saved_id": job["saved_id"],
     }
 
 
 @app.websocket("/ws/client")
-async def websocket_customer_endpoint(websocket: WebSocket, db: Session = Depends(get_db)):
+async def websocket_customer_endpoint(websocket: WebSocket, db: AsyncSession = Depends(get_db)):
 
     await websocket.accept()  
     
@@ -649,8 +1107,8 @@ async def websocket_customer_endpoint(websocket: WebSocket, db: Session = Depend
         await websocket.close()  
         raise HTTPException(status_code=403, detail="Access denied. Contact administration.")
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    user = await get_user_by_username(db, username)
+    if not user or user.id != user_id:
         await manager.send_personal_message(
             json.dumps({
                 "type": "error",
@@ -661,10 +1119,46 @@ async def websocket_customer_endpoint(websocket: WebSocket, db: Session = Depend
         )
         await websocket.close() 
         raise HTTPException(status_code=404, detail="User not found")
+
+    # Hand the pooled connection back; the socket may stay open for the whole call.
+    await db.close()
+
+    admitted, retry_after, reason = admission.admit_session()
+    if not admitted:
+        await manager.send_personal_message(
+            json.dumps({
+                "type": "error",
+                "message": "Server is at capacity. Try again later.",
+                "error_details": reason,
+                "retry_after": round(retry_after),
+            }),
+            websocket,
+        )
+        # 1013: Try Again Later
+        await websocket.close(code=1013, reason="Server at capacity")
+        return
     
     session_id = str(uuid.uuid4())  
     await manager.connect(websocket, session_id)  
 
+    async def _report_processing_error(e: Exception):
+        await manager.send_personal_message(
+            json.dumps({
+                "type": "error",
+                "message": "Audio processing failed.",
+                "error_details": str(e)
+            }),
+            websocket,
+        )
+
+    # Reads and ASR are decoupled: this loop only decodes and queues frames.
+    session_input = SessionInputActor(
+        session_id,
+        lambda args: voice_processor.processing(arguments=args),
+        on_error=_report_processing_error,
+    )
+    session_inputs[session_id] = session_input
+
     try:
         while True:
             
@@ -686,19 +1180,11 @@ async def websocket_customer_endpoint(websocket: WebSocket, db: Session = Depend
                         "language_preference": language_preference,
                     }
 
-                    processing_result = await voice_processor.processing(arguments=args)
-                    print("Processing Result:", processing_result)
+                    await session_input.submit(args)
 
                 except Exception as e:
                     logger.error(f"Customer audio processing error: {e}")
-                    await manager.send_personal_message(
-                        json.dumps({
-                            "type": "error",
-                            "message": "Audio processing failed.",
-                            "error_details": str(e)
-                        }),
-                        websocket,
-                    )
+                    await _report_processing_error(e)
 
             else:
                 await manager.send_personal_message(
@@ -712,7 +1198,6 @@ async def websocket_customer_endpoint(websocket: WebSocket, db: Session = Depend
 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected.")
-        manager.disconnect(websocket)
 
     except Exception as e:
         logger.error(f"Customer WebSocket error: {e}")
@@ -724,6 +1209,13 @@ async def websocket_customer_endpoint(websocket: WebSocket, db: Session = Depend
             }),
             websocket,
         )
+
+    finally:
+        # Also when the error report above fails on a dead socket: the admission
+        # slot and the actor must never outlive the session.
+        session_inputs.pop(session_id, None)
+        session_input.close()
+        admission.release_session()
         manager.disconnect(websocket)
 
 
@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import bisect
+import asyncio
+import logging
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import sqlalchemy as sa
+
+
+logger = logging.getLogger(__name__)
+
+
+METRICS_SAMPLE_INTERVAL_S = float(os.getenv("METRICS_SAMPLE_INTERVAL_S", "15"))
+METRICS_FLUSH_INTERVAL_S = float(os.getenv("METRICS_FLUSH_INTERVAL_S", "60"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # bearer token for /metrics; empty = open
+
+# Seconds; from sub-millisecond decode up to whole-call analysis stages.
+STAGE_BUCKETS_S = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0,
+)
+
+system_metrics_table = sa.table(
+    "system_metrics",
+    sa.column("timestamp", sa.DateTime(timezone=True)),
+    sa.column("cpu_usage", sa.Float),
+    sa.column("memory_usage", sa.Float),
+    sa.column("gpu_usage", sa.Float),
+    sa.column("active_connections", sa.Integer),
+    sa.column("request_per_minutes", sa.Integer),
+    sa.column("response_time", sa.Float),
+    sa.column("error_rate", sa.Float),
+)
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=STAGE_BUCKETS_S):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def totals(self) -> Tuple[float, int]:
+        """(sum, count) over every label set."""
+        return (
+            sum(series[1] for series in self.series.values()),
+            sum(series[2] for series in self.series.values()),
+        )
+
+    def quantile(self, labels: Tuple[str, ...], q: float) -> float:
+        """Bucket upper bound at quantile q, as Prometheus' histogram_quantile would estimate."""
+        counts, _, count = self.series[labels]
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process stage histograms and counters for the realtime and analysis
+    pipelines. Everything runs on the event loop (or is fed back to it), so no
+    locking; gauges are read from callbacks at scrape time.
+    """
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "sound360_stage_seconds", "Time spent in each pipeline stage.", ("pipeline", "stage")
+        )
+        self.stage_errors = Counter(
+            "sound360_stage_errors_total", "Pipeline stages that raised.", ("pipeline", "stage")
+        )
+        self.http_seconds = Histogram(
+            "sound360_http_request_seconds", "HTTP request latency.", ("method", "route")
+        )
+        self.http_requests = Counter(
+            "sound360_http_requests_total", "HTTP requests served.", ("method", "route", "status")
+        )
+        self._counters: List[Counter] = []
+        self._gauges: List[Tuple[str, str, str, Callable[[], Any]]] = []
+
+    @contextmanager
+    def timed(self, pipeline: str, stage: str):
+        """Time a block as one observation of `stage`; works around awaits too."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.stage_errors.inc(pipeline, stage)
+            raise
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, pipeline, stage)
+
+    def observe_stage(self, pipeline: str, stage: str, seconds: float):
+        self.stage_seconds.observe(seconds, pipeline, stage)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        self.http_seconds.observe(seconds, method, route)
+        self.http_requests.inc(method, route, str(status))
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """A counter owned by another module, rendered along with the built-in series."""
+        counter = Counter(name, help, labelnames)
+        self._counters.append(counter)
+        return counter
+
+    def register_gauge(self, name: str, help: str, read: Callable[[], Any], label: str = "key"):
+        """`read` returns a number, or a {label_value: number} dict."""
+        self._gauges.append((name, help, label, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.stage_seconds, self.stage_errors, self.http_seconds, self.http_requests, *self._counters):
+            lines.extend(metric.render())
+        for name, help, label, read in self._gauges:
+            try:
+                value = read()
+            except Exception as e:
+                logger.warning("Gauge %s failed: %s", name, e)
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for key, v in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{key}"}} {v}')
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-stage count, mean and p50/p95/p99 for the health stream."""
+        rows = []
+        for labels, (_, total, count) in sorted(self.stage_seconds.series.items()):
+            pipeline, stage = labels
+            rows.append({
+                "pipeline": pipeline,
+                "stage": stage,
+                "count": count,
+                "errors": int(self.stage_errors.values.get(labels, 0)),
+                "mean_ms": round(total / count * 1000, 2) if count else 0.0,
+                "p50_ms": round(self.stage_seconds.quantile(labels, 0.50) * 1000, 2),
+                "p95_ms": round(self.stage_seconds.quantile(labels, 0.95) * 1000, 2),
+                "p99_ms": round(self.stage_seconds.quantile(labels, 0.99) * 1000, 2),
+            })
+        return rows
+
+
+def _memory_percent() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return 100.0 * rss_pages / os.sysconf("SC_PHYS_PAGES")
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def _gpu_percent() -> Optional[float]:
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    try:
+        free, total = torch.cuda.mem_get_info()
+        return 100.0 * (total - free) / total
+    except Exception:
+        return None
+
+
+class SystemMetricsWriter:
+    """
+    Samples process CPU/memory/GPU and request rates every
+    METRICS_SAMPLE_INTERVAL_S and writes the buffered rows to system_metrics
+    in one insert every METRICS_FLUSH_INTERVAL_S.
+    """
+
+    def __init__(self, registry: MetricsRegistry, active_connections: Callable[[], int] = lambda: 0):
+        self.registry = registry
+        self.active_connections = active_connections
+        self.pending: List[Dict[str, Any]] = []
+        self.rows_written = 0
+        self.write_failures = 0
+        self._last = None
+
+    def _counters(self) -> Tuple[float, float, int, float, float]:
+        total_s, count = self.registry.http_seconds.totals()
+        errors = sum(
+            v for (_, _, status), v in self.registry.http_requests.values.items() if status.startswith("5")
+        )
+        cpu = os.times()
+        return time.monotonic(), cpu.user + cpu.system, count, total_s, errors
+
+    def sample(self):
+        now, cpu_s, requests, request_s, errors = current = self._counters()
+        if self._last is None:
+            self._last = current
+            return
+        last_now, last_cpu_s, last_requests, last_request_s, last_errors = self._last
+        self._last = current
+
+        wall = max(now - last_now, 1e-6)
+        served = requests - last_requests
+        self.pending.append({
+            # Set here: the column's server default would stamp every row with the flush time.
+            "timestamp": datetime.now(timezone.utc),
+            "cpu_usage": round(100.0 * (cpu_s - last_cpu_s) / wall / (os.cpu_count() or 1), 2),
+            "memory_usage": round(_memory_percent(), 2),
+            "gpu_usage": _gpu_percent(),
+            "active_connections": int(self.active_connections()),
+            "request_per_minutes": int(round(served * 60 / wall)),
+            "response_time": round((request_s - last_request_s) / served * 1000, 2) if served else None,
+            "error_rate": round((errors - last_errors) / served, 4) if served else 0.0,
+        })
+
+    async def flush(self, engine):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(sa.insert(system_metrics_table), rows)
+            self.rows_written += len(rows)
+        except Exception:
+            self.write_failures += 1
+            logger.exception("Writing %d system_metrics rows failed", len(rows))
+
+    async def run(self, engine):
+        next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL_S
+        try:
+            while True:
+                self.sample()
+                if time.monotonic() >= next_flush:
+                    await self.flush(engine)
+                    next_flush = time.monotonic() + METRICS_FLUSH_INTERVAL_S
+                await asyncio.sleep(METRICS_SAMPLE_INTERVAL_S)
+        finally:
+            await self.flush(engine)
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,78 @@
+"""hash and index active_users bearer tokens
+
+Revision ID: c4e1d7a9b3f2
+Revises: 2b70b95c1f04
+Create Date: 2025-10-02 11:20:41.512309
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e1d7a9b3f2'
+down_revision: Union[str, Sequence[str], None] = '2b70b95c1f04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 5000
+
+active_users = sa.table(
+    'active_users',
+    sa.column('bearer_token', sa.String),
+    sa.column('bearer_expiry_time', sa.DateTime(timezone=True)),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    # Expired sessions are dead weight; drop them instead of hashing them.
+    bind.execute(active_users.delete().where(active_users.c.bearer_expiry_time <= sa.func.now()))
+
+    # Sessions are now looked up by sha256(token), a 64-char hex digest.
+    if bind.dialect.name == 'postgresql':
+        # One set-based statement; sha256() is built in since PostgreSQL 11.
+        bind.execute(sa.text(
+            "UPDATE active_users "
+            "SET bearer_token = encode(sha256(convert_to(bearer_token, 'UTF8')), 'hex') "
+            "WHERE length(bearer_token) != 64"
+        ))
+    else:
+        rehash = (
+            active_users.update()
+            .where(active_users.c.bearer_token == sa.bindparam('old_token'))
+            .values(bearer_token=sa.bindparam('new_token'))
+        )
+        while True:
+            tokens = [
+                row.bearer_token
+                for row in bind.execute(
+                    sa.select(active_users.c.bearer_token)
+                    .where(sa.func.length(active_users.c.bearer_token) != 64)
+                    .limit(BATCH_SIZE)
+                )
+            ]
+            if not tokens:
+                break
+            # One executemany per batch rather than a statement per row.
+            bind.execute(rehash, [
+                {'old_token': token, 'new_token': hashlib.sha256(token.encode()).hexdigest()}
+                for token in tokens
+            ])
+
+    op.create_index('ix_active_users_bearer_token', 'active_users', ['bearer_token'])
+    op.create_index('ix_active_users_bearer_expiry_time', 'active_users', ['bearer_expiry_time'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_active_users_bearer_expiry_time', table_name='active_users')
+    op.drop_index('ix_active_users_bearer_token', table_name='active_users')
+    # Digests can't be turned back into tokens: everyone signs in again.
+    op.execute(active_users.delete())
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_DURATION_S = float(os.getenv("PROFILE_MAX_DURATION_S", "120"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "10"))
+PROFILE_DEFAULT_INTERVAL_MS = 10.0
+TRACEMALLOC_FRAMES = 10
+TOP_N = 50
+
+ARTIFACTS = {
+    "stacks.folded": "text/plain",
+    "summary.json": "application/json",
+    "torch_trace.json": "application/json",
+    "tracemalloc_diff.txt": "text/plain",
+}
+
+
+class _StackSampler(threading.Thread):
+    """Samples every thread's Python stack with sys._current_frames until stopped."""
+
+    def __init__(self, interval_s: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._halt = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._halt.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+    def top_functions(self) -> List[Dict[str, Any]]:
+        """Functions by samples on top of the stack (self) and anywhere on it (total)."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for fn in set(frames):
+                total[fn] += count
+        thread_samples = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": fn,
+                "self_samples": n,
+                "self_pct": round(100 * n / thread_samples, 2),
+                "total_samples": total[fn],
+                "total_pct": round(100 * total[fn] / thread_samples, 2),
+            }
+            for fn, n in own.most_common(TOP_N)
+        ]
+
+
+class ProfileCapture:
+    """One time-boxed capture; artifacts land in PROFILE_DIR/<capture_id>/."""
+
+    def __init__(self, duration_s: float, interval_ms: float, torch_trace: bool, memory: bool):
+        self.capture_id = uuid.uuid4().hex[:12]
+        self.directory = os.path.join(PROFILE_DIR, self.capture_id)
+        self.duration_s = duration_s
+        self.interval_ms = interval_ms
+        self.torch_trace = torch_trace
+        self.memory = memory
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+        self._sampler: Optional[_StackSampler] = None
+        self._torch_profiler = None
+        self._snapshot = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+        if self.torch_trace:
+            self._start_torch()
+        self._sampler = _StackSampler(self.interval_ms / 1000)
+        self._sampler.start()
+
+    def _start_torch(self):
+        torch = sys.modules.get("torch")
+        if torch is None:
+            logger.warning("torch is not loaded in this worker; skipping the torch trace")
+            self.torch_trace = False
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        try:
+            self._torch_profiler = torch.profiler.profile(activities=activities, record_shapes=True)
+            self._torch_profiler.start()
+        except Exception as e:
+            logger.warning("Could not start the torch profiler: %s", e)
+            self._torch_profiler = None
+            self.torch_trace = False
+
+    def stop_torch(self):
+        """Stop the torch profiler on the thread that started it."""
+        if self._torch_profiler is not None:
+            self._torch_profiler.stop()
+
+    def stop(self):
+        """Stop every collector and write the artifacts. Blocking: run it off the event loop."""
+        try:
+            self._sampler.stop()
+            with open(os.path.join(self.directory, "stacks.folded"), "w") as f:
+                for stack, count in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            summary = {
+                "capture_id": self.capture_id,
+                "pid": os.getpid(),
+                "duration_s": self.duration_s,
+                "interval_ms": self.interval_ms,
+                "samples": self._sampler.samples,
+                "top_functions": self._sampler.top_functions(),
+            }
+
+            if self._torch_profiler is not None:
+                self._torch_profiler.export_chrome_trace(os.path.join(self.directory, "torch_trace.json"))
+                summary["torch_top_ops"] = self._torch_profiler.key_averages().table(
+                    sort_by="self_cpu_time_total", row_limit=25
+                )
+
+            if self._snapshot is not None:
+                after = tracemalloc.take_snapshot()
+                diff = after.compare_to(self._snapshot, "lineno")
+                with open(os.path.join(self.directory, "tracemalloc_diff.txt"), "w") as f:
+                    for stat in diff[:TOP_N]:
+                        f.write(f"{stat}\n")
+                summary["memory_growth_kb"] = round(sum(s.size_diff for s in diff) / 1024, 1)
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+
+            with open(os.path.join(self.directory, "summary.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+            self.status = "done"
+        except Exception as e:
+            logger.exception("Profile capture %s failed", self.capture_id)
+            self.status = "failed"
+            self.error = str(e)
+            if self._started_tracemalloc and tracemalloc.is_tracing():
+                tracemalloc.stop()
+        finally:
+            self.finished_at = time.time()
+
+    def artifacts(self) -> List[str]:
+        return [name for name in ARTIFACTS if os.path.exists(os.path.join(self.directory, name))]
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "capture_id": self.capture_id,
+            "status": self.status,
+            "error": self.error,
+            "pid": os.getpid(),
+            "duration_s": self.duration_s,
+            "interval_ms": self.interval_ms,
+            "torch_trace": self.torch_trace,
+            "tracemalloc": self.memory,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "artifacts": self.artifacts() if self.status != "running" else [],
+        }
+
+
+class Profiler:
+    """
+    On-demand captures for a live worker. Nothing is sampled or traced
+    between captures, and only one capture runs at a time.
+    """
+
+    def __init__(self):
+        self.captures: Dict[str, ProfileCapture] = {}
+        self.active: Optional[ProfileCapture] = None
+        self._finisher: Optional[asyncio.Task] = None
+
+    def start(
+        self,
+        duration_s: float,
+        interval_ms: float = PROFILE_DEFAULT_INTERVAL_MS,
+        torch_trace: bool = False,
+        memory: bool = True,
+    ) -> ProfileCapture:
+        if self.active is not None:
+            raise RuntimeError(f"Capture {self.active.capture_id} is already running")
+        capture = ProfileCapture(
+            min(max(duration_s, 1.0), PROFILE_MAX_DURATION_S), max(interval_ms, 1.0), torch_trace, memory
+        )
+        capture.start()
+        self.active = capture
+        self.captures[capture.capture_id] = capture
+        self._finisher = asyncio.create_task(self._finish(capture))
+        logger.info(
+            "Started profile capture %s for %.0fs (torch=%s, tracemalloc=%s)",
+            capture.capture_id, capture.duration_s, capture.torch_trace, capture.memory,
+        )
+        return capture
+
+    async def _finish(self, capture: ProfileCapture):
+        try:
+            await asyncio.sleep(capture.duration_s)
+        finally:
+            try:
+                capture.stop_torch()
+            except Exception as e:
+                logger.warning("Stopping the torch profiler failed: %s", e)
+            await asyncio.to_thread(capture.stop)
+            self.active = None
+            self._prune()
+            logger.info("Profile capture %s %s", capture.capture_id, capture.status)
+
+    def _prune(self):
+        finished = sorted(
+            (c for c in self.captures.values() if c is not self.active), key=lambda c: c.started_at
+        )
+        for capture in finished[: max(0, len(finished) - PROFILE_KEEP)]:
+            shutil.rmtree(capture.directory, ignore_errors=True)
+            del self.captures[capture.capture_id]
+
+    def artifact_path(self, capture_id: str, name: str) -> Optional[str]:
+        capture = self.captures.get(capture_id)
+        if capture is None or capture.status == "running" or name not in ARTIFACTS:
+            return None
+        path = os.path.join(capture.directory, name)
+        return path if os.path.exists(path) else None
+
+
+profiler = Profiler()
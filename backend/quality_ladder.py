@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import logging
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from metrics import metrics
+from whisper_manager import WHISPER_MODEL_SIZE, smaller_whisper
+
+
+logger = logging.getLogger(__name__)
+
+
+QUALITY_FALLBACK_WHISPER_MODEL = os.getenv(
+    "QUALITY_FALLBACK_WHISPER_MODEL", smaller_whisper(WHISPER_MODEL_SIZE)
+)
+
+# Rungs from best quality to cheapest. whisper_model None means WHISPER_MODEL_SIZE;
+# max_reply_tokens None keeps each flow node's own budget; tts "cached" only
+# replays phrases already synthesized and answers with text otherwise.
+DEFAULT_LADDER = [
+    {"name": "full", "whisper_model": None, "denoise": True, "max_reply_tokens": None, "tts": "full"},
+    {"name": "no_denoise", "whisper_model": None, "denoise": False, "max_reply_tokens": None, "tts": "full"},
+    {
+        "name": "short_replies",
+        "whisper_model": QUALITY_FALLBACK_WHISPER_MODEL,
+        "denoise": False,
+        "max_reply_tokens": 64,
+        "tts": "full",
+    },
+    {
+        "name": "cached_tts",
+        "whisper_model": QUALITY_FALLBACK_WHISPER_MODEL,
+        "denoise": False,
+        "max_reply_tokens": 64,
+        "tts": "cached",
+    },
+]
+QUALITY_LADDER = json.loads(os.getenv("QUALITY_LADDER", "null")) or DEFAULT_LADDER
+QUALITY_LADDER_ENABLED = os.getenv("QUALITY_LADDER_ENABLED", "1") == "1"
+QUALITY_DEGRADE_RTF = float(os.getenv("QUALITY_DEGRADE_RTF", "0.8"))
+QUALITY_RECOVER_RTF = float(os.getenv("QUALITY_RECOVER_RTF", "0.5"))
+QUALITY_DEGRADE_SAMPLES = int(os.getenv("QUALITY_DEGRADE_SAMPLES", "3"))
+QUALITY_RECOVER_SAMPLES = int(os.getenv("QUALITY_RECOVER_SAMPLES", "10"))
+QUALITY_MIN_DWELL_S = float(os.getenv("QUALITY_MIN_DWELL_S", "15"))
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "128"))
+RTF_EWMA_ALPHA = 0.2
+
+# Stages timed on each path; a path's RTF is the sum of its stage RTFs.
+PATH_STAGES = {"input": ("denoise", "asr"), "reply": ("llm", "tts")}
+
+level_transitions = metrics.counter(
+    "sound360_quality_level_transitions_total",
+    "Quality ladder level changes.",
+    ("scope", "from_level", "to_level", "direction"),
+)
+
+
+class _RTFTracker:
+    """
+    EWMA real-time factor per stage for one scope (a session or the whole
+    node), plus the hysteresis that moves it along the ladder. Each path keeps
+    its own counters, advanced only when that path was observed: degrade one
+    rung once any path has QUALITY_DEGRADE_SAMPLES consecutive samples above
+    QUALITY_DEGRADE_RTF, recover one rung once a path has QUALITY_RECOVER_SAMPLES
+    below QUALITY_RECOVER_RTF and no path is counting towards a degrade, and
+    never move twice within QUALITY_MIN_DWELL_S.
+    """
+
+    def __init__(self, scope: str, top: int):
+        self.scope = scope
+        self.top = top
+        self.level = 0
+        self.stage_rtf: Dict[str, float] = {}
+        self.samples = 0
+        self._over = {path: 0 for path in PATH_STAGES}
+        self._under = {path: 0 for path in PATH_STAGES}
+        self._changed_at = 0.0
+
+    def record(self, stage: str, rtf: float):
+        prev = self.stage_rtf.get(stage)
+        self.stage_rtf[stage] = rtf if prev is None else prev + RTF_EWMA_ALPHA * (rtf - prev)
+
+    def path_rtf(self, path: str) -> float:
+        return sum(self.stage_rtf.get(stage, 0.0) for stage in PATH_STAGES[path])
+
+    def update(self, paths) -> Optional[int]:
+        """Count one sample for each observed path; return the new level on a change."""
+        self.samples += 1
+        for path in paths:
+            rtf = self.path_rtf(path)
+            if rtf > QUALITY_DEGRADE_RTF:
+                self._over[path] += 1
+                self._under[path] = 0
+            elif rtf < QUALITY_RECOVER_RTF:
+                self._under[path] += 1
+                self._over[path] = 0
+            else:
+                self._over[path] = self._under[path] = 0
+
+        if time.monotonic() - self._changed_at < QUALITY_MIN_DWELL_S:
+            return None
+        over = self._over.values()
+        if max(over) >= QUALITY_DEGRADE_SAMPLES and self.level < self.top:
+            self.level += 1
+        elif not any(over) and max(self._under.values()) >= QUALITY_RECOVER_SAMPLES and self.level > 0:
+            self.level -= 1
+        else:
+            return None
+        for path in PATH_STAGES:
+            self._over[path] = self._under[path] = 0
+        self._changed_at = time.monotonic()
+        return self.level
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "stage_rtf": {stage: round(rtf, 3) for stage, rtf in self.stage_rtf.items()},
+            "input_rtf": round(self.path_rtf("input"), 3),
+            "reply_rtf": round(self.path_rtf("reply"), 3),
+            "samples": self.samples,
+        }
+
+
+class QualityLadder:
+    """
+    Chooses the ASR/LLM/TTS settings for each realtime turn from how close the
+    stages run to real time.
+
+    `observe` takes the seconds each stage of one path spent (queueing
+    included) and the seconds of audio that path covered. Both the session and the node
+    track their own level; a session runs at whichever of the two is lower
+    down the ladder, so one slow session degrades alone while node-wide load
+    degrades everyone.
+    """
+
+    def __init__(self, ladder: List[Dict[str, Any]] = QUALITY_LADDER, enabled: bool = QUALITY_LADDER_ENABLED):
+        self.ladder = ladder
+        self.enabled = enabled
+        self.node = _RTFTracker("node", len(ladder) - 1)
+        self.sessions: Dict[str, _RTFTracker] = {}
+        self.level_changes: Counter = Counter()
+
+    def level_index(self, session_id: str) -> int:
+        if not self.enabled:
+            return 0
+        session = self.sessions.get(session_id)
+        return max(self.node.level, session.level if session else 0)
+
+    def settings(self, session_id: str) -> Dict[str, Any]:
+        return self.ladder[self.level_index(session_id)]
+
+    def observe(self, session_id: str, stage_seconds: Dict[str, float], audio_s: float):
+        if audio_s <= 0:
+            return
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = _RTFTracker(session_id, len(self.ladder) - 1)
+
+        paths = [path for path, stages in PATH_STAGES.items() if any(s in stage_seconds for s in stages)]
+        for scope, tracker in (("session", session), ("node", self.node)):
+            for stage, seconds in stage_seconds.items():
+                tracker.record(stage, seconds / audio_s)
+            previous = tracker.level
+            level = tracker.update(paths)
+            if level is not None and self.enabled:
+                self._log_change(scope, tracker, previous, level)
+
+    def _log_change(self, scope: str, tracker: _RTFTracker, previous: int, level: int):
+        name = self.ladder[level]["name"]
+        direction = "degraded" if level > previous else "recovered"
+        self.level_changes[(scope, name)] += 1
+        level_transitions.inc(scope, self.ladder[previous]["name"], name, direction)
+        logger.warning(
+            "Quality level for %s %s: %s -> %s (input RTF %.2f, reply RTF %.2f)",
+            tracker.scope,
+            direction,
+            self.ladder[previous]["name"],
+            name,
+            tracker.path_rtf("input"),
+            tracker.path_rtf("reply"),
+        )
+
+    def forget(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "node": {**self.node.snapshot(), "name": self.ladder[self.node.level]["name"]},
+            "sessions": {
+                sid: {**tracker.snapshot(), "effective_level": self.level_index(sid)}
+                for sid, tracker in self.sessions.items()
+            },
+            "level_changes": [
+                {"scope": scope, "level": name, "count": count}
+                for (scope, name), count in sorted(self.level_changes.items())
+            ],
+        }
+
+
+class TTSPhraseCache:
+    """LRU of synthesized replies keyed by (language, text), as PCM16 base64."""
+
+    def __init__(self, maxsize: int = TTS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(language: str, text: str) -> tuple:
+        return language, " ".join(text.split()).lower()
+
+    def get(self, language: str, text: str) -> Optional[tuple]:
+        """(audio_b64, duration_s) or None."""
+        key = self._key(language, text)
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item
+
+    def put(self, language: str, text: str, audio_b64: str, duration_s: float):
+        if self.maxsize <= 0:
+            return
+        key = self._key(language, text)
+        self._items[key] = (audio_b64, duration_s)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"size": len(self._items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+quality_ladder = QualityLadder()
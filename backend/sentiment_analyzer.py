@@ -0,0 +1,689 @@
+import os
+import io
+import shutil
+import base64
+import logging
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import HTTPException
+
+import numpy as np
+import whisper
+
+import torch
+import torchaudio
+
+from config import HF_TOKEN
+from whisper_manager import WhisperManager, WHISPER_MODEL_SIZE
+from utils.devices import safe_pick_device
+from speaker_embeddings import AgentVoiceEmbeddings
+from long_form_audio import MemmapWav, SpeakerStitcher, window_bounds
+from sentiment_scoring import SentimentScorer, customer_sentiment_summary
+
+import noisereduce as nr
+from nltk.tokenize import sent_tokenize
+
+from pyannote.audio import Pipeline
+from deepmultilingualpunctuation import PunctuationModel
+
+
+logger = logging.getLogger(__name__)
+
+
+DIARIZATION_MODEL = "pyannote/speaker-diarization"
+
+ANALYSIS_SR = 16000  # diarization, embedding, Whisper and wav2vec2 all run at 16 kHz
+ARCHIVE_CALL_AUDIO = os.getenv("ARCHIVE_CALL_AUDIO", "true").lower() == "true"
+
+ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", "8"))
+WHISPER_WINDOW_S = 30.0
+MIN_TURN_S = 0.3
+TURN_MERGE_GAP_S = 0.5
+NO_SPEECH_THRESHOLD = 0.7
+
+# Recordings longer than this are memory-mapped and diarized window by window.
+LONG_FORM_THRESHOLD_S = float(os.getenv("LONG_FORM_THRESHOLD_S", "1200"))
+LONG_FORM_WINDOW_S = float(os.getenv("LONG_FORM_WINDOW_S", "600"))
+LONG_FORM_OVERLAP_S = 30.0
+SPEAKER_STITCH_THRESHOLD = 0.5
+
+RSS_SAMPLE_INTERVAL_S = 0.05
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+whisper_model = WhisperManager.get_model(WHISPER_MODEL_SIZE, DEVICE)
+
+
+def _current_rss_mb() -> float:
+    """Resident set size right now (Linux /proc; 0 where unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class _RSSSampler(threading.Thread):
+    """Samples the process RSS every RSS_SAMPLE_INTERVAL_S until stopped and keeps the highest reading."""
+
+    def __init__(self):
+        super().__init__(name="stage-rss", daemon=True)
+        self.start_mb = self.peak_mb = _current_rss_mb()
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(RSS_SAMPLE_INTERVAL_S):
+            self.peak_mb = max(self.peak_mb, _current_rss_mb())
+
+    def stop(self) -> float:
+        self._halt.set()
+        self.join()
+        self.peak_mb = max(self.peak_mb, _current_rss_mb())
+        return self.peak_mb
+
+
+def _alignment_chars(text: str) -> str:
+    """Lowercased alphanumerics only, so punctuation/casing edits don't break alignment."""
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+
+class SentimentAnalyzer(SentimentScorer):
+    
+    _diarization_pipeline, diarization_device = safe_pick_device(
+        lambda: Pipeline.from_pretrained(DIARIZATION_MODEL, use_auth_token=HF_TOKEN),
+        "DiarizationPipeline"
+    )
+
+    _punctuation_restore_model = PunctuationModel()
+
+    # Speaker identification uses the diarization pipeline's own embedding model,
+    # so the agent reference lives in the same space as the cluster centroids.
+    _speaker_embedding = _diarization_pipeline._embedding
+    # Stored agent embeddings are recomputed whenever this tag changes.
+    embedding_version = f"{DIARIZATION_MODEL}:{_diarization_pipeline.embedding}"
+
+    @classmethod
+    def _embed_waveforms(cls, waveforms, sample_rate: int) -> np.ndarray:
+        """Embed a list of 1-D float tensors in one batched forward pass -> [N, D]."""
+        target_sr = cls._speaker_embedding.sample_rate
+        if sample_rate != target_sr:
+            waveforms = [
+                torchaudio.functional.resample(w, sample_rate, target_sr) for w in waveforms
+            ]
+        max_len = max(w.shape[-1] for w in waveforms)
+        batch = torch.zeros(len(waveforms), 1, max_len)
+        masks = torch.zeros(len(waveforms), max_len)
+        for i, w in enumerate(waveforms):
+            batch[i, 0, : w.shape[-1]] = w
+            masks[i, : w.shape[-1]] = 1.0
+        return np.asarray(cls._speaker_embedding(batch, masks=masks), dtype=np.float32)
+
+    @classmethod
+    def embed_reference(cls, wav_path: str) -> np.ndarray:
+        """Speaker embedding of a whole voice sample file."""
+        waveform, sample_rate = torchaudio.load(wav_path)
+        waveform = torch.mean(waveform, dim=0)
+        return cls._embed_waveforms([waveform], sample_rate)[0]
+
+    @classmethod
+    def reference_embedding(cls, wav_path: str) -> torch.Tensor:
+        """L2-normalised agent reference, computed once per voice sample and model."""
+        embedding = AgentVoiceEmbeddings.get(
+            wav_path, cls.embedding_version, cls.embed_reference
+        )
+        embedding = torch.from_numpy(np.asarray(embedding))
+        return embedding / embedding.norm(p=2, dim=-1, keepdim=True)
+
+    def __init__(
+        self,
+        calls_base_dir: str = "calls_recording",
+        agents_audios: str = "agents_audios",
+        agent_id: str = None,
+        call_id: str = None,
+        call_recording_b64: str = None,
+        user_voice_sample_path: Optional[str] = None,  
+        call_recording_path: Optional[str] = None,
+    ):
+        super().__init__()
+        self.diarization_pipeline = SentimentAnalyzer._diarization_pipeline
+        self.punctuation_restore_model = SentimentAnalyzer._punctuation_restore_model
+
+        self.calls_base_dir = calls_base_dir
+        self.agent_id = agent_id
+        self.agents_audios = agents_audios
+        self.call_id = call_id
+        self.call_recording_b64 = call_recording_b64
+
+        os.makedirs(calls_base_dir, exist_ok=True)
+        os.makedirs(self.agents_audios, exist_ok=True)
+
+        if user_voice_sample_path:
+            self.user_voice_sample = user_voice_sample_path
+        else:
+            self.user_voice_sample = (
+                os.path.join(self.agents_audios, f"{self.agent_id}_voice.wav")
+                if self.agent_id
+                else None
+            )
+
+        if not self.user_voice_sample or not os.path.exists(self.user_voice_sample):
+            logger.exception("No voice file found for agent_id or provided path")
+            raise HTTPException(
+                status_code=404,
+                detail=f"No voice file found for agent_id '{self.agent_id}' at '{self.user_voice_sample}'",
+            )
+
+        self.call_recording_path = call_recording_path
+        self._archive_threads = []
+
+        self.stage_timings: dict = {}
+        self.stage_memory: dict = {}
+        self.audio_duration = 0.0
+
+        logger.info("SentimentAnalyzer initialized with shared models.")
+
+    def _decode_b64_audio(self, b64_audio: str):
+        """Decode base64 audio and return waveform + sample_rate"""
+        if not b64_audio:
+            raise ValueError("No voice sample provided (b64_voice_sample missing).")
+
+        try:
+            audio_bytes = base64.b64decode(b64_audio)
+            buffer = io.BytesIO(audio_bytes)
+            waveform, sample_rate = torchaudio.load(buffer)
+            return waveform, sample_rate
+        except Exception as e:
+            logger.exception("Failed to decode or load audio")
+            raise
+
+    def _load_call_audio(self):
+        """Decode the recording exactly once, from base64 or from a spooled file."""
+        try:
+            if self.call_recording_b64 is not None:
+                if not str(self.call_recording_b64).strip():
+                    raise HTTPException(
+                        status_code=400, detail="Empty or corrupted call recording data"
+                    )
+                waveform, sample_rate = self._decode_b64_audio(self.call_recording_b64)
+            elif self.call_recording_path:
+                waveform, sample_rate = torchaudio.load(self.call_recording_path)
+            else:
+                raise HTTPException(status_code=400, detail="No call recording provided")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Failed to decode call recording: %s", e)
+            raise HTTPException(status_code=400, detail="Invalid call recording data")
+
+        if waveform.numel() == 0:
+            raise HTTPException(status_code=400, detail="Call recording contains no audio.")
+        return waveform, sample_rate
+
+    def _prepare_waveform(self, waveform: torch.Tensor, sample_rate: int, denoise: bool = True):
+        """Mono, ANALYSIS_SR, optionally denoised float32 waveform of shape [1, T]."""
+        if waveform.ndim == 2 and waveform.shape[0] > 1:
+            waveform = torch.mean(waveform, dim=0, keepdim=True)
+
+        if sample_rate != ANALYSIS_SR:
+            waveform = torchaudio.functional.resample(
+                waveform, orig_freq=sample_rate, new_freq=ANALYSIS_SR
+            )
+
+        if denoise:
+            reduced_noise_audio = nr.reduce_noise(y=waveform.squeeze(0).numpy(), sr=ANALYSIS_SR)
+            waveform = torch.from_numpy(np.ascontiguousarray(reduced_noise_audio)).unsqueeze(0)
+
+        return waveform.float()
+
+    def _archive_audio(self, path: str, waveform: torch.Tensor, sample_rate: int):
+        """Write audio to disk in the background; analysis never reads it back."""
+        def _write():
+            try:
+                torchaudio.save(path, waveform, sample_rate)
+            except Exception:
+                logger.exception("Failed to archive %s", path)
+
+        thread = threading.Thread(target=_write, name=f"archive-{os.path.basename(path)}")
+        thread.start()
+        self._archive_threads.append(thread)
+
+    def _archive_copy(self, src: str, dst: str):
+        """Background copy of an already-on-disk recording into the call record."""
+        thread = threading.Thread(
+            target=shutil.copyfile, args=(src, dst), name=f"archive-{os.path.basename(dst)}"
+        )
+        thread.start()
+        self._archive_threads.append(thread)
+
+    def wait_for_archive(self):
+        for thread in self._archive_threads:
+            thread.join()
+        self._archive_threads = []
+
+    def _align_sentences_to_spans(self, sentences, timed_units):
+        """
+        Map sentences onto (start, end) times using Whisper's timed words/segments.
+
+        Punctuation restoration only touches punctuation and casing, so the
+        sentences are walked over the units' alphanumeric characters, with time
+        interpolated inside each unit. Unalignable sentences get None.
+        """
+        char_starts, char_ends = [], []
+        for unit in timed_units:
+            chars = _alignment_chars(unit["text"])
+            if not chars:
+                continue
+            step = (unit["end"] - unit["start"]) / len(chars)
+            for k in range(len(chars)):
+                char_starts.append(unit["start"] + k * step)
+                char_ends.append(unit["start"] + (k + 1) * step)
+
+        total = len(char_starts)
+        spans = []
+        cursor = 0
+        for idx, sent in enumerate(sentences):
+            n = len(_alignment_chars(sent))
+            if n == 0 or cursor >= total:
+                spans.append(None)
+                continue
+            last = total - 1 if idx == len(sentences) - 1 else min(cursor + n, total) - 1
+            spans.append((char_starts[cursor], char_ends[last]))
+            cursor += n
+        return spans
+
+    def _diarize(self, audio_input):
+        """
+        Run diarization and keep the per-speaker centroid embeddings it computed
+        for clustering. Returns (diarization, {label: centroid}).
+        """
+        try:
+            call_diarization, embeddings = self.diarization_pipeline(
+                audio_input, min_speakers=2, max_speakers=4, return_embeddings=True
+            )
+        except TypeError:
+            # Pipelines without return_embeddings support.
+            return self.diarization_pipeline(audio_input, min_speakers=2, max_speakers=4), {}
+
+        centroids = {}
+        if embeddings is not None:
+            for label, centroid in zip(call_diarization.labels(), embeddings):
+                if np.all(np.isfinite(centroid)):
+                    centroids[label] = np.asarray(centroid, dtype=np.float32)
+        return call_diarization, centroids
+
+    def _segment_centroids(self, call_diarization, samples: torch.Tensor, sr: int):
+        """Fallback: embed each speaker's longest segment, all in one batched pass."""
+        longest = {}
+        for turn, _, speaker in call_diarization.itertracks(yield_label=True):
+            if speaker not in longest or turn.duration > longest[speaker].duration:
+                longest[speaker] = turn
+
+        labels, waveforms = [], []
+        for speaker, turn in longest.items():
+            piece = samples[int(turn.start * sr) : int(turn.end * sr)]
+            if piece.numel() > 0:
+                labels.append(speaker)
+                waveforms.append(piece)
+        if not waveforms:
+            return {}
+        return dict(zip(labels, self._embed_waveforms(waveforms, sr)))
+
+    def _open_long_form(self):
+        """Memory-mapped view of long spooled WAV recordings, None for the in-memory path."""
+        if not self.call_recording_path:
+            return None
+        audio = MemmapWav.open(self.call_recording_path, target_sr=ANALYSIS_SR, denoise=True)
+        if audio is None or audio.duration < LONG_FORM_THRESHOLD_S:
+            return None
+        logger.info(
+            "Long-form mode for %s (%.0fs, %.0fs windows)",
+            self.call_id, audio.duration, LONG_FORM_WINDOW_S,
+        )
+        return audio
+
+    def _diarize_long_form(self, audio: MemmapWav):
+        """
+        Diarize overlapping windows one at a time, stitching speaker labels
+        across windows through their centroids. Only one window of audio is
+        resident at a time. Returns ((start, end, speaker) tracks, agent label).
+        """
+        stitcher = SpeakerStitcher(threshold=SPEAKER_STITCH_THRESHOLD)
+        speaker_turns = []
+        sr = ANALYSIS_SR
+
+        for start, end, keep_from, keep_to in window_bounds(
+            audio.duration, LONG_FORM_WINDOW_S, LONG_FORM_OVERLAP_S
+        ):
+            with self._stage("decode"):
+                window = torch.from_numpy(audio[int(start * sr) : int(end * sr)]).unsqueeze(0)
+
+            with self._stage("diarization"):
+                window_diarization, centroids = self._diarize(
+                    {"waveform": window, "sample_rate": sr}
+                )
+
+            with self._stage("embedding"):
+                if not centroids:
+                    centroids = self._segment_centroids(window_diarization, window[0], sr)
+                labels = stitcher.assign(centroids)
+
+            for turn, _, speaker in window_diarization.itertracks(yield_label=True):
+                turn_start = max(start + turn.start, keep_from)
+                turn_end = min(start + turn.end, keep_to)
+                if turn_end > turn_start and speaker in labels:
+                    speaker_turns.append((turn_start, turn_end, labels[speaker]))
+            del window
+
+        with self._stage("embedding"):
+            identified_speaker = self._identify_agent(
+                stitcher.centroids(), self.reference_embedding(self.user_voice_sample)
+            )
+        return speaker_turns, identified_speaker
+
+    def _identify_agent(self, centroids, reference: torch.Tensor):
+        """The speaker whose centroid is closest to the agent reference, via one matrix product."""
+        if not centroids:
+            return None
+        labels = list(centroids)
+        matrix = torch.from_numpy(np.stack([centroids[label] for label in labels]))
+        matrix = matrix / matrix.norm(p=2, dim=-1, keepdim=True)
+        scores = matrix @ reference
+        return labels[int(torch.argmax(scores))]
+
+    def _build_turns(self, speaker_turns, identified_speaker, audio_duration: float):
+        """
+        Chronological list of {role, start, end} turns from (start, end, speaker)
+        diarization tracks.
+
+        Back-to-back turns of the same role are merged, very short blips are
+        dropped, and nothing is longer than one Whisper window.
+        """
+        turns = []
+        for turn_start, turn_end, speaker in sorted(speaker_turns, key=lambda t: t[0]):
+            role = "agent" if speaker == identified_speaker else "customer"
+            start, end = max(0.0, turn_start), min(turn_end, audio_duration)
+            if end <= start:
+                continue
+            if turns and turns[-1]["role"] == role and start - turns[-1]["end"] <= TURN_MERGE_GAP_S:
+                turns[-1]["end"] = max(turns[-1]["end"], end)
+            else:
+                turns.append({"role": role, "start": start, "end": end})
+
+        pieces = []
+        for turn in turns:
+            if turn["end"] - turn["start"] < MIN_TURN_S:
+                continue
+            start = turn["start"]
+            while turn["end"] - start > WHISPER_WINDOW_S:
+                pieces.append({"role": turn["role"], "start": start, "end": start + WHISPER_WINDOW_S})
+                start += WHISPER_WINDOW_S
+            pieces.append({"role": turn["role"], "start": start, "end": turn["end"]})
+        return pieces
+
+    def _transcribe_turns(self, samples: np.ndarray, sr: int, turns):
+        """
+        Transcribe every turn as its own slice of `samples`, several turns per
+        Whisper forward pass. Returns (text, timed_units) per turn, with unit
+        times relative to the whole recording.
+        """
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            whisper_model.is_multilingual, num_languages=whisper_model.num_languages
+        )
+        options = whisper.DecodingOptions(
+            task="transcribe",
+            temperature=0.0,
+            fp16=whisper_model.device.type == "cuda",
+            without_timestamps=False,
+        )
+
+        results = [("", [])] * len(turns)
+        for i in range(0, len(turns), ASR_BATCH_SIZE):
+            batch = turns[i : i + ASR_BATCH_SIZE]
+            mels = torch.stack(
+                [
+                    whisper.log_mel_spectrogram(
+                        whisper.pad_or_trim(
+                            torch.from_numpy(samples[int(t["start"] * sr) : int(t["end"] * sr)])
+                        ),
+                        n_mels=whisper_model.dims.n_mels,
+                    )
+                    for t in batch
+                ]
+            ).to(whisper_model.device)
+
+            with torch.no_grad():
+                decoded = whisper.decode(whisper_model, mels, options)
+
+            for j, (turn, result) in enumerate(zip(batch, decoded)):
+                if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < -1.0:
+                    continue
+                text = result.text.strip()
+                if text:
+                    results[i + j] = (
+                        text,
+                        self._timed_units_from_tokens(result.tokens, tokenizer, turn),
+                    )
+        return results
+
+    @staticmethod
+    def _timed_units_from_tokens(tokens, tokenizer, turn):
+        """Split decoded tokens into Whisper's timestamped segments."""
+        units = []
+        current = []
+        seg_start = 0.0
+        for tok in tokens:
+            if tok >= tokenizer.timestamp_begin:
+                t = (tok - tokenizer.timestamp_begin) * 0.02
+                if current:
+                    units.append({
+                        "text": tokenizer.decode(current),
+                        "start": turn["start"] + seg_start,
+                        "end": min(turn["start"] + t, turn["end"]),
+                    })
+                    current = []
+                seg_start = t
+            elif tok < tokenizer.eot:
+                current.append(tok)
+        if current:
+            units.append({
+                "text": tokenizer.decode(current),
+                "start": turn["start"] + seg_start,
+                "end": turn["end"],
+            })
+        return units
+
+    def _restore_punctuation_per_turn(self, texts):
+        """
+        Restore punctuation for all turns in one model call, then cut the
+        result back into turns by counting alphanumeric characters.
+        """
+        counts = [len(_alignment_chars(t)) for t in texts]
+        joined = " ".join(t for t in texts if t)
+        if not joined:
+            return list(texts)
+        restored = self.punctuation_restore_model.restore_punctuation(joined)
+
+        out = []
+        pos = 0
+        for n in counts:
+            start = pos
+            seen = 0
+            while pos < len(restored) and seen < n:
+                if restored[pos].isalnum():
+                    seen += 1
+                pos += 1
+            # Trailing punctuation belongs to the turn it closes.
+            while pos < len(restored) and not restored[pos].isalnum():
+                pos += 1
+            out.append(restored[start:pos].strip())
+        return out
+
+    @contextmanager
+    def _stage(self, name: str):
+        """Accumulate wall time of an analysis stage and record the memory it used."""
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        sampler = _RSSSampler()
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak_rss_mb = sampler.stop()
+            self.stage_timings[name] = round(self.stage_timings.get(name, 0.0) + elapsed, 4)
+
+            memory = self.stage_memory.setdefault(
+                name, {"peak_rss_mb": 0.0, "rss_delta_mb": 0.0, "process_peak_rss_mb": 0.0}
+            )
+            # Sampled while the stage ran; delta is growth over the RSS it started at.
+            memory["peak_rss_mb"] = round(max(memory["peak_rss_mb"], peak_rss_mb), 1)
+            memory["rss_delta_mb"] = round(max(memory["rss_delta_mb"], peak_rss_mb - sampler.start_mb), 1)
+            # ru_maxrss is in KiB on Linux and only ever grows: the process high-water mark so far.
+            memory["process_peak_rss_mb"] = round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            )
+            if torch.cuda.is_available():
+                peak_gpu_mb = torch.cuda.max_memory_allocated() / 2**20
+                memory["peak_gpu_mb"] = round(max(memory.get("peak_gpu_mb", 0.0), peak_gpu_mb), 1)
+
+            logger.info(
+                "Stage %s: %.3fs, peak RSS %.0f MB (+%.0f MB)",
+                name, elapsed, peak_rss_mb, peak_rss_mb - sampler.start_mb,
+            )
+
+    def analyze(self, archive: bool = ARCHIVE_CALL_AUDIO, replace_existing: bool = False):
+        call_record_dir = os.path.join(self.calls_base_dir, f"{self.agent_id}", self.call_id)
+
+        try:
+            if replace_existing:
+                shutil.rmtree(call_record_dir, ignore_errors=True)
+
+            if not os.path.exists(call_record_dir):
+                os.makedirs(call_record_dir)
+            else:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Call record already exists: {call_record_dir}, Try with another call_id",
+                )
+
+            long_form = self._open_long_form()
+            if long_form is not None:
+                sr = ANALYSIS_SR
+                samples = long_form
+                audio_duration = long_form.duration
+                if archive:
+                    self._archive_copy(
+                        self.call_recording_path,
+                        os.path.join(call_record_dir, "complete_recording.wav"),
+                    )
+                speaker_turns, identified_speaker = self._diarize_long_form(long_form)
+            else:
+                with self._stage("decode"):
+                    waveform, sample_rate = self._load_call_audio()
+
+                with self._stage("denoise"):
+                    waveform = self._prepare_waveform(waveform, sample_rate, denoise=True)
+                    sr = ANALYSIS_SR
+                    audio_input = {"waveform": waveform, "sample_rate": sr}
+                    audio_duration = waveform.size(1) / sr
+                    samples = waveform[0].numpy()
+
+                if archive:
+                    self._archive_audio(
+                        os.path.join(call_record_dir, "complete_recording.wav"), waveform, sr
+                    )
+
+                with self._stage("diarization"):
+                    call_diarization, centroids = self._diarize(audio_input)
+                    speaker_turns = [
+                        (turn.start, turn.end, speaker)
+                        for turn, _, speaker in call_diarization.itertracks(yield_label=True)
+                    ]
+
+                with self._stage("embedding"):
+                    if not centroids:
+                        centroids = self._segment_centroids(call_diarization, waveform[0], sr)
+                    identified_speaker = self._identify_agent(
+                        centroids, self.reference_embedding(self.user_voice_sample)
+                    )
+
+            self.audio_duration = audio_duration
+
+            with self._stage("segment_assembly"):
+                turns = self._build_turns(speaker_turns, identified_speaker, audio_duration)
+
+            with self._stage("asr"):
+                transcripts = self._transcribe_turns(samples, sr, turns)
+
+            with self._stage("punctuation"):
+                restored_texts = self._restore_punctuation_per_turn(
+                    [text for text, _ in transcripts]
+                )
+
+                turn_inputs = []
+                for turn, (text, timed_units), restored in zip(turns, transcripts, restored_texts):
+                    if not text:
+                        continue
+                    logger.info("%s [%.2f-%.2f]: %s", turn["role"], turn["start"], turn["end"], text)
+                    sentences = sent_tokenize(restored)
+                    if not sentences:
+                        continue
+                    spans = self._align_sentences_to_spans(sentences, timed_units)
+                    spans = [span or (turn["start"], turn["end"]) for span in spans]
+                    turn_inputs.append((turn, sentences, spans))
+
+            with self._stage("audio_sentiment"):
+                audio_sents = iter(
+                    self._get_audio_sentiments(
+                        samples, sr, [span for _, _, spans in turn_inputs for span in spans]
+                    )
+                )
+
+            with self._stage("text_sentiment"):
+                text_sents = iter(
+                    self._get_text_sentiments(
+                        [sent for _, sentences, _ in turn_inputs for sent in sentences]
+                    )
+                )
+
+            with self._stage("aggregation"):
+                timeline = []
+                for turn, sentences, spans in turn_inputs:
+                    role_results = []
+                    for sent, span in zip(sentences, spans):
+                        text_sent = next(text_sents)
+                        audio_sent = next(audio_sents)
+                        final_sent, final_conf = self._fuse_sentiment(text_sent, audio_sent)
+
+                        role_results.append(
+                            {
+                                "sentence": sent,
+                                "sentiment": final_sent,
+                                "confidence": round(final_conf, 2),
+                                "start": round(span[0], 2),
+                                "end": round(span[1], 2),
+                            }
+                        )
+
+                    timeline.append(
+                        {
+                            turn["role"]: role_results,
+                            "start": round(turn["start"], 2),
+                            "end": round(turn["end"], 2),
+                        }
+                    )
+
+            return {"segments": timeline, "cx_sentiment_result": customer_sentiment_summary(timeline)}
+
+        except Exception as e:
+            logger.exception("Error in analyze(): %s", e)
+            if os.path.exists(call_record_dir):
+                shutil.rmtree(call_record_dir, ignore_errors=True)
+            raise
@@ -0,0 +1,177 @@
+import os
+import logging
+
+import torch
+import torchaudio
+
+from config import HF_TOKEN
+from transformers import (
+    pipeline,
+    AutoModelForAudioClassification,
+    AutoFeatureExtractor,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+TEXT_SENTIMENT_MODEL = "cardiffnlp/twitter-xlm-roberta-base-sentiment"
+AUDIO_SENTIMENT_MODEL = "superb/wav2vec2-base-superb-er"
+AUDIO_SENTIMENT_BATCH_SIZE = 8
+TEXT_SENTIMENT_BATCH_SIZE = int(os.getenv("TEXT_SENTIMENT_BATCH_SIZE", "32"))
+MIN_EMOTION_WINDOW_S = 0.5  # wav2vec2 needs some context, pad shorter spans
+
+
+class SentimentScorer:
+    """
+    Text and audio sentiment models shared by the post-call analyzer and the
+    live per-utterance stage. Models load once per process.
+    """
+
+    _text_sentiment_model = pipeline("sentiment-analysis", model=TEXT_SENTIMENT_MODEL)
+    _audio_sentiment_model = AutoModelForAudioClassification.from_pretrained(
+        AUDIO_SENTIMENT_MODEL, use_auth_token=HF_TOKEN
+    )
+    _audio_feature_extractor = AutoFeatureExtractor.from_pretrained(AUDIO_SENTIMENT_MODEL)
+
+    def __init__(self):
+        self.text_sentiment_model = SentimentScorer._text_sentiment_model
+        self.audio_sentiment_model = SentimentScorer._audio_sentiment_model
+        self.audio_feature_extractor = SentimentScorer._audio_feature_extractor
+
+        self.audio_sentiment_id2label = (
+            self.audio_sentiment_model.config.id2label
+            if hasattr(self.audio_sentiment_model.config, "id2label")
+            else {}
+        )
+
+    def _get_text_sentiment(self, text: str):
+        """Get sentiment from multilingual text model"""
+        return self._get_text_sentiments([text])[0]
+
+    def _get_text_sentiments(self, texts, batch_size: int = TEXT_SENTIMENT_BATCH_SIZE):
+        """
+        Get (label, score) for every text, in input order.
+
+        Texts are sorted by length before batching so each batch pads to a
+        similar size. A failing batch is logged and reported as neutral.
+        """
+        results = [("neutral", 0.0)] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+
+        for i in range(0, len(order), batch_size):
+            idxs = order[i : i + batch_size]
+            batch = [texts[j] for j in idxs]
+            try:
+                outputs = self.text_sentiment_model(
+                    batch, batch_size=len(batch), truncation=True
+                )
+            except Exception:
+                logger.exception("Text sentiment failed for a batch of %d texts", len(batch))
+                continue
+            for j, out in zip(idxs, outputs):
+                results[j] = (out["label"], out["score"])
+
+        return results
+
+    def _get_audio_sentiment(self, audio_array, sr):
+        """Get emotion from audio signal"""
+        return self._get_audio_sentiments(audio_array, sr, [None])[0]
+
+    def _get_audio_sentiments(self, audio_array, sr, spans, cache=None):
+        """
+        Get emotion for every (start, end) span (seconds) of `audio_array`.
+
+        Each distinct window is scored once, and all of them go through the
+        model in length-sorted batches. A span of None means the whole signal.
+        """
+        if sr != 16000:
+            audio_tensor = torch.tensor(audio_array).unsqueeze(0)
+            audio_array = (
+                torchaudio.functional.resample(audio_tensor, sr, 16000)
+                .squeeze(0)
+                .numpy()
+            )
+            sr = 16000
+
+        total = len(audio_array)
+        min_len = int(MIN_EMOTION_WINDOW_S * sr)
+        cache = {} if cache is None else cache
+
+        keys = []
+        for span in spans:
+            if span is None:
+                start, end = 0, total
+            else:
+                start = max(0, int(span[0] * sr))
+                end = min(total, int(span[1] * sr))
+            if end - start < min_len:
+                pad = (min_len - (end - start) + 1) // 2
+                start, end = max(0, start - pad), min(total, end + pad)
+            keys.append((start, end))
+
+        pending = sorted(
+            {k for k in keys if k not in cache and k[1] > k[0]},
+            key=lambda k: k[1] - k[0],
+        )
+        for i in range(0, len(pending), AUDIO_SENTIMENT_BATCH_SIZE):
+            batch = pending[i : i + AUDIO_SENTIMENT_BATCH_SIZE]
+            inputs = self.audio_feature_extractor(
+                [audio_array[s:e] for s, e in batch],
+                sampling_rate=sr,
+                padding=True,
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                logits = self.audio_sentiment_model(**inputs).logits
+            probs = torch.nn.functional.softmax(logits, dim=-1)
+            confs, pred_ids = torch.max(probs, dim=-1)
+            for key, conf, pred_id in zip(batch, confs.tolist(), pred_ids.tolist()):
+                label = self.audio_sentiment_id2label.get(pred_id, "neu")
+                cache[key] = (label, conf)
+
+        return [cache.get(k, ("neu", 0.0)) for k in keys]
+
+    def _fuse_sentiment(self, text_pred, audio_pred, w_text=0.7, w_audio=0.3):
+        """Fuse text + audio into final sentiment"""
+
+        sentiment_map = {
+            "ang": "negative",
+            "sad": "negative",
+            "hap": "positive",
+            "neu": "neutral",
+        }
+
+        text_label, text_conf = text_pred
+        audio_label, audio_conf = audio_pred
+
+        audio_sentiment = sentiment_map.get(audio_label.lower(), "neutral")
+
+        scores = {"positive": 0, "negative": 0, "neutral": 0}
+        scores[text_label.lower()] += text_conf * w_text
+        scores[audio_sentiment] += audio_conf * w_audio
+
+        final_sent = max(scores, key=scores.get)
+        return final_sent, scores[final_sent]
+
+
+def customer_sentiment_summary(timeline):
+    """Share of customer sentences per sentiment, as the percentage strings stored with a call."""
+    sentiment_counts = {"positive": 0, "negative": 0, "neutral": 0}
+    total_sentences = 0
+    for segment in timeline:
+        if "customer" in segment:
+            for utt in segment["customer"]:
+                sentiment = utt["sentiment"]
+                if sentiment in sentiment_counts:
+                    sentiment_counts[sentiment] += 1
+                total_sentences += 1
+
+    return {
+        k: (
+            f"{round((v / total_sentences) * 100, 2)}%"
+            if total_sentences > 0
+            else "0%"
+        )
+        for k, v in sentiment_counts.items()
+    }
@@ -0,0 +1,176 @@
+import os
+import time
+import base64
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+SESSION_INPUT_QUEUE_SIZE = int(os.getenv("SESSION_INPUT_QUEUE_SIZE", "50"))
+SILENT_FRAME_LEVEL = 1e-3  # mean |x| below this can't hold speech worth transcribing
+LAG_EWMA_ALPHA = 0.2
+
+
+def _now_ms() -> float:
+    return time.perf_counter() * 1000
+
+
+class SessionInputActor:
+    """
+    Per-session input side of /ws/client.
+
+    The socket reader only decodes frames and calls `submit`; a separate task
+    feeds them to `process` one at a time, so slow ASR never stops the socket
+    from being read. When the session falls behind, queued silent frames are
+    merged into a single empty frame carrying how many frames it stands for
+    (`empty_chunk_repeat`), and the oldest of them are dropped if the queue is
+    full. Frames that may hold speech are never dropped: the reader waits.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        process: Callable[[dict], Awaitable[Any]],
+        on_error: Optional[Callable[[Exception], Awaitable[None]]] = None,
+        maxsize: int = SESSION_INPUT_QUEUE_SIZE,
+    ):
+        self.session_id = session_id
+        self.process = process
+        self.on_error = on_error
+        self.maxsize = maxsize
+
+        self._frames: deque = deque()
+        self._has_frames = asyncio.Event()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+
+        self.received = 0
+        self.processed = 0
+        self.merged = 0
+        self.dropped = 0
+        self.lag_ms = 0.0
+        self.lag_ewma_ms = 0.0
+        self.max_lag_ms = 0.0
+
+        self._task = asyncio.create_task(self._run())
+
+    @staticmethod
+    def decode(args: dict) -> dict:
+        """Decode the base64 PCM16 chunk once, in the reader, and tag silent frames."""
+        chunk_b64 = args.get("current_audio_chunk", "")
+        frame = dict(args, received_ms=_now_ms(), silent=True)
+        if not str(chunk_b64).strip():
+            return frame
+        try:
+            with metrics.timed("realtime", "decode"):
+                pcm = np.frombuffer(base64.b64decode(chunk_b64), dtype=np.int16).astype(np.float32) / 32768.0
+        except Exception:
+            # Let processing report the bad chunk as before.
+            frame["silent"] = False
+            return frame
+        frame["current_audio_pcm"] = pcm
+        frame["silent"] = pcm.size == 0 or float(np.mean(np.abs(pcm))) < SILENT_FRAME_LEVEL
+        return frame
+
+    @staticmethod
+    def _as_empty(frame: dict, repeat: int) -> dict:
+        empty = {k: v for k, v in frame.items() if k != "current_audio_pcm"}
+        empty["current_audio_chunk"] = ""
+        empty["empty_chunk_repeat"] = repeat
+        return empty
+
+    def _merge_silence(self, frame: dict) -> bool:
+        """Fold a silent frame into a silent frame already waiting at the tail."""
+        if not frame["silent"] or not self._frames or not self._frames[-1]["silent"]:
+            return False
+        tail = self._frames[-1]
+        repeat = tail.get("empty_chunk_repeat", 1) + frame.get("empty_chunk_repeat", 1)
+        merged = self._as_empty(tail, repeat)
+        merged["received_ms"] = tail["received_ms"]
+        self._frames[-1] = merged
+        self.merged += 1
+        return True
+
+    def _drop_oldest_silence(self) -> bool:
+        for i, queued in enumerate(self._frames):
+            if queued["silent"]:
+                del self._frames[i]
+                self.dropped += 1
+                return True
+        return False
+
+    async def submit(self, args: dict):
+        frame = self.decode(args)
+        self.received += 1
+
+        if self._merge_silence(frame):
+            return
+
+        while len(self._frames) >= self.maxsize:
+            if self._drop_oldest_silence():
+                break
+            if frame["silent"]:
+                self.dropped += 1
+                return
+            self._has_room.clear()
+            await self._has_room.wait()
+
+        self._frames.append(frame)
+        self._has_frames.set()
+
+    async def _run(self):
+        while True:
+            if not self._frames:
+                self._has_frames.clear()
+                await self._has_frames.wait()
+                continue
+
+            frame = self._frames.popleft()
+            self._has_room.set()
+
+            self.lag_ms = _now_ms() - frame.pop("received_ms")
+            self.lag_ewma_ms += LAG_EWMA_ALPHA * (self.lag_ms - self.lag_ewma_ms)
+            self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+            frame.pop("silent", None)
+
+            try:
+                result = await self.process(frame)
+                logger.debug("Processing result for %s: %s", self.session_id, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Customer audio processing error: {e}")
+                if self.on_error:
+                    await self.on_error(e)
+            self.processed += 1
+
+    def close(self):
+        self._task.cancel()
+        self._frames.clear()
+        self._has_room.set()
+
+    def current_lag_ms(self) -> float:
+        """Age of the oldest frame still waiting, or the lag of the last one processed."""
+        if self._frames:
+            return max(self.lag_ms, _now_ms() - self._frames[0]["received_ms"])
+        return self.lag_ms
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": len(self._frames),
+            "lag_ms": round(self.current_lag_ms(), 1),
+            "lag_ewma_ms": round(self.lag_ewma_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "received": self.received,
+            "processed": self.processed,
+            "merged": self.merged,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,127 @@
+import os
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import torch
+
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_path(wav_path: str) -> str:
+    return os.path.splitext(wav_path)[0] + ".emb.npz"
+
+
+def xtts_latents_path(wav_path: str) -> str:
+    return os.path.splitext(wav_path)[0] + ".xtts.pt"
+
+
+class AgentVoiceEmbeddings:
+    """
+    Reference speaker embeddings of registered agents.
+
+    Embeddings are stored next to the agent's voice WAV with the model version
+    that produced them, and kept in a process-wide cache. They are only
+    recomputed when the stored version differs from the current model, or
+    the voice sample is newer than the stored embedding.
+    """
+
+    # (wav_path, model_version) -> (wav mtime, embedding)
+    _cache: Dict[Tuple[str, str], Tuple[float, np.ndarray]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def save(cls, wav_path: str, embedding: np.ndarray, model_version: str):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        np.savez(embedding_path(wav_path), embedding=embedding, model_version=model_version)
+        return embedding
+
+    @classmethod
+    def load(cls, wav_path: str, model_version: str) -> Optional[np.ndarray]:
+        path = embedding_path(wav_path)
+        if not os.path.exists(path):
+            return None
+        if os.path.getmtime(path) < os.path.getmtime(wav_path):
+            logger.info("Stored embedding for %s predates the voice sample, recomputing", wav_path)
+            return None
+        try:
+            with np.load(path) as stored:
+                if str(stored["model_version"]) != model_version:
+                    logger.info("Stored embedding for %s is from another model, recomputing", wav_path)
+                    return None
+                return stored["embedding"]
+        except Exception:
+            logger.exception("Unreadable embedding file %s", path)
+            return None
+
+    @classmethod
+    def get(
+        cls,
+        wav_path: str,
+        model_version: str,
+        embed_fn: Callable[[str], np.ndarray],
+    ) -> np.ndarray:
+        key = (wav_path, model_version)
+        # The sample's mtime is part of the entry, so worker processes drop a
+        # re-registered voice's old embedding without being told.
+        mtime = os.path.getmtime(wav_path)
+        with cls._lock:
+            cached = cls._cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        embedding = cls.load(wav_path, model_version)
+        if embedding is None:
+            embedding = cls.save(wav_path, embed_fn(wav_path), model_version)
+
+        with cls._lock:
+            cls._cache[key] = (mtime, embedding)
+        return embedding
+
+    @classmethod
+    def invalidate(cls, wav_path: str):
+        """Forget the cached and stored embedding of a voice sample that is being replaced or removed."""
+        with cls._lock:
+            for key in [k for k in cls._cache if k[0] == wav_path]:
+                del cls._cache[key]
+        try:
+            os.remove(embedding_path(wav_path))
+        except FileNotFoundError:
+            pass
+
+
+def save_xtts_latents(tts_model, wav_path: str, model_version: str):
+    """Compute XTTS conditioning latents for a voice once and store them next to the WAV."""
+    gpt_cond_latent, speaker_embedding = tts_model.synthesizer.tts_model.get_conditioning_latents(
+        audio_path=[wav_path]
+    )
+    torch.save(
+        {
+            "model_version": model_version,
+            "gpt_cond_latent": gpt_cond_latent.cpu(),
+            "speaker_embedding": speaker_embedding.cpu(),
+        },
+        xtts_latents_path(wav_path),
+    )
+    return gpt_cond_latent, speaker_embedding
+
+
+def load_xtts_latents(wav_path: str, model_version: str):
+    path = xtts_latents_path(wav_path)
+    if not os.path.exists(path):
+        return None
+    stored = torch.load(path, map_location="cpu")
+    if stored.get("model_version") != model_version or os.path.getmtime(path) < os.path.getmtime(wav_path):
+        return None
+    return stored["gpt_cond_latent"], stored["speaker_embedding"]
+
+
+def get_xtts_latents(tts_model, wav_path: str, model_version: str, device=None):
+    """Stored XTTS latents for a voice, computed and stored on first use, on `device`."""
+    latents = load_xtts_latents(wav_path, model_version)
+    if latents is None:
+        logger.info("Computing XTTS conditioning latents for %s", wav_path)
+        latents = save_xtts_latents(tts_model, wav_path, model_version)
+    return tuple(latent.to(device) for latent in latents) if device is not None else latents
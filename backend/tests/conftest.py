@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests import backend modules the way the app does, from the backend folder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config builds its engines at import; tests that need a database make their own.
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("APP_SECRET_KEY", "test-secret")
@@ -0,0 +1,107 @@
+"""
+Memory ceiling of the long-form (memory-mapped, windowed) analysis path.
+
+A multi-hour synthetic call is written to disk and analysed with the
+benchmark's stub models, in a fresh interpreter so the process high-water
+mark belongs to this run alone. Holding the recording in memory at the
+analysis rate would take ~660 MB; the windowed path must stay well below.
+"""
+
+import os
+import sys
+import json
+import wave
+import resource
+import subprocess
+
+import numpy as np
+
+
+HOURS = 3
+SOURCE_SR = 8000  # telephony rate, so reads also go through the resampler
+MEMORY_CEILING_MB = 300  # RSS growth allowed over a warmed-up analyzer
+
+
+def _write_long_call(path: str, hours: float, sr: int):
+    """Repeats one five-minute synthetic call, one block at a time, to avoid holding the file."""
+    from benchmarks.analysis_bench import synth_call
+
+    block, _ = synth_call(np.random.default_rng(0), 300.0, sr)
+    pcm16 = (np.clip(block, -1.0, 1.0) * 32767.0).astype(np.int16).tobytes()
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        for _ in range(int(hours * 3600 / 300)):
+            f.writeframes(pcm16)
+
+
+def _measure(wav_path: str, work_dir: str) -> dict:
+    """Runs in the child interpreter."""
+    from benchmarks.analysis_bench import install_stub_models, build_corpus
+
+    install_stub_models()
+    # Non-stationary noise reduction over hours of audio would dominate the
+    # runtime; it only works on one window at a time either way.
+    import noisereduce
+    noisereduce.reduce_noise = lambda y, sr, **kwargs: y
+
+    import sentiment_analyzer
+    from sentiment_analyzer import SentimentAnalyzer
+
+    agent_voice, warmup = build_corpus(os.path.join(work_dir, "corpus"), [0.5], 1, 16000, seed=0)
+
+    def analyze(call_id, path):
+        analyzer = SentimentAnalyzer(
+            calls_base_dir=os.path.join(work_dir, "calls"),
+            agents_audios=os.path.join(work_dir, "agents"),
+            agent_id="test",
+            call_id=call_id,
+            user_voice_sample_path=agent_voice,
+            call_recording_path=path,
+        )
+        analysis = analyzer.analyze(archive=False, replace_existing=True)
+        return analyzer, analysis
+
+    # Lazy first-call allocations (tokenizer, mel filters, punkt) aren't part of the ceiling.
+    analyze("warmup", warmup[0][1])
+    before_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    analyzer, analysis = analyze("long", wav_path)
+    return {
+        "long_form": analyzer.audio_duration >= sentiment_analyzer.LONG_FORM_THRESHOLD_S,
+        "audio_s": analyzer.audio_duration,
+        "segments": len(analysis["segments"]),
+        "before_mb": before_mb,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def test_long_form_peak_rss_stays_under_ceiling(tmp_path):
+    wav_path = str(tmp_path / "long_call.wav")
+    _write_long_call(wav_path, HOURS, SOURCE_SR)
+
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), wav_path, str(tmp_path)],
+        cwd=backend,
+        env={**os.environ, "PYTHONPATH": backend},
+        capture_output=True,
+        text=True,
+        timeout=1800,
+    )
+    assert child.returncode == 0, child.stderr[-4000:]
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+
+    assert result["long_form"]
+    assert result["audio_s"] >= HOURS * 3600 - 1
+    assert result["segments"] > 0
+    growth_mb = result["peak_mb"] - result["before_mb"]
+    assert growth_mb < MEMORY_CEILING_MB, (
+        f"long-form analysis grew RSS by {growth_mb:.0f} MB (ceiling {MEMORY_CEILING_MB} MB)"
+    )
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    print(json.dumps(_measure(sys.argv[1], sys.argv[2])))
@@ -0,0 +1,167 @@
+"""
+The AsyncSession query layer against a local SQLite stand-in (aiosqlite).
+
+Each test builds the app's tables in a fresh database file and runs the
+queries the way the API does, on its own event loop.
+"""
+
+import json
+import asyncio
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from passlib.hash import sha256_crypt
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import Base
+from models import User, ActiveUsers, CallAnalysis
+from database.queries import signin, verify_bearer_token, save_call_analysis, purge_expired_sessions
+from utils import security
+from utils.hashing import hashing_executor
+
+
+PASSWORD = "correct horse battery"
+
+
+def run_with_db(tmp_path, scenario):
+    """Run `scenario(session_factory)` on a fresh aiosqlite database."""
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            await scenario(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+        finally:
+            # Its semaphore belongs to this event loop; the next test starts a new one.
+            hashing_executor.shutdown()
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+async def add_user(db, username: str, verified: bool = True, role: str = "agent") -> User:
+    user = User(
+        first_name="Test",
+        last_name=username,
+        username=username,
+        email=f"{username}@example.test",
+        password_hash=sha256_crypt.hash(PASSWORD),
+        role=role,
+        is_verified=verified,
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def add_session(db, user: User, expires_in: timedelta) -> str:
+    # Only the digest is looked up; JWTs issued within the same second would collide.
+    token = secrets.token_urlsafe(32)
+    db.add(ActiveUsers(
+        user_id=user.id,
+        username=user.username,
+        role=user.role,
+        bearer_token=security.token_digest(token),
+        bearer_expiry_time=datetime.now(timezone.utc) + expires_in,
+    ))
+    await db.commit()
+    return token
+
+
+def test_signin_session_is_found_by_token_lookup(tmp_path):
+    async def scenario(Session):
+        async with Session() as db:
+            user = await add_user(db, "alice")
+
+        async with Session() as db:
+            response = await signin(db, "alice@example.test", PASSWORD)
+        assert "error" not in response, response
+
+        async with Session() as db:
+            session = await verify_bearer_token(db, response["token"])
+        assert session["user_id"] == user.id
+        assert session["username"] == "alice"
+        assert session["role"] == "agent"
+        # SQLite returns naive datetimes; the lookup hands back an aware UTC expiry.
+        assert session["bearer_expiry_time"].tzinfo is not None
+        assert session["bearer_expiry_time"] > datetime.now(timezone.utc) + timedelta(days=29)
+
+    run_with_db(tmp_path, scenario)
+
+
+def test_signin_rejects_bad_password_and_unverified_users(tmp_path):
+    async def scenario(Session):
+        async with Session() as db:
+            await add_user(db, "bob")
+            await add_user(db, "carol", verified=False)
+
+        async with Session() as db:
+            assert "error" in await signin(db, "bob", "wrong password")
+            assert "error" in await signin(db, "carol", PASSWORD)
+            assert "error" in await signin(db, "nobody", PASSWORD)
+            sessions = await db.scalar(select(func.count()).select_from(ActiveUsers))
+        assert sessions == 0
+
+    run_with_db(tmp_path, scenario)
+
+
+def test_token_lookup_rejects_unknown_and_expired_tokens(tmp_path):
+    async def scenario(Session):
+        async with Session() as db:
+            user = await add_user(db, "dave")
+            expired = await add_session(db, user, timedelta(minutes=-1))
+
+        async with Session() as db:
+            assert await verify_bearer_token(db, expired) == {"error": "Token expired."}
+            assert await verify_bearer_token(db, "not-a-token") == {"error": "Invalid or expired token."}
+
+    run_with_db(tmp_path, scenario)
+
+
+def test_save_call_analysis_persists_dialogs_and_sentiment(tmp_path):
+    analysis = {
+        "segments": [
+            {"agent": [{"sentence": "How can I help?", "sentiment": "neutral"}], "start": 0.0, "end": 1.5},
+            {"customer": [{"sentence": "My order is late.", "sentiment": "negative"}], "start": 2.0, "end": 3.4},
+        ],
+        "cx_sentiment_result": {"positive": "10.0%", "negative": "60.0%", "neutral": "30.0%"},
+    }
+
+    async def scenario(Session):
+        async with Session() as db:
+            user = await add_user(db, "erin")
+            saved = await save_call_analysis(db, user.id, "call-1", analysis)
+        assert saved.id is not None
+
+        async with Session() as db:
+            row = (await db.execute(select(CallAnalysis).where(CallAnalysis.id == saved.id))).scalar_one()
+        assert row.user_id == user.id
+        assert row.call_id == "call-1"
+        assert json.loads(row.agent_dialogs) == analysis["segments"][0]["agent"]
+        assert json.loads(row.customer_dialogs) == analysis["segments"][1]["customer"]
+        assert row.cx_negative_percentage == 60.0
+        assert row.overall_call_sentiment == "negative"
+
+    run_with_db(tmp_path, scenario)
+
+
+def test_purge_expired_sessions_deletes_only_expired_rows_in_batches(tmp_path):
+    async def scenario(Session):
+        async with Session() as db:
+            user = await add_user(db, "frank")
+            for _ in range(7):
+                await add_session(db, user, timedelta(hours=-1))
+            live = [await add_session(db, user, timedelta(hours=1)) for _ in range(3)]
+
+        async with Session() as db:
+            # Smaller than the number of expired rows, so the loop takes several batches.
+            assert await purge_expired_sessions(db, batch_size=3) == 7
+
+        async with Session() as db:
+            remaining = (await db.execute(select(ActiveUsers.bearer_token))).scalars().all()
+            assert sorted(remaining) == sorted(security.token_digest(t) for t in live)
+            assert await purge_expired_sessions(db, batch_size=3) == 0
+
+    run_with_db(tmp_path, scenario)
@@ -0,0 +1,248 @@
+import os
+import glob
+import json
+import time
+import secrets
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+TURN_TRACE_ENABLED = os.getenv("TURN_TRACE_ENABLED", "1") == "1"
+TURN_TRACE_PATH = os.getenv("TURN_TRACE_PATH", os.path.join("traces", "turns.jsonl"))
+TURN_TRACE_MAX_BYTES = int(os.getenv("TURN_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TURN_TRACE_BACKUPS = int(os.getenv("TURN_TRACE_BACKUPS", "5"))
+SERVICE_NAME = "sound360-voice"
+
+# Spans are timed on the monotonic clock (like voice_processor._now_ms) and
+# shifted to unix time only when written.
+_MONO_TO_UNIX_NS = time.time_ns() - time.monotonic_ns()
+
+current_turn: ContextVar[Optional["Turn"]] = ContextVar("current_turn", default=None)
+
+
+def _now_ms() -> float:
+    return time.monotonic() * 1000.0
+
+
+def _unix_nano(mono_ms: float) -> str:
+    return str(int(mono_ms * 1_000_000) + _MONO_TO_UNIX_NS)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _plain_value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+class Turn:
+    """
+    One user turn of a /ws/client session: from the last speech frame to the
+    first reply frame written to the socket. Child spans are added with
+    `span()` while the turn is the `current_turn` of the running task.
+    """
+
+    def __init__(self, session_id: str, user_id: Any, speech_end_ms: float):
+        self.trace_id = secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.start_ms = speech_end_ms
+        self.attributes = {"service.name": SERVICE_NAME, "session.id": session_id, "user.id": str(user_id)}
+        self.spans: List[Dict[str, Any]] = []
+
+        # First reply frame: started when the processor hands it over, claimed by
+        # the connection that queues it, and ended once it is on the socket.
+        self.frame_started_ms: Optional[float] = None
+        self.frame_claimed = False
+        self.frame_done = False
+        self._deferred_error: Optional[str] = None
+        self._finish_deferred = False
+
+    def begin_frame(self):
+        self.frame_started_ms = _now_ms()
+
+    def claim_frame(self) -> bool:
+        """True for the one sender that will report when the first reply frame is written."""
+        if self.frame_started_ms is None or self.frame_claimed:
+            return False
+        self.frame_claimed = True
+        return True
+
+    def add_span(self, name: str, start_ms: float, end_ms: float, error: Optional[str] = None, **attributes):
+        self.spans.append({
+            "traceId": self.trace_id,
+            "spanId": secrets.token_hex(8),
+            "parentSpanId": self.span_id,
+            "name": name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": _unix_nano(start_ms),
+            "endTimeUnixNano": _unix_nano(end_ms),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": error} if error else {"code": "STATUS_CODE_OK"},
+        })
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        started = _now_ms()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__ if not str(e) else f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.add_span(name, started, _now_ms(), error=error, **attributes)
+
+    def root(self, end_ms: float, error: Optional[str]) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": "turn",
+            "kind": "SPAN_KIND_SERVER",
+            "startTimeUnixNano": _unix_nano(self.start_ms),
+            "endTimeUnixNano": _unix_nano(end_ms),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": error} if error else {"code": "STATUS_CODE_OK"},
+        }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Record a child span of the current turn, if the calling task has one."""
+    turn = current_turn.get()
+    if turn is None:
+        yield
+        return
+    with turn.span(name, **attributes):
+        yield
+
+
+class TurnTracer:
+    """Writes finished turns as OTLP-style JSON spans, one per line, to a rotating file."""
+
+    def __init__(
+        self,
+        path: str = TURN_TRACE_PATH,
+        max_bytes: int = TURN_TRACE_MAX_BYTES,
+        backups: int = TURN_TRACE_BACKUPS,
+        enabled: bool = TURN_TRACE_ENABLED,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.enabled = enabled
+        self._writer: Optional[logging.Logger] = None
+        self.turns_written = 0
+
+    def _get_writer(self) -> logging.Logger:
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backups)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            writer = logging.getLogger(f"{__name__}.spans")
+            writer.handlers = [handler]
+            writer.setLevel(logging.INFO)
+            writer.propagate = False
+            self._writer = writer
+        return self._writer
+
+    def start_turn(self, session_id: str, user_id: Any, speech_end_ms: float) -> Turn:
+        return Turn(session_id, user_id, speech_end_ms)
+
+    def frame_sent(self, turn: Turn, error: Optional[str] = None, **attributes):
+        """Called by the sender that claimed the turn's first frame, after the socket write."""
+        if turn.frame_done:
+            return
+        turn.frame_done = True
+        turn.add_span("first_frame_sent", turn.frame_started_ms, _now_ms(), error=error, **attributes)
+        if turn._finish_deferred:
+            self._write(turn, turn._deferred_error)
+
+    def finish(self, turn: Turn, error: Optional[str] = None, **attributes):
+        turn.attributes.update(attributes)
+        if turn.frame_claimed and not turn.frame_done:
+            # The turn ends when its first frame reaches the socket; frame_sent writes it.
+            turn._finish_deferred = True
+            turn._deferred_error = error
+            return
+        self._write(turn, error)
+
+    def _write(self, turn: Turn, error: Optional[str]):
+        if not self.enabled:
+            return
+        end_ms = _now_ms()
+        try:
+            writer = self._get_writer()
+            for record in [turn.root(end_ms, error)] + turn.spans:
+                writer.info(json.dumps(record, ensure_ascii=False))
+            self.turns_written += 1
+        except Exception as e:
+            logger.warning("Failed to write turn trace %s: %s", turn.trace_id, e)
+
+    def _read_spans(self) -> Dict[str, List[Dict[str, Any]]]:
+        traces: Dict[str, List[Dict[str, Any]]] = {}
+        for path in sorted(glob.glob(self.path + "*")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        traces.setdefault(record["traceId"], []).append(record)
+            except OSError:
+                continue
+        return traces
+
+    def slowest(self, limit: int = 20, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """The `limit` slowest turns on record, each with its span breakdown."""
+        turns = []
+        for spans in self._read_spans().values():
+            root = next((s for s in spans if "parentSpanId" not in s), None)
+            if root is None:
+                continue
+            attributes = {a["key"]: _plain_value(a["value"]) for a in root["attributes"]}
+            if session_id and attributes.get("session.id") != session_id:
+                continue
+            start = int(root["startTimeUnixNano"])
+            children = sorted(
+                (s for s in spans if s is not root), key=lambda s: int(s["startTimeUnixNano"])
+            )
+            turns.append({
+                "trace_id": root["traceId"],
+                "start_unix_ms": start // 1_000_000,
+                "duration_ms": round((int(root["endTimeUnixNano"]) - start) / 1e6, 1),
+                "status": root["status"],
+                "attributes": attributes,
+                "spans": [
+                    {
+                        "name": s["name"],
+                        "offset_ms": round((int(s["startTimeUnixNano"]) - start) / 1e6, 1),
+                        "duration_ms": round(
+                            (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6, 1
+                        ),
+                        "status": s["status"]["code"],
+                        "attributes": {a["key"]: _plain_value(a["value"]) for a in s["attributes"]},
+                    }
+                    for s in children
+                ],
+            })
+        turns.sort(key=lambda t: t["duration_ms"], reverse=True)
+        return turns[:limit]
+
+
+turn_tracer = TurnTracer()
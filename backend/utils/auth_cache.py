@@ -0,0 +1,96 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Any, Callable, Optional
+
+
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TTLCache:
+    """Small thread-safe LRU with a per-entry deadline."""
+
+    def __init__(self, ttl_s: float = AUTH_CACHE_TTL_S, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl_s: Optional[float] = None):
+        ttl_s = self.ttl_s if ttl_s is None else min(ttl_s, self.ttl_s)
+        if ttl_s <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pop_where(self, predicate: Callable[[Any, Any], bool]):
+        with self._lock:
+            for key in [k for k, (_, v) in self._entries.items() if predicate(k, v)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {"entries": size, "hits": self.hits, "misses": self.misses}
+
+
+# bearer token -> (jwt payload, active session info). Entries never outlive
+# the session's own expiry.
+token_cache = TTLCache()
+
+# username -> read-only snapshot of the users row.
+user_cache = TTLCache()
+
+
+def user_snapshot(user) -> SimpleNamespace:
+    """Detached copy of a User row that is safe to share across requests."""
+    return SimpleNamespace(
+        **{c.name: getattr(user, c.name) for c in user.__table__.columns if c.name != "password_hash"}
+    )
+
+
+def invalidate_user(user_id: Optional[int] = None, username: Optional[str] = None):
+    """
+    Forget everything cached for a user: their row and every token issued to
+    them. Call after any write that changes who the user is or what they may do.
+
+    The caches are per process; with several workers, other processes pick up
+    the change when their entries expire (AUTH_CACHE_TTL_S).
+    """
+    if username is not None:
+        user_cache.pop(username)
+    token_cache.pop_where(
+        lambda _, v: (user_id is not None and v[1]["user_id"] == user_id)
+        or (username is not None and v[1]["username"] == username)
+    )
+    if user_id is not None:
+        user_cache.pop_where(lambda _, v: v.id == user_id)
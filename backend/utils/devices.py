@@ -0,0 +1,41 @@
+import logging
+
+import torch
+
+
+def safe_pick_device(model_class, model_name: str, *args, **kwargs):
+    """
+    Try GPUs one by one. Fall back to CPU.
+    Always pass a torch.device to .to(...).
+    """
+    n_gpus = torch.cuda.device_count()
+
+    for gpu_id in range(n_gpus):
+        device = torch.device(f"cuda:{gpu_id}")
+        try:
+            logging.info(f"Trying to load {model_name} on {device} ...")
+            model = model_class(*args, **kwargs)
+
+            if hasattr(model, "to"):
+                try:
+                    model = model.to(device)                 
+                except TypeError:
+                    model = model.to(str(device))            
+
+            logging.info(f"Loaded {model_name} on {device}")
+            return model, device
+        except RuntimeError as e:
+            if "out of memory" in str(e).lower():
+                logging.warning(f"OOM on {device}")
+                continue
+            raise
+
+    logging.info(f"All GPUs failed. Loading {model_name} on CPU.")
+    device = torch.device("cpu")
+    model = model_class(*args, **kwargs)
+    if hasattr(model, "to"):
+        try:
+            model = model.to(device)
+        except TypeError:
+            model = model.to("cpu")
+    return model, device
@@ -0,0 +1,113 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.hash import sha256_crypt
+
+
+logger = logging.getLogger(__name__)
+
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Hash operations allowed in flight; the rest wait on the event loop, not in the pool.
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", str(HASH_WORKERS * 2)))
+
+
+def _hash(password: str) -> str:
+    return sha256_crypt.hash(password)
+
+
+def _verify(password: str, password_hash: str) -> bool:
+    return sha256_crypt.verify(password, password_hash)
+
+
+class HashingExecutor:
+    """
+    Runs sha256_crypt off the event loop on a small process pool.
+
+    The pool starts lazily on first use so processes that never hash a
+    password (analysis workers, CLIs) don't pay for it.
+    """
+
+    def __init__(self, max_workers: int = HASH_WORKERS, max_concurrency: int = HASH_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self._wait_s_total = 0.0
+        self._run_s_total = 0.0
+        self.max_wait_s = 0.0
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            logger.info("Password hashing pool started with %d workers", self.max_workers)
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    async def _run(self, fn, *args):
+        self._ensure_started()
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        started = time.perf_counter()
+        wait_s = started - queued_at
+        self._wait_s_total += wait_s
+        self.max_wait_s = max(self.max_wait_s, wait_s)
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._run_s_total += time.perf_counter() - started
+            self._slots.release()
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run(_verify, password, password_hash)
+
+    def metrics(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "mean_wait_ms": round(self._wait_s_total / done * 1000, 2) if done else 0.0,
+            "max_wait_ms": round(self.max_wait_s * 1000, 2),
+            "mean_hash_ms": round(self._run_s_total / done * 1000, 2) if done else 0.0,
+        }
+
+
+hashing_executor = HashingExecutor()
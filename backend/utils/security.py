@@ -1,5 +1,5 @@
-from passlib.hash import sha256_crypt
 import jwt
+import hashlib
 from datetime import datetime, timedelta, timezone
 from config import SECRET_KEY, PERMISSIONS
 import random
@@ -8,11 +8,12 @@ import json
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 import logging
+from utils.hashing import hashing_executor
 
 logger = logging.getLogger(__name__)
 
 async def hash_password(password: str) -> str:
-    return sha256_crypt.hash(password)
+    return await hashing_executor.hash(password)
 
 
 async def generate_temp_password(length: int = 12) -> str:
@@ -21,7 +22,7 @@ async def generate_temp_password(length: int = 12) -> str:
 
 
 async def verify_password(password: str, password_hash: str) -> bool:
-    return sha256_crypt.verify(password, password_hash)
+    return await hashing_executor.verify(password, password_hash)
 
 
 async def create_jwt(user_id, username, role, expires_in_hrs=12, SECRET_KEY=SECRET_KEY, ALGORITHM="HS256"):
@@ -35,9 +36,14 @@ async def create_jwt(user_id, username, role, expires_in_hrs=12, SECRET_KEY=SECR
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def decode_token(token: str) -> dict:
+def token_digest(token: str) -> str:
+    """Fixed-length key stored in active_users.bearer_token instead of the token itself."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def decode_token(token: str, SECRET_KEY=SECRET_KEY, ALGORITHM="HS256") -> dict:
     try:
-        payload = jwt.decode(token, options={"verify_signature": False})
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
 
     except jwt.ExpiredSignatureError:
@@ -76,5 +76,3 @@ class UserVoiceProcessing:
         except Exception as e:
             logger.exception("Failed to save audio")
             raise HTTPException(status_code=500, detail=f"Could not save audio file: {str(e)}")
-
-
@@ -1,15 +1,39 @@
 # whisper_manager.py
+import os
+import threading
+
 import whisper
 import torch
 
 
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+WHISPER_SIZES = ("tiny", "base", "small", "medium", "large")
+
+
+def smaller_whisper(model_size: str) -> str:
+    """The next size down ("large-v3" -> "medium", "small.en" -> "base.en"); tiny stays tiny."""
+    english = model_size.endswith(".en")
+    family = model_size.split(".")[0].split("-")[0]
+    if family not in WHISPER_SIZES:
+        return "base.en" if english else "base"
+    smaller = WHISPER_SIZES[max(WHISPER_SIZES.index(family) - 1, 0)]
+    return f"{smaller}.en" if english else smaller
+
+
 class WhisperManager:
-    _model = None
+    # One model per size, so the quality ladder can switch sizes without reloading.
+    _models = {}
+    _lock = threading.Lock()
 
     @classmethod
     def get_model(cls, model_size="small", device=None):
-        if cls._model is None:
-            device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-            print(f"Loading Whisper model {model_size} on {device}")
-            cls._model = whisper.load_model(model_size, device=device)
-        return cls._model
+        with cls._lock:
+            if model_size not in cls._models:
+                device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+                print(f"Loading Whisper model {model_size} on {device}")
+                cls._models[model_size] = whisper.load_model(model_size, device=device)
+            return cls._models[model_size]
+
+    @classmethod
+    def is_loaded(cls, model_size) -> bool:
+        return model_size in cls._models